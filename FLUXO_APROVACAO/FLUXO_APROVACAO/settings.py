@@ -17,6 +17,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 ABACATEPAY_API_KEY = os.getenv('ABACATEPAY_API_KEY')
+ABACATEPAY_BASE_URL = os.getenv('ABACATEPAY_BASE_URL', 'https://api.abacatepay.com/v1')
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,11 +53,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # primeiro, para a latência medida incluir os outros middlewares
+    'SISTEMA.instrumentacao.InstrumentacaoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'SISTEMA.middleware.PlanoMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,31 +69,88 @@ ROOT_URLCONF = 'FLUXO_APROVACAO.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # o backend do Django, com o tempo de render medido (SISTEMA/instrumentacao.py)
+        'BACKEND': 'SISTEMA.instrumentacao.DjangoTemplatesMedidos',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # templates compilados uma vez por processo; com DEBUG, o autoreload
+            # do Django limpa este cache quando um template muda no disco
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'FLUXO_APROVACAO.wsgi.application'
 
+# Definido por asgi.py: troca checkout e webhook pelas versões async (SISTEMA/urls.py)
+VIEWS_ASSINCRONAS = os.getenv('FLUXO_ASGI') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgres usa PostgreSQL com pool de conexões (requer "psycopg[binary,pool]").
+# Sem ele, SQLite: cada escrita espera o lock (busy timeout) em vez de falhar com
+# "database is locked". DB_SQLITE_WAL=1 liga o modo WAL (leitores não bloqueiam o
+# escritor); fica desligado por padrão porque o journal_mode é gravado no próprio
+# arquivo e o WAL deixa os arquivos db.sqlite3-wal/-shm ao lado dele.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+DB_SQLITE_WAL = os.getenv('DB_SQLITE_WAL') == '1'
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'fluxo_aprovacao'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            # o pool substitui as conexões persistentes (CONN_MAX_AGE fica em 0)
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('DB_POOL_MIN', '2')),
+                    'max_size': int(os.getenv('DB_POOL_MAX', '20')),
+                    'timeout': 10,
+                },
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # conexões persistentes não são recomendadas sob ASGI
+            'CONN_MAX_AGE': 0 if VIEWS_ASSINCRONAS else int(os.getenv('DB_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': 20,  # busy timeout, em segundos
+                # a transação pega o lock de escrita no BEGIN; sem isso, uma
+                # transação que lê e depois escreve falha na hora, sem esperar o timeout
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA cache_size=-20000;'  # 20 MB por conexão
+                    'PRAGMA temp_store=MEMORY;'
+                ) + ('PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL;' if DB_SQLITE_WAL else ''),
+            },
+            # banco de testes em arquivo: o SQLite em memória compartilhada não
+            # respeita o timeout de lock, e os testes de concorrência usam threads
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -139,4 +200,71 @@ LOGIN_URL = '/login/'
 
 AUTH_USER_MODEL = 'SISTEMA.Usuario'
 
+# Cache compartilhado por todos os processos: o plano é invalidado por quem
+# grava a Assinatura (em geral o worker processar_webhooks ou expirar_assinaturas)
+# e os workers web precisam enxergar isso; o mesmo vale para as versões dos
+# fragmentos de template (SISTEMA/fragmentos.py). REDIS_URL usa Redis (requer o
+# pacote "redis"); sem ele, uma tabela no próprio banco (criada pela migração 0016).
+# MAX_ENTRIES comporta um ano de agregados diários das análises mais planos e fragmentos.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache_compartilhado',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Segundos que o plano do usuário fica em cache (SISTEMA/planos.py)
+PLANO_CACHE_TTL = 300
+# Segundos que cada processo guarda o plano na memória, na frente do cache
+# compartilhado; é o atraso máximo para os outros processos verem uma mudança
+PLANO_MEMORIA_TTL = 5
+
+
 
+# Segundos que os agregados de um dia ficam em cache (SISTEMA/analises.py).
+# Dias fechados não mudam; o dia de hoje e as pendências atuais expiram rápido.
+ANALISE_CACHE_TTL = 7 * 24 * 3600
+ANALISE_CACHE_TTL_HOJE = 300
+
+# Fluxos finalizados há mais dias que isso são movidos para fluxos_arquivados
+# pelo comando arquivar_fluxos (SISTEMA/arquivamento.py)
+ARQUIVAR_APOS_DIAS = int(os.getenv('ARQUIVAR_APOS_DIAS', 180))
+
+# Instrumentação por requisição (SISTEMA/instrumentacao.py). Toda requisição
+# conta latência para /metrics; a fração INSTRUMENTACAO_AMOSTRA também mede
+# consultas e templates e vai para o log. Requisições mais lentas que
+# INSTRUMENTACAO_LENTA_MS sempre vão para o log, como WARNING.
+INSTRUMENTACAO_AMOSTRA = float(os.getenv('INSTRUMENTACAO_AMOSTRA', '0.05'))
+INSTRUMENTACAO_LENTA_MS = int(os.getenv('INSTRUMENTACAO_LENTA_MS', '1000'))
+# Sem token, /metrics só responde com DEBUG e para a própria máquina; em produção, defina-o
+METRICAS_TOKEN = os.getenv('METRICAS_TOKEN')
+
+# "manage.py test" desliga a amostragem e o log da instrumentação (SISTEMA/executor_testes.py)
+TEST_RUNNER = 'SISTEMA.executor_testes.ExecutorTestes'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'SISTEMA.instrumentacao.FormatadorJSON'},
+    },
+    'handlers': {
+        'instrumentacao': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'loggers': {
+        'SISTEMA.instrumentacao': {
+            'handlers': ['instrumentacao'],
+            'level': os.getenv('INSTRUMENTACAO_LOG_NIVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
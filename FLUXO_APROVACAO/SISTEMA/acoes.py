@@ -0,0 +1,55 @@
+# SISTEMA/acoes.py
+from .models import AcaoFluxo
+
+# Nomes das ações usadas pelo motor de transições (semeadas pela migração 0008)
+AVANCAR = 'Avançar'
+RETORNAR = 'Retornar'
+REJEITAR = 'Rejeitar'
+
+
+# ==========================================================
+# REGISTRO DE AÇÕES (CACHE LOCAL DO PROCESSO)
+# ==========================================================
+# As ações quase nunca mudam, então o mapa nome -> id é carregado uma vez por
+# processo e reaproveitado em todas as movimentações. Os sinais em
+# SISTEMA/signals.py limpam o mapa quando alguma AcaoFluxo é salva ou excluída,
+# mas só no processo que fez a alteração: os outros workers continuam com o
+# mapa antigo. Por isso um nome que falta recarrega o mapa inteiro, e um id que
+# sumiu (ação excluída e recriada em outro processo) aparece como IntegrityError
+# da chave estrangeira ao gravar a movimentação; transicoes._executar então
+# chama recarregar_se_desatualizado e repete a transição uma vez.
+_ids_por_nome = {}
+
+
+def obter_acao_id(nome):
+    """Retorna o id da AcaoFluxo `nome` sem consultar o banco após a primeira carga."""
+    if nome not in _ids_por_nome:
+        # mapa vazio ou desatualizado: a ação pode ter sido criada em outro processo
+        recarregar()
+    if nome not in _ids_por_nome:
+        # ação ainda não semeada neste banco: cria uma única vez
+        acao, _ = AcaoFluxo.objects.get_or_create(nome=nome)
+        _ids_por_nome[nome] = acao.id
+    return _ids_por_nome[nome]
+
+
+def recarregar():
+    ids = dict(AcaoFluxo.objects.values_list('nome', 'id'))
+    _ids_por_nome.clear()
+    _ids_por_nome.update(ids)
+
+
+def recarregar_se_desatualizado(nome):
+    """
+    Confere no banco o id registrado para `nome`. Se ele não existe mais,
+    recarrega o mapa e retorna True (vale repetir a operação); senão, False.
+    """
+    acao_id = _ids_por_nome.get(nome)
+    if acao_id is not None and AcaoFluxo.objects.filter(id=acao_id).exists():
+        return False
+    recarregar()
+    return True
+
+
+def limpar_cache():
+    _ids_por_nome.clear()
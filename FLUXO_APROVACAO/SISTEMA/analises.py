@@ -0,0 +1,262 @@
+# SISTEMA/analises.py
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Max, Min, Q, Sum, Window
+from django.db.models.functions import Coalesce, Lag, TruncDate
+from django.utils import timezone
+from .models import AnaliseArquivada, FluxoInstancia, MovimentacaoFluxo
+from .acoes import obter_acao_id, AVANCAR
+
+# Se mudar o formato guardado no cache, troque o prefixo
+PREFIXO_CACHE = "analise:v2:"
+
+
+# ==========================================================
+# CACHE INCREMENTAL POR DIA
+# ==========================================================
+# Cada métrica histórica é calculada e guardada por dia. Um período só consulta
+# o banco para os dias que ainda não estão no cache (em uma única consulta);
+# dias fechados ficam no cache por ANALISE_CACHE_TTL, o dia de hoje por pouco tempo.
+
+def _por_dia(metrica, inicio, fim, calcular):
+    """Linhas de `metrica` de inicio a fim (datas, inclusive), reaproveitando os dias em cache."""
+    hoje = timezone.localdate()
+    fim = min(fim, hoje)
+    dias = [inicio + timedelta(days=n) for n in range((fim - inicio).days + 1)]
+    chaves = {dia: f"{PREFIXO_CACHE}{metrica}:{dia.isoformat()}" for dia in dias}
+    em_cache = cache.get_many(list(chaves.values()))
+
+    faltando = [dia for dia in dias if chaves[dia] not in em_cache]
+    if faltando:
+        calculado = calcular(faltando[0], faltando[-1])
+        fechados = {chaves[dia]: calculado.get(dia, []) for dia in faltando if dia < hoje}
+        cache.set_many(fechados, settings.ANALISE_CACHE_TTL)
+        if hoje in faltando:
+            cache.set(chaves[hoje], calculado.get(hoje, []), settings.ANALISE_CACHE_TTL_HOJE)
+        em_cache.update({chaves[dia]: calculado.get(dia, []) for dia in faltando})
+
+    return [linha for dia in dias for linha in em_cache[chaves[dia]]]
+
+
+def _somar(linhas, *chave):
+    """Junta as linhas diárias: soma quantidade e tempo total, mantém o maior tempo."""
+    totais = {}
+    for linha in linhas:
+        grupo = tuple(linha[c] for c in chave)
+        total = totais.setdefault(grupo, {**linha, "quantidade": 0, "soma": 0.0, "maximo": 0.0})
+        total["quantidade"] += linha["quantidade"]
+        total["soma"] += linha["soma"]
+        total["maximo"] = max(total["maximo"], linha["maximo"])
+    resultado = []
+    for total in totais.values():
+        media = total.pop("soma") / total["quantidade"]
+        resultado.append({
+            **total,
+            "media": timedelta(seconds=round(media)),
+            "maximo": timedelta(seconds=round(total["maximo"])),
+        })
+    return resultado
+
+
+def _segundos(valor):
+    # SQLite devolve durações em microssegundos; PostgreSQL, como interval (timedelta)
+    if valor is None:
+        return 0.0
+    if isinstance(valor, timedelta):
+        return valor.total_seconds()
+    return valor / 1_000_000
+
+
+def _dia(valor):
+    # TruncDate em subconsulta crua: o SQLite devolve texto, o PostgreSQL uma date
+    return valor if not isinstance(valor, str) else datetime.fromisoformat(valor).date()
+
+
+# ==========================================================
+# PERMANÊNCIA POR ETAPA
+# ==========================================================
+def permanencia_por_etapa(inicio, fim):
+    """
+    Tempo que cada etapa de cada modelo esperou até ser aprovada: para cada
+    movimentação "Avançar", a diferença para a movimentação anterior da mesma
+    instância (ou para a criação da instância), via LAG sobre data_acao.
+    """
+    linhas = _por_dia("permanencia", inicio, fim, _calcular_permanencia)
+    return sorted(_somar(linhas, "modelo_id", "ordem"), key=lambda l: (l["modelo"], l["ordem"]))
+
+
+def _calcular_permanencia(inicio, fim):
+    de, ate = _limites(inicio, fim)
+    instancias_no_periodo = MovimentacaoFluxo.objects.filter(
+        data_acao__gte=de, data_acao__lt=ate
+    ).values("fluxo_instancia_id")
+    por_dia = _permanencia(instancias_no_periodo, de, ate)
+    _somar_arquivados(por_dia, "permanencia", inicio, fim)
+    return por_dia
+
+
+def _permanencia(instancias, de=None, ate=None):
+    """Permanência das movimentações de `instancias` (ids), por dia; só as de [de, ate) se informado."""
+    anterior = Window(
+        Lag("data_acao"),
+        partition_by=F("fluxo_instancia_id"),
+        order_by=[F("data_acao").asc(), F("id").asc()],
+    )
+    # o LAG precisa enxergar movimentações anteriores ao período, por isso o
+    # filtro de data fica na consulta externa
+    movimentos = (
+        MovimentacaoFluxo.objects.filter(fluxo_instancia_id__in=instancias)
+        .annotate(
+            dia=TruncDate("data_acao"),
+            espera=ExpressionWrapper(
+                F("data_acao") - Coalesce(anterior, F("fluxo_instancia__criado_em")),
+                output_field=DurationField(),
+            ),
+        )
+        .values(
+            "dia", "data_acao", "acao_id", "espera",
+            modelo_id=F("fluxo_instancia__modelo_id"),
+            modelo=F("fluxo_instancia__modelo__nome"),
+            ordem=F("etapa__ordem_etapa"),
+            etapa_nome=F("etapa__nome"),
+        )
+        .order_by()
+    )
+    sql, params = movimentos.query.sql_with_params()
+    filtro, filtro_params = "acao_id = %s", [obter_acao_id(AVANCAR)]
+    if de is not None:
+        filtro += " AND data_acao >= %s AND data_acao < %s"
+        filtro_params += [connection.ops.adapt_datetimefield_value(d) for d in (de, ate)]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT dia, modelo_id, modelo, ordem, etapa_nome, COUNT(*), SUM(espera), MAX(espera)
+            FROM ({sql}) movimentos
+            WHERE {filtro}
+            GROUP BY dia, modelo_id, modelo, ordem, etapa_nome
+            """,
+            (*params, *filtro_params),
+        )
+        por_dia = defaultdict(list)
+        for dia, modelo_id, modelo, ordem, etapa, quantidade, soma, maximo in cursor.fetchall():
+            por_dia[_dia(dia)].append({
+                "modelo_id": modelo_id, "modelo": modelo, "ordem": ordem, "etapa": etapa,
+                "quantidade": quantidade, "soma": _segundos(soma), "maximo": _segundos(maximo),
+            })
+    return por_dia
+
+
+# ==========================================================
+# TEMPO DE CICLO POR MODELO
+# ==========================================================
+def tempo_de_ciclo(inicio, fim):
+    """Da criação à aprovação da última etapa, para os fluxos finalizados no período."""
+    linhas = _por_dia("ciclo", inicio, fim, _calcular_ciclo)
+    return sorted(_somar(linhas, "modelo_id"), key=lambda l: l["modelo"])
+
+
+def _calcular_ciclo(inicio, fim):
+    de, ate = _limites(inicio, fim)
+    por_dia = _ciclo(Q(data_acao__gte=de, data_acao__lt=ate))
+    _somar_arquivados(por_dia, "ciclo", inicio, fim)
+    return por_dia
+
+
+def _ciclo(filtro):
+    """Tempo de ciclo das finalizações que atendem `filtro` (Q sobre MovimentacaoFluxo), por dia."""
+    # a movimentação que finaliza é o "Avançar" da última etapa
+    finalizacoes = (
+        MovimentacaoFluxo.objects.filter(
+            filtro,
+            acao_id=obter_acao_id(AVANCAR),
+            etapa__ordem_etapa=F("fluxo_instancia__total_etapas"),
+        )
+        .annotate(
+            dia=TruncDate("data_acao"),
+            ciclo=ExpressionWrapper(F("data_acao") - F("fluxo_instancia__criado_em"), output_field=DurationField()),
+        )
+        .values("dia", modelo_id=F("fluxo_instancia__modelo_id"), modelo=F("fluxo_instancia__modelo__nome"))
+        .annotate(quantidade=Count("id"), soma=Sum("ciclo"), maximo=Max("ciclo"))
+        .order_by()
+    )
+    por_dia = defaultdict(list)
+    for linha in finalizacoes:
+        dia = linha.pop("dia")
+        linha["soma"] = linha["soma"].total_seconds()
+        linha["maximo"] = linha["maximo"].total_seconds()
+        por_dia[dia].append(linha)
+    return por_dia
+
+
+def _limites(inicio, fim):
+    """Datas locais (inclusive) -> [início do primeiro dia, início do dia seguinte ao último)."""
+    de = timezone.make_aware(datetime.combine(inicio, time.min))
+    ate = timezone.make_aware(datetime.combine(fim + timedelta(days=1), time.min))
+    return de, ate
+
+
+# ==========================================================
+# FLUXOS ARQUIVADOS
+# ==========================================================
+# O arquivamento (SISTEMA/arquivamento.py) apaga as movimentações. Antes, ele
+# chama guardar_arquivados, que grava em AnaliseArquivada o que os fluxos do
+# lote somam a cada métrica, por dia; os cálculos acima juntam essas linhas às
+# das tabelas de trabalho. Cada fluxo sai com todo o histórico, então o LAG da
+# permanência não perde nenhuma movimentação anterior. Os dias já em cache
+# continuam certos: foram calculados quando os fluxos ainda estavam lá.
+
+def guardar_arquivados(ids):
+    """Grava os agregados diários das instâncias `ids`; chame antes de apagar as movimentações."""
+    linhas = []
+    for metrica, por_dia in (("permanencia", _permanencia(ids)), ("ciclo", _ciclo(Q(fluxo_instancia_id__in=ids)))):
+        for dia, agregados in por_dia.items():
+            linhas.extend(
+                AnaliseArquivada(
+                    metrica=metrica, dia=dia, modelo_id=linha["modelo_id"], modelo=linha["modelo"] or "",
+                    ordem=linha.get("ordem"), etapa=linha.get("etapa") or "",
+                    quantidade=linha["quantidade"], soma=linha["soma"], maximo=linha["maximo"],
+                )
+                for linha in agregados
+            )
+    AnaliseArquivada.objects.bulk_create(linhas)
+
+
+def _somar_arquivados(por_dia, metrica, inicio, fim):
+    """Acrescenta a `por_dia` as linhas arquivadas da métrica entre inicio e fim."""
+    campos = ["modelo_id", "modelo", "quantidade", "soma", "maximo"]
+    if metrica == "permanencia":
+        campos += ["ordem", "etapa"]
+    for linha in AnaliseArquivada.objects.filter(metrica=metrica, dia__range=(inicio, fim)).values("dia", *campos):
+        por_dia[linha.pop("dia")].append(linha)
+
+
+# ==========================================================
+# PENDÊNCIAS POR SETOR (FOTOGRAFIA ATUAL)
+# ==========================================================
+def pendencias_por_setor():
+    """
+    Por setor: fluxos abertos aguardando nele agora, etapas que ainda faltam
+    nesses fluxos e a criação do mais antigo. Agrupa os fluxos abertos pelo
+    setor_atual desnormalizado (índice parcial fluxo_inst_caixa_idx), sem
+    passar pelas etapas. Cache curto (ANALISE_CACHE_TTL_HOJE).
+    """
+    chave = f"{PREFIXO_CACHE}pendencias_setor"
+    resultado = cache.get(chave)
+    if resultado is None:
+        resultado = list(
+            FluxoInstancia.objects.filter(finalizado=False)
+            .values("setor_atual", setor_nome=F("setor_atual__nome"))
+            .annotate(
+                aguardando=Count("id"),
+                etapas_restantes=Sum(F("total_etapas") - F("etapas_concluidas")),
+                mais_antigo=Min("criado_em"),
+            )
+            .order_by("-aguardando", "setor_nome")
+        )
+        cache.set(chave, resultado, settings.ANALISE_CACHE_TTL_HOJE)
+    return resultado
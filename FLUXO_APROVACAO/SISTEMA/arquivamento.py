@@ -0,0 +1,164 @@
+# SISTEMA/arquivamento.py
+import json
+import time
+import zlib
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import FluxoInstancia, EtapaInstancia, MovimentacaoFluxo, FluxoArquivado
+from .analises import guardar_arquivados
+
+# fluxos movidos por transação
+LOTE_ARQUIVAMENTO = 500
+# formato de FluxoArquivado.conteudo; mude se mudar a estrutura do JSON
+VERSAO_CONTEUDO = 1
+
+
+# ==========================================================
+# ARQUIVAMENTO
+# ==========================================================
+# Fluxos finalizados há mais de ARQUIVAR_APOS_DIAS saem de fluxos_instancia,
+# etapas_instancia e movimentacoes_fluxo e viram uma linha em
+# fluxos_arquivados, com etapas e histórico em JSON comprimido. Cada lote é
+# copiado e apagado na mesma transação: um fluxo nunca fica nos dois lugares
+# nem em nenhum. Os gatilhos da busca (migração 0014) tiram os fluxos do índice.
+#
+# O histórico arquivado continua nos relatórios: a exportação de movimentações
+# lê também fluxos_arquivados, e as análises recebem, no mesmo lote, os
+# agregados diários dos fluxos que saem (analises.guardar_arquivados).
+
+def arquivar_finalizados(dias=None, lote=LOTE_ARQUIVAMENTO, limite=None, ao_concluir_lote=None):
+    """
+    Arquiva os fluxos finalizados (atualizado_em) há mais de `dias`. Retorna
+    {"arquivados", "etapas", "movimentacoes", "lotes", "segundos"}.
+    """
+    dias = settings.ARQUIVAR_APOS_DIAS if dias is None else dias
+    corte = timezone.now() - timedelta(days=dias)
+    candidatos = FluxoInstancia.objects.filter(finalizado=True, atualizado_em__lt=corte).order_by("id")
+
+    inicio = time.perf_counter()
+    resumo = {"arquivados": 0, "etapas": 0, "movimentacoes": 0, "lotes": 0}
+    ultimo_id = 0
+    while limite is None or resumo["arquivados"] < limite:
+        tamanho = lote if limite is None else min(lote, limite - resumo["arquivados"])
+        # continua do último id visto, em vez de varrer de novo o começo da tabela
+        ids = list(candidatos.filter(id__gt=ultimo_id).values_list("id", flat=True)[:tamanho])
+        if not ids:
+            break
+        ultimo_id = ids[-1]
+        with transaction.atomic():
+            arquivados, etapas, movimentacoes = _arquivar_lote(ids, corte)
+        resumo["arquivados"] += arquivados
+        resumo["etapas"] += etapas
+        resumo["movimentacoes"] += movimentacoes
+        resumo["lotes"] += 1
+        if ao_concluir_lote:
+            ao_concluir_lote(resumo)
+    resumo["segundos"] = round(time.perf_counter() - inicio, 2)
+    return resumo
+
+
+def _arquivar_lote(ids, corte):
+    # trava as linhas e confere de novo: o fluxo pode ter sido reaberto desde a seleção
+    instancias = list(
+        FluxoInstancia.objects.select_for_update()
+        .filter(id__in=ids, finalizado=True, atualizado_em__lt=corte)
+        .select_related("modelo", "criado_por")
+    )
+    ids = [i.id for i in instancias]
+
+    etapas_por_instancia = {}
+    for etapa in (
+        EtapaInstancia.objects.filter(fluxo_instancia_id__in=ids)
+        .order_by("fluxo_instancia_id", "ordem_etapa")
+        .values("fluxo_instancia_id", "id", "ordem_etapa", "nome", "perfil_aprovador", "concluida", "setor__nome")
+    ):
+        etapas_por_instancia.setdefault(etapa.pop("fluxo_instancia_id"), []).append(etapa)
+
+    movimentacoes_por_instancia = {}
+    for mov in (
+        MovimentacaoFluxo.objects.filter(fluxo_instancia_id__in=ids)
+        .order_by("fluxo_instancia_id", "data_acao", "id")
+        .values("fluxo_instancia_id", "id", "data_acao", "comentario", "acao__nome", "etapa__ordem_etapa", "etapa__nome", "usuario__username")
+    ):
+        mov["data_acao"] = mov["data_acao"].isoformat()
+        movimentacoes_por_instancia.setdefault(mov.pop("fluxo_instancia_id"), []).append(mov)
+
+    FluxoArquivado.objects.bulk_create([
+        FluxoArquivado(
+            id=instancia.id,
+            nome=instancia.nome,
+            modelo_id=instancia.modelo_id,
+            modelo_nome=instancia.modelo.nome,
+            criado_por=instancia.criado_por.username if instancia.criado_por else "",
+            criado_em=instancia.criado_em,
+            finalizado_em=instancia.atualizado_em,
+            total_etapas=instancia.total_etapas,
+            conteudo=_comprimir({
+                "versao": VERSAO_CONTEUDO,
+                "etapas": etapas_por_instancia.get(instancia.id, []),
+                "movimentacoes": movimentacoes_por_instancia.get(instancia.id, []),
+            }),
+        )
+        for instancia in instancias
+    ])
+
+    guardar_arquivados(ids)
+
+    # filhos primeiro: as movimentações saem com um DELETE só, e sem elas e sem
+    # etapa_atual não sobra SET_NULL para o Collector resolver nas etapas
+    movimentacoes, _ = MovimentacaoFluxo.objects.filter(fluxo_instancia_id__in=ids).delete()
+    FluxoInstancia.objects.filter(id__in=ids).update(etapa_atual=None)
+    etapas, _ = EtapaInstancia.objects.filter(fluxo_instancia_id__in=ids).delete()
+    FluxoInstancia.objects.filter(id__in=ids).delete()
+    return len(ids), etapas, movimentacoes
+
+
+def _comprimir(conteudo):
+    return zlib.compress(json.dumps(conteudo, ensure_ascii=False, separators=(",", ":")).encode(), 6)
+
+
+# ==========================================================
+# LEITURA
+# ==========================================================
+def ler_arquivado(arquivado):
+    """
+    Descomprime um FluxoArquivado em objetos com os mesmos atributos usados
+    por instancia_fluxo_detalhar.html: (instancia, etapas, movimentacoes).
+    """
+    conteudo = json.loads(zlib.decompress(bytes(arquivado.conteudo)))
+    instancia = SimpleNamespace(
+        id=arquivado.id,
+        nome=arquivado.nome,
+        modelo=SimpleNamespace(id=arquivado.modelo_id, nome=arquivado.modelo_nome),
+        criado_em=arquivado.criado_em,
+        atualizado_em=arquivado.finalizado_em,
+        finalizado=True,
+        etapa_atual_id=None,
+        etapas_concluidas=arquivado.total_etapas,
+        total_etapas=arquivado.total_etapas,
+        arquivado_em=arquivado.arquivado_em,
+    )
+    etapas = [
+        SimpleNamespace(
+            id=e["id"], ordem_etapa=e["ordem_etapa"], nome=e["nome"], perfil_aprovador=e["perfil_aprovador"],
+            concluida=e["concluida"], setor=SimpleNamespace(nome=e["setor__nome"]) if e["setor__nome"] else None,
+        )
+        for e in conteudo["etapas"]
+    ]
+    # histórico do mais recente para o mais antigo, como na instância viva
+    movimentacoes = [
+        SimpleNamespace(
+            id=m["id"],
+            data_acao=datetime.fromisoformat(m["data_acao"]),
+            comentario=m["comentario"],
+            acao=SimpleNamespace(nome=m["acao__nome"]) if m["acao__nome"] else None,
+            etapa=SimpleNamespace(nome=m["etapa__nome"], ordem_etapa=m["etapa__ordem_etapa"]) if m["etapa__nome"] else None,
+            usuario=SimpleNamespace(username=m["usuario__username"]) if m["usuario__username"] else None,
+        )
+        for m in reversed(conteudo["movimentacoes"])
+    ]
+    return instancia, etapas, movimentacoes
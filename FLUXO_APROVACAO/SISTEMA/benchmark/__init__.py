@@ -0,0 +1,4 @@
+# SISTEMA/benchmark
+# Geração de dados sintéticos (semeadura), cenários de carga e execução em
+# processo (Client do Django) ou por HTTP. Usado pelos comandos
+# semear_benchmark, benchmark_carga e benchmark_indices.
@@ -0,0 +1,40 @@
+# SISTEMA/benchmark/banco.py
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .. import acoes
+
+
+# ==========================================================
+# BANCO TEMPORÁRIO
+# ==========================================================
+# Benchmarks que semeiam milhares de linhas ou removem índices não podem
+# rodar no banco configurado. Este contexto cria o banco de testes do Django
+# (test_<nome> no PostgreSQL; no SQLite, um arquivo numa pasta temporária),
+# aplica as migrações, aponta o alias para ele e o apaga no fim.
+
+@contextmanager
+def banco_temporario(alias=DEFAULT_DB_ALIAS):
+    """Troca o banco `alias` por um banco novo e migrado enquanto o bloco roda. Devolve o nome dele."""
+    conexao = connections[alias]
+    teste = conexao.settings_dict["TEST"]
+    nome_teste = teste.get("NAME")
+    pasta = None
+    if conexao.vendor == "sqlite":
+        pasta = tempfile.mkdtemp(prefix="fluxo_benchmark_")
+        teste["NAME"] = os.path.join(pasta, "benchmark.sqlite3")
+    # o mapa nome -> id das ações é do banco anterior
+    acoes.limpar_cache()
+    nome_original = conexao.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield conexao.settings_dict["NAME"]
+    finally:
+        conexao.creation.destroy_test_db(nome_original, verbosity=0)
+        teste["NAME"] = nome_teste
+        acoes.limpar_cache()
+        if pasta:
+            shutil.rmtree(pasta, ignore_errors=True)
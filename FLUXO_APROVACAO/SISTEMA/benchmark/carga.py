@@ -0,0 +1,223 @@
+# SISTEMA/benchmark/carga.py
+import os
+import platform
+import statistics
+import subprocess
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import django
+import requests
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+
+from ..instrumentacao import Medicao
+from ..models import Setor, Usuario, FluxoPadrao, FluxoInstancia, EtapaInstancia, MovimentacaoFluxo
+from .semeadura import SENHA
+
+DRIVERS = ("processo", "http")
+# versão do formato do JSON de resultados
+VERSAO_RESULTADO = 1
+
+
+# ==========================================================
+# EXECUÇÃO
+# ==========================================================
+# Uma thread por Trabalho (ver cenarios.py), todas ao mesmo tempo. No driver
+# "processo" cada thread usa um Client do Django (sem rede, com a contagem de
+# consultas da instrumentação); no "http", uma requests.Session contra o
+# servidor local (ou `url`), passando por socket, WSGI e CSRF de verdade.
+
+def executar(trabalhos, driver, url=None):
+    """Roda os trabalhos em paralelo. Retorna (amostras [(segundos, status, consultas)], duração total)."""
+    executar_trabalho = {"processo": _trabalho_no_processo, "http": _trabalho_por_http}[driver]
+    amostras = [[] for _ in trabalhos]
+    erros = []
+    pronto = threading.Barrier(len(trabalhos) + 1)
+
+    def rodar(indice, trabalho):
+        try:
+            executar_trabalho(trabalho, amostras[indice], pronto, url)
+        except Exception as e:  # uma thread que falha não pode travar a barreira das outras
+            erros.append(e)
+            pronto.abort()
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=rodar, args=(i, t)) for i, t in enumerate(trabalhos)]
+    for thread in threads:
+        thread.start()
+    # o relógio começa quando todos já entraram (login fora da medição)
+    try:
+        pronto.wait()
+    except threading.BrokenBarrierError:
+        pass
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    if erros:
+        raise erros[0]
+    return [a for lista in amostras for a in lista], time.perf_counter() - inicio
+
+
+def _trabalho_no_processo(trabalho, amostras, pronto, url):
+    client = Client()
+    if trabalho.usuario:
+        client.force_login(trabalho.usuario)
+    pronto.wait()
+    for requisicao in trabalho.requisicoes:
+        medicao = Medicao()
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(medicao):
+            if requisicao.metodo == "GET":
+                resposta = client.get(requisicao.caminho)
+            elif isinstance(requisicao.dados, str):
+                resposta = client.post(requisicao.caminho, requisicao.dados, content_type="application/json")
+            else:
+                resposta = client.post(requisicao.caminho, requisicao.dados)
+        amostras.append((time.perf_counter() - inicio, resposta.status_code, medicao.consultas))
+
+
+def _trabalho_por_http(trabalho, amostras, pronto, url):
+    sessao = requests.Session()
+    if trabalho.usuario:
+        sessao.get(f"{url}/login/")
+        sessao.post(f"{url}/login/", data={
+            "username": trabalho.usuario.username, "password": SENHA,
+            "csrfmiddlewaretoken": sessao.cookies.get("csrftoken", ""),
+        }, allow_redirects=False)
+    elif any(r.metodo == "POST" and not isinstance(r.dados, str) for r in trabalho.requisicoes):
+        sessao.get(f"{url}/login/")  # formulários anônimos (login) precisam do cookie do CSRF
+    pronto.wait()
+    for requisicao in trabalho.requisicoes:
+        inicio = time.perf_counter()
+        if requisicao.metodo == "GET":
+            resposta = sessao.get(url + requisicao.caminho, allow_redirects=False)
+        elif isinstance(requisicao.dados, str):
+            resposta = sessao.post(url + requisicao.caminho, data=requisicao.dados.encode(),
+                                   headers={"Content-Type": "application/json"}, allow_redirects=False)
+        else:
+            token = sessao.cookies.get("csrftoken", "")
+            resposta = sessao.post(url + requisicao.caminho, data={**requisicao.dados, "csrfmiddlewaretoken": token},
+                                   allow_redirects=False)
+        amostras.append((time.perf_counter() - inicio, resposta.status_code, None))
+    sessao.close()
+
+
+class _RequisicaoSilenciosa(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class _ServidorLocal(ThreadedWSGIServer):
+    request_queue_size = 256  # o padrão (5) derruba conexões na rajada de webhooks
+
+
+@contextmanager
+def servidor_local():
+    """Sobe a aplicação WSGI em 127.0.0.1, numa porta livre, e devolve a URL base."""
+    servidor = _ServidorLocal(("127.0.0.1", 0), _RequisicaoSilenciosa)
+    # WSGIHandler direto: o wsgi.py do projeto chamaria django.setup() de novo,
+    # refazendo a configuração de log no meio da execução
+    servidor.set_app(WSGIHandler())
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{servidor.server_port}"
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+# ==========================================================
+# RESULTADOS
+# ==========================================================
+def resumir(cenario, driver, concorrencia, amostras, duracao):
+    tempos = sorted(1000 * segundos for segundos, _, _ in amostras)
+    consultas = [c for _, _, c in amostras if c is not None]
+
+    def percentil(p):
+        return round(tempos[min(len(tempos) - 1, int(len(tempos) * p))], 2)
+
+    return {
+        "cenario": cenario,
+        "driver": driver,
+        "concorrencia": concorrencia,
+        "requisicoes": len(amostras),
+        "duracao_s": round(duracao, 3),
+        "vazao_rps": round(len(amostras) / duracao, 1),
+        "latencia_ms": {
+            "media": round(statistics.fmean(tempos), 2),
+            "p50": percentil(0.50),
+            "p90": percentil(0.90),
+            "p95": percentil(0.95),
+            "p99": percentil(0.99),
+            "max": round(tempos[-1], 2),
+        },
+        "status": dict(sorted(Counter(str(status) for _, status, _ in amostras).items())),
+        "erros": sum(1 for _, status, _ in amostras if status >= 500),
+        "consultas_por_requisicao": round(statistics.fmean(consultas), 1) if consultas else None,
+    }
+
+
+def ambiente():
+    """O que muda o resultado além do código: versões, banco, máquina e volumes."""
+    banco = connection.vendor
+    if banco == "sqlite":
+        import sqlite3
+        banco += f" {sqlite3.sqlite_version}"
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "banco": banco,
+        "cpus": os.cpu_count(),
+        "plataforma": platform.platform(),
+        "commit": _commit(),
+        "volumes": {
+            "setores": Setor.objects.count(),
+            "usuarios": Usuario.objects.count(),
+            "modelos": FluxoPadrao.objects.count(),
+            "instancias": FluxoInstancia.objects.count(),
+            "etapas": EtapaInstancia.objects.count(),
+            "movimentacoes": MovimentacaoFluxo.objects.count(),
+        },
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def novo_resultado(parametros):
+    return {
+        "versao": VERSAO_RESULTADO,
+        "executado_em": timezone.now().isoformat(),
+        "parametros": parametros,
+        "ambiente": ambiente(),
+        "resultados": [],
+    }
+
+
+def comparar(anterior, atual):
+    """Linhas (cenario, driver, p95 antes, p95 agora, vazão antes, vazão agora) dos pares presentes nos dois."""
+    antes = {(r["cenario"], r["driver"]): r for r in anterior["resultados"]}
+    linhas = []
+    for r in atual["resultados"]:
+        a = antes.get((r["cenario"], r["driver"]))
+        if a:
+            linhas.append((
+                r["cenario"], r["driver"],
+                a["latencia_ms"]["p95"], r["latencia_ms"]["p95"],
+                a["vazao_rps"], r["vazao_rps"],
+            ))
+    return linhas
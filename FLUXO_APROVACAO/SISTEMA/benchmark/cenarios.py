@@ -0,0 +1,131 @@
+# SISTEMA/benchmark/cenarios.py
+import json
+import random
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import F
+from django.urls import reverse
+
+from ..models import Usuario, FluxoInstancia, EtapaInstancia, EventoWebhook
+from .semeadura import PREFIXO, SENHA
+
+# dados: dict (formulário) ou str (corpo JSON). usuario: com quem o trabalhador
+# entra antes da primeira requisição (None = anônimo)
+Requisicao = namedtuple("Requisicao", "metodo caminho dados")
+Trabalho = namedtuple("Trabalho", "usuario requisicoes")
+
+PREFIXO_EVENTO = "benchmark-"
+# fração dos eventos do webhook reenviados (caminho de evento duplicado)
+REENVIOS = 0.1
+
+
+# ==========================================================
+# CENÁRIOS
+# ==========================================================
+# Cada cenário monta, a partir dos dados semeados, a lista de requisições de
+# cada trabalhador (uma thread da carga). Os mesmos trabalhos servem para a
+# execução em processo e por HTTP, e com a mesma semente são os mesmos.
+
+def preparar(nome, trabalhadores, requisicoes, semente=42):
+    """Lista de Trabalho, um por trabalhador, com `requisicoes` requisições no total."""
+    aleatorio = random.Random(semente)
+    usuarios = list(Usuario.objects.filter(username__startswith=f"{PREFIXO}_").order_by("username")[:trabalhadores])
+    if not usuarios:
+        raise ValueError("Banco sem usuários do benchmark. Rode antes: python manage.py semear_benchmark")
+    por_trabalhador = [requisicoes // trabalhadores + (i < requisicoes % trabalhadores) for i in range(trabalhadores)]
+    montar = CENARIOS[nome]
+    return [
+        montar(usuarios[i % len(usuarios)], quantidade, aleatorio, i)
+        for i, quantidade in enumerate(por_trabalhador)
+    ]
+
+
+def _login(usuario, quantidade, aleatorio, _):
+    dados = {"username": usuario.username, "password": SENHA}
+    return Trabalho(None, [Requisicao("POST", reverse("login"), dados)] * quantidade)
+
+
+def _listagem(usuario, quantidade, aleatorio, _):
+    paginas = [
+        reverse("listar_instancias_fluxo"),
+        reverse("listar_instancias_fluxo") + "?aba=finalizado",
+        reverse("caixa_entrada"),
+        reverse("listar_modelos_fluxo"),
+    ]
+    return Trabalho(usuario, [Requisicao("GET", aleatorio.choice(paginas), None) for _ in range(quantidade)])
+
+
+def _detalhe(usuario, quantidade, aleatorio, _):
+    maior = FluxoInstancia.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    # ids sorteados no intervalo todo (páginas frias e quentes, como em
+    # produção), cada um trocado pelo próximo id existente
+    ids = [
+        FluxoInstancia.objects.filter(id__gte=aleatorio.randint(1, maior)).order_by("id").values_list("id", flat=True).first()
+        for _ in range(quantidade)
+    ]
+    return Trabalho(usuario, [Requisicao("GET", reverse("detalhar_instancia_fluxo", args=[id_]), None) for id_ in ids])
+
+
+def _transicoes(usuario, quantidade, aleatorio, indice):
+    # fluxos abertos só deste trabalhador (sem disputa entre threads), que
+    # alternam entre avançar a etapa atual e retornar a partir da seguinte
+    fluxos = list(
+        FluxoInstancia.objects.filter(finalizado=False, etapas_concluidas__lt=F("total_etapas") - 1)
+        .order_by("-id").values_list("id", "etapa_atual_id", "etapas_concluidas")[indice * 5:indice * 5 + 5]
+    )
+    if not fluxos:
+        raise ValueError("Nenhum fluxo aberto com duas etapas pendentes para o cenário de transições.")
+    etapas = {
+        (fluxo_id, ordem): etapa_id
+        for etapa_id, fluxo_id, ordem in EtapaInstancia.objects.filter(
+            fluxo_instancia_id__in=[f[0] for f in fluxos]
+        ).values_list("id", "fluxo_instancia_id", "ordem_etapa")
+    }
+    requisicoes = []
+    for n in range(quantidade):
+        fluxo_id, etapa_id, concluidas = fluxos[(n // 2) % len(fluxos)]
+        if n % 2 == 0:
+            requisicoes.append(Requisicao(
+                "POST", reverse("mover_etapa", args=[fluxo_id, etapa_id]), {"acao": "avancar", "comentario": "benchmark"},
+            ))
+        else:
+            seguinte = etapas[(fluxo_id, concluidas + 2)]
+            requisicoes.append(Requisicao(
+                "POST", reverse("mover_etapa", args=[fluxo_id, seguinte]), {"acao": "retornar", "comentario": "benchmark"},
+            ))
+    return Trabalho(usuario, requisicoes)
+
+
+def _webhook(usuario, quantidade, aleatorio, _):
+    caminho = reverse("abacatepay_webhook")
+    segredo = getattr(settings, "WEBHOOK_SECRET", None)
+    if segredo:
+        caminho += f"?secret={segredo}"
+    enviados = []
+    requisicoes = []
+    for _ in range(quantidade):
+        if enviados and aleatorio.random() < REENVIOS:
+            evento_id = aleatorio.choice(enviados)
+        else:
+            evento_id = f"{PREFIXO_EVENTO}{uuid.UUID(int=aleatorio.getrandbits(128))}"
+            enviados.append(evento_id)
+        corpo = json.dumps({"id": evento_id, "event": "billing.paid", "data": {"billing": {"amount": 2990}}})
+        requisicoes.append(Requisicao("POST", caminho, corpo))
+    return Trabalho(None, requisicoes)
+
+
+CENARIOS = {
+    "login": _login,
+    "listagem": _listagem,
+    "detalhe": _detalhe,
+    "transicoes": _transicoes,
+    "webhook": _webhook,
+}
+
+
+def limpar(nome):
+    """Desfaz o que o cenário gravou e que distorceria as próximas execuções."""
+    if nome == "webhook":
+        EventoWebhook.objects.filter(event_id__startswith=PREFIXO_EVENTO).delete()
@@ -0,0 +1,263 @@
+# SISTEMA/benchmark/semeadura.py
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..acoes import obter_acao_id, AVANCAR, RETORNAR
+from ..models import (
+    Setor, Usuario, Assinatura, FluxoPadrao, EtapaFluxo, FluxoInstancia, EtapaInstancia, MovimentacaoFluxo,
+)
+
+# senha de todos os usuários gerados (cenário de login)
+SENHA = "benchmark-123"
+PREFIXO = "bench"
+LOTE = 2000
+
+PALAVRAS = (
+    "compra notebook servidor licença contrato reforma viagem treinamento fornecedor orçamento "
+    "manutenção veículo cadeira monitor software consultoria auditoria reembolso material escritório "
+    "obra projeto evento marketing frete seguro aluguel energia internet telefonia limpeza segurança "
+    "uniforme ferramenta peça estoque importação exportação nota fiscal pagamento adiantamento diária"
+).split()
+COMENTARIOS = (
+    "aprovado conforme orçamento", "valor dentro do limite do setor", "segue para a próxima etapa",
+    "documentação conferida", "faltava a nota fiscal, já anexada", "ajustar centro de custo",
+    "fornecedor homologado", "prazo de entrega confirmado", "retornando para correção do valor",
+    "ok", "de acordo", "verificar com o jurídico antes de assinar",
+)
+
+
+# ==========================================================
+# SEMEADURA
+# ==========================================================
+# Volumes parecidos com os de produção: modelos de 3 a `etapas_max` etapas,
+# com os modelos curtos mais usados que os longos; fluxos criados ao longo de
+# `dias`, cerca de 60% finalizados e os demais parados em uma etapa qualquer;
+# um "Avançar" por etapa concluída e, em 10% dos fluxos, um retorno no meio.
+# Com `semente` fixa os mesmos parâmetros geram os mesmos dados (exceto datas,
+# que são relativas a agora).
+
+def semear(setores=20, usuarios=200, modelos=20, etapas_max=50, instancias=1_000_000,
+           dias=365, semente=42, lote=LOTE, tamanhos=None, ao_concluir_lote=None):
+    """
+    Gera setores, usuários (com assinatura), modelos e instâncias com etapas e
+    histórico consistentes com o motor de transições. Setores, usuários e
+    modelos já gerados são reaproveitados; as instâncias são sempre novas.
+    Retorna um dict com o que foi criado e os segundos gastos.
+    """
+    inicio = time.perf_counter()
+    aleatorio = random.Random(semente)
+    agora = timezone.now()
+
+    lista_setores = _semear_setores(setores)
+    lista_usuarios = _semear_usuarios(usuarios, lista_setores, aleatorio, agora)
+    etapas_por_modelo = _semear_modelos(tamanhos or _tamanhos(modelos, etapas_max), lista_setores, lista_usuarios[0])
+
+    usuarios_por_setor = {}
+    for usuario in lista_usuarios:
+        usuarios_por_setor.setdefault(usuario.setor_id, []).append(usuario.id)
+    ids_modelos = list(etapas_por_modelo)
+    # modelos curtos são os mais usados
+    pesos = [1 / len(etapas_por_modelo[m]) for m in ids_modelos]
+    acoes = {nome: obter_acao_id(nome) for nome in (AVANCAR, RETORNAR)}
+
+    resumo = {"instancias": 0, "etapas": 0, "movimentacoes": 0, "lotes": 0}
+    numero = FluxoInstancia.objects.count()
+    while resumo["instancias"] < instancias:
+        tamanho = min(lote, instancias - resumo["instancias"])
+        planos = [
+            _planejar(aleatorio, modelo_id, len(etapas_por_modelo[modelo_id]), agora, dias)
+            for modelo_id in aleatorio.choices(ids_modelos, pesos, k=tamanho)
+        ]
+        with transaction.atomic():
+            etapas, movimentacoes = _gravar_lote(
+                planos, etapas_por_modelo, numero, aleatorio, lista_usuarios, usuarios_por_setor, acoes,
+            )
+        numero += tamanho
+        resumo["instancias"] += tamanho
+        resumo["etapas"] += etapas
+        resumo["movimentacoes"] += movimentacoes
+        resumo["lotes"] += 1
+        if ao_concluir_lote:
+            ao_concluir_lote(resumo)
+
+    resumo.update({
+        "setores": len(lista_setores),
+        "usuarios": len(lista_usuarios),
+        "modelos": len(etapas_por_modelo),
+        "segundos": round(time.perf_counter() - inicio, 2),
+    })
+    return resumo
+
+
+def _tamanhos(modelos, etapas_max):
+    """Quantidade de etapas de cada modelo, de 3 até etapas_max (o último tem etapas_max)."""
+    if modelos == 1:
+        return [etapas_max]
+    razao = (etapas_max / 3) ** (1 / (modelos - 1))
+    return [max(3, round(3 * razao ** i)) for i in range(modelos - 1)] + [etapas_max]
+
+
+def _semear_setores(total):
+    Setor.objects.bulk_create(
+        [Setor(nome=f"{PREFIXO} setor {i:03d}") for i in range(total)], ignore_conflicts=True,
+    )
+    return list(Setor.objects.filter(nome__startswith=f"{PREFIXO} setor ").order_by("nome")[:total])
+
+
+def _semear_usuarios(total, setores, aleatorio, agora):
+    # um hash só para todos: gerar o PBKDF2 de cada usuário levaria minutos
+    senha = make_password(SENHA)
+    existentes = set(Usuario.objects.filter(username__startswith=f"{PREFIXO}_").values_list("username", flat=True))
+    novos = Usuario.objects.bulk_create(
+        [
+            Usuario(
+                username=f"{PREFIXO}_{i:05d}",
+                password=senha,
+                setor=setores[i % len(setores)],
+                # alguns administradores por setor
+                perfil="administrador" if i % 20 == 0 else "padrao",
+            )
+            for i in range(total)
+            if f"{PREFIXO}_{i:05d}" not in existentes
+        ],
+        batch_size=LOTE,
+    )
+    Assinatura.objects.bulk_create(
+        [
+            Assinatura(
+                usuario=usuario,
+                plano=aleatorio.choices(("freemium", "prata", "ouro", "diamante"), (50, 30, 15, 5))[0],
+                data_inicio=agora.date() - timedelta(days=aleatorio.randrange(300)),
+            )
+            for usuario in novos
+        ],
+        batch_size=LOTE,
+    )
+    return list(Usuario.objects.filter(username__startswith=f"{PREFIXO}_").order_by("username")[:total])
+
+
+def _semear_modelos(tamanhos, setores, autor):
+    """{modelo_id: [(nome, setor_id, perfil), ...]} na ordem das etapas."""
+    etapas_por_modelo = {}
+    for i, tamanho in enumerate(tamanhos):
+        nome = f"{PREFIXO} modelo {i:03d} ({tamanho} etapas)"
+        modelo = FluxoPadrao.objects.filter(nome=nome).first()
+        if modelo is None:
+            modelo = FluxoPadrao.objects.create(nome=nome, criado_por=autor)
+            EtapaFluxo.objects.bulk_create([
+                EtapaFluxo(
+                    fluxo=modelo,
+                    ordem_etapa=ordem,
+                    nome=f"{PALAVRAS[(i + ordem) % len(PALAVRAS)].capitalize()} {ordem}",
+                    setor=setores[(i * 7 + ordem) % len(setores)],
+                    perfil_aprovador="administrador" if ordem == tamanho else "padrao",
+                )
+                for ordem in range(1, tamanho + 1)
+            ])
+        etapas_por_modelo[modelo.id] = list(
+            modelo.etapas.order_by("ordem_etapa").values_list("nome", "setor_id", "perfil_aprovador")
+        )
+    return etapas_por_modelo
+
+
+def _planejar(aleatorio, modelo_id, total, agora, dias):
+    """Estado final de uma instância: (modelo_id, criado_em, concluídas, histórico [(ordem, ação, data)])."""
+    concluidas = total if aleatorio.random() < 0.6 else aleatorio.randrange(total)
+    ordens = [(ordem, AVANCAR) for ordem in range(1, concluidas + 1)]
+    if concluidas >= 2 and aleatorio.random() < 0.1:
+        # retorno no meio do caminho: a etapa volta e é aprovada de novo
+        ordem = aleatorio.randrange(1, concluidas)
+        ordens[ordem:ordem] = [(ordem, RETORNAR), (ordem, AVANCAR)]
+    criado_em = agora - timedelta(seconds=aleatorio.randrange(int(dias * 86400)))
+    historico = []
+    data = criado_em
+    for ordem, acao in ordens:
+        # de minutos a três dias entre uma ação e outra, sem passar de agora
+        data = min(data + timedelta(minutes=aleatorio.randrange(10, 72 * 60)), agora)
+        historico.append((ordem, acao, data))
+    return modelo_id, criado_em, concluidas, historico
+
+
+def _gravar_lote(planos, etapas_por_modelo, numero, aleatorio, usuarios, usuarios_por_setor, acoes):
+    # Só as instâncias passam pelo ORM. Etapas e movimentações são a maior
+    # parte das linhas, e montar um objeto de modelo por linha custava ~85% do
+    # tempo: as etapas são clonadas de etapas_fluxo com INSERT ... SELECT e as
+    # movimentações vão em tuplas, com executemany.
+    novas = []
+    for n, (modelo_id, criado_em, concluidas, historico) in enumerate(planos):
+        etapas_modelo = etapas_por_modelo[modelo_id]
+        atual = etapas_modelo[concluidas] if concluidas < len(etapas_modelo) else None
+        novas.append(FluxoInstancia(
+            modelo_id=modelo_id,
+            nome=f"{aleatorio.choice(PALAVRAS).capitalize()} {aleatorio.choice(PALAVRAS)} {numero + n + 1}",
+            criado_por_id=aleatorio.choice(usuarios).id,
+            criado_em=criado_em,
+            finalizado=atual is None,
+            setor_atual_id=atual[1] if atual else None,
+            perfil_atual=atual[2] if atual else "",
+            etapas_concluidas=concluidas,
+            total_etapas=len(etapas_modelo),
+            versao=len(historico),
+        ))
+    instancias = FluxoInstancia.objects.bulk_create(novas)
+    ids = [instancia.id for instancia in instancias]
+    marcadores = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO etapas_instancia (fluxo_instancia_id, ordem_etapa, nome, setor_id, perfil_aprovador, concluida, criado_em)
+            SELECT i.id, e.ordem_etapa, e.nome, e.setor_id, e.perfil_aprovador, e.ordem_etapa <= i.etapas_concluidas, i.criado_em
+            FROM fluxos_instancia i
+            JOIN etapas_fluxo e ON e.fluxo_id = i.modelo_id
+            WHERE i.id IN ({marcadores})
+            """,
+            ids,
+        )
+        etapas = {
+            (fluxo_id, ordem): (etapa_id, setor_id)
+            for fluxo_id, ordem, etapa_id, setor_id in EtapaInstancia.objects.filter(fluxo_instancia_id__in=ids)
+            .values_list("fluxo_instancia_id", "ordem_etapa", "id", "setor_id")
+        }
+
+        movimentacoes = []
+        for instancia_id, (_, _, _, historico) in zip(ids, planos):
+            for ordem, acao, data in historico:
+                etapa_id, setor_id = etapas[(instancia_id, ordem)]
+                movimentacoes.append((
+                    instancia_id,
+                    etapa_id,
+                    aleatorio.choice(usuarios_por_setor.get(setor_id) or [usuarios[0].id]),
+                    acoes[acao],
+                    aleatorio.choice(COMENTARIOS) if aleatorio.random() < 0.5 else "",
+                    connection.ops.adapt_datetimefield_value(data),
+                ))
+        cursor.executemany(
+            "INSERT INTO movimentacoes_fluxo (fluxo_instancia_id, etapa_id, usuario_id, acao_id, comentario, data_acao)"
+            " VALUES (%s, %s, %s, %s, %s, %s)",
+            movimentacoes,
+        )
+
+    # etapa atual e última atualização em um UPDATE por lote, como em
+    # services.criar_instancias_em_lote (o bulk_update montaria um CASE por linha)
+    FluxoInstancia.objects.filter(id__in=ids).update(
+        etapa_atual=Subquery(
+            EtapaInstancia.objects.filter(
+                fluxo_instancia=OuterRef("pk"), ordem_etapa=OuterRef("etapas_concluidas") + 1
+            ).values("id")[:1]
+        ),
+        atualizado_em=Coalesce(
+            Subquery(
+                MovimentacaoFluxo.objects.filter(fluxo_instancia=OuterRef("pk"))
+                .order_by().values("fluxo_instancia").annotate(ultima=Max("data_acao")).values("ultima")
+            ),
+            F("criado_em"),
+        ),
+    )
+    return len(etapas), len(movimentacoes)
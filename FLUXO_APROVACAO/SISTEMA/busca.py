@@ -0,0 +1,236 @@
+# SISTEMA/busca.py
+import base64
+import re
+import unicodedata
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from .models import FluxoInstancia, MovimentacaoFluxo
+from .paginacao import TAMANHO_PAGINA
+
+TIPOS = ("instancias", "comentarios")
+# termos considerados por busca (o resto do texto é ignorado)
+MAX_TERMOS = 8
+# palavras do comentário mostradas no trecho destacado
+PALAVRAS_TRECHO = 16
+
+
+# ==========================================================
+# BUSCA TEXTUAL
+# ==========================================================
+# Os índices são criados pela migração 0014: tabelas FTS5 mantidas por
+# gatilhos no SQLite e índices GIN sobre to_tsvector no PostgreSQL (sem
+# acentos desde a 0018). Todos os termos precisam aparecer; o último vale
+# como prefixo ("nota fisc"), e acentos não fazem diferença nos dois bancos.
+#
+# Todas as ocorrências são ordenadas por relevância (empate: a mais recente
+# primeiro), então nenhuma fica de fora. As páginas seguem por cursor, como em
+# SISTEMA/paginacao.py: a (relevância, id) da última linha vista filtra a
+# próxima página, em vez de um OFFSET que descarta as anteriores. A ordenação
+# ainda precisa de todas as ocorrências, então o custo cresce com elas: cerca
+# de 80 ms para um termo presente em 45 mil comentários.
+
+def termos_da_busca(texto):
+    """Palavras da busca, sem operadores: o texto do usuário nunca vai cru para o MATCH."""
+    return re.findall(r"\w+", (texto or "").lower())[:MAX_TERMOS]
+
+
+def buscar(texto, tipo="instancias", cursor=None, tamanho=TAMANHO_PAGINA):
+    """
+    Retorna (resultados, proximo_cursor), em ordem de relevância. `instancias`
+    procura no nome da instância, do modelo e da etapa atual e devolve
+    FluxoInstancia; `comentarios` procura nos comentários das movimentações e
+    devolve MovimentacaoFluxo com o atributo `trecho` (HTML com <mark>).
+    """
+    termos = termos_da_busca(texto)
+    if not termos or tipo not in TIPOS:
+        return [], None
+
+    consultar = _BUSCAS[connection.vendor][tipo]
+    # uma linha a mais só para saber se existe próxima página
+    linhas = consultar(termos, tamanho + 1, _decodificar_cursor(cursor))
+    proximo_cursor = _codificar_cursor(*linhas[tamanho - 1]) if len(linhas) > tamanho else None
+    ids = [id_ for id_, _ in linhas[:tamanho]]
+
+    if tipo == "instancias":
+        instancias = FluxoInstancia.objects.select_related("modelo", "etapa_atual").in_bulk(ids)
+        return [instancias[id_] for id_ in ids if id_ in instancias], proximo_cursor
+
+    movimentacoes = MovimentacaoFluxo.objects.select_related(
+        "fluxo_instancia__modelo", "etapa", "usuario"
+    ).in_bulk(ids)
+    resultados = []
+    for id_ in ids:
+        if id_ in movimentacoes:
+            movimentacoes[id_].trecho = trecho_destacado(movimentacoes[id_].comentario, termos)
+            resultados.append(movimentacoes[id_])
+    return resultados, proximo_cursor
+
+
+def _codificar_cursor(id_, relevancia):
+    # repr() de um float volta exatamente ao mesmo valor, então o empate na relevância é exato
+    return base64.urlsafe_b64encode(f"{relevancia!r}|{id_}".encode()).decode()
+
+
+def _decodificar_cursor(cursor):
+    """(relevância, id) do cursor, ou None (primeira página) se vazio ou inválido."""
+    if not cursor:
+        return None
+    try:
+        relevancia, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return float(relevancia), int(id_)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _normalizar(palavra):
+    # como o tokenizador do índice: sem acentos e sem diferenciar maiúsculas
+    return "".join(c for c in unicodedata.normalize("NFKD", palavra) if not unicodedata.combining(c)).casefold()
+
+
+def trecho_destacado(texto, termos):
+    """
+    Trecho do texto em volta da primeira ocorrência, com as palavras que
+    começam por algum termo dentro de <mark>. Feito aqui, e não com
+    snippet()/ts_headline, para só custar nas linhas da página.
+    """
+    texto = texto or ""
+    termos = [_normalizar(t) for t in termos]
+    palavras = list(re.finditer(r"\w+", texto))
+    achou = [any(_normalizar(p.group()).startswith(t) for t in termos) for p in palavras]
+    if not palavras:
+        return escape(texto)
+
+    primeira = achou.index(True) if True in achou else 0
+    inicio = max(primeira - 3, 0)
+    fim = min(inicio + PALAVRAS_TRECHO, len(palavras))
+    partes = ["…"] if inicio > 0 else []
+    posicao = palavras[inicio].start()
+    for palavra, destacar in zip(palavras[inicio:fim], achou[inicio:fim]):
+        partes.append(escape(texto[posicao:palavra.start()]))
+        partes.append(f"<mark>{escape(palavra.group())}</mark>" if destacar else escape(palavra.group()))
+        posicao = palavra.end()
+    partes.append(escape(texto[posicao:]) if fim == len(palavras) else "…")
+    return mark_safe("".join(partes))
+
+
+def _executar(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+# ==========================================================
+# SQLITE (FTS5)
+# ==========================================================
+def _match_fts5(termos):
+    # \w+ não tem aspas nem operadores, então cada termo entra como frase.
+    # Só o último é prefixo: prefixos leem a lista inteira de documentos do termo
+    return " ".join([f'"{termo}"' for termo in termos[:-1]] + [f'"{termos[-1]}"*'])
+
+
+def _depois_sqlite(posicao):
+    # rank do FTS5: quanto menor, mais relevante
+    if posicao is None:
+        return "", []
+    rank, rowid = posicao
+    return "AND (rank > %s OR (rank = %s AND rowid < %s))", [rank, rank, rowid]
+
+
+def _instancias_sqlite(termos, limite, posicao):
+    # peso maior para o nome da instância do que para modelo e etapa
+    depois, params = _depois_sqlite(posicao)
+    return _executar(
+        f"""
+        SELECT rowid, rank FROM busca_instancias
+        WHERE busca_instancias MATCH %s AND rank MATCH 'bm25(10.0, 2.0, 1.0)' {depois}
+        ORDER BY rank, rowid DESC
+        LIMIT %s
+        """,
+        [_match_fts5(termos), *params, limite],
+    )
+
+
+def _comentarios_sqlite(termos, limite, posicao):
+    depois, params = _depois_sqlite(posicao)
+    return _executar(
+        f"""
+        SELECT rowid, rank FROM busca_comentarios
+        WHERE busca_comentarios MATCH %s {depois}
+        ORDER BY rank, rowid DESC
+        LIMIT %s
+        """,
+        [_match_fts5(termos), *params, limite],
+    )
+
+
+# ==========================================================
+# POSTGRESQL (TSVECTOR + GIN)
+# ==========================================================
+# to_tsvector('portuguese', busca_sem_acentos(...)) precisa ser idêntico à
+# expressão dos índices da migração 0018, senão o PostgreSQL não os usa. A
+# busca também passa por busca_sem_acentos, para "orcamento" achar "orçamento".
+
+def _tsquery(termos):
+    return " & ".join(termos[:-1] + [f"{termos[-1]}:*"])
+
+
+def _depois_postgresql(posicao, clausula, relevancia):
+    # ts_rank: quanto maior, mais relevante
+    if posicao is None:
+        return "", []
+    valor, id_ = posicao
+    return f"{clausula} ({relevancia} < %s OR ({relevancia} = %s AND id < %s))", [valor, valor, id_]
+
+
+def _instancias_postgresql(termos, limite, posicao):
+    # uma consulta por coluna indexada; a instância soma a relevância de cada uma
+    depois, params = _depois_postgresql(posicao, "HAVING", "SUM(relevancia)")
+    return _executar(
+        f"""
+        WITH q AS (SELECT to_tsquery('portuguese', busca_sem_acentos(%s)) AS consulta)
+        SELECT id, SUM(relevancia) FROM (
+            SELECT i.id, ts_rank(to_tsvector('portuguese', busca_sem_acentos(i.nome)), q.consulta) * 1.0 AS relevancia
+            FROM fluxos_instancia i, q
+            WHERE to_tsvector('portuguese', busca_sem_acentos(i.nome)) @@ q.consulta
+            UNION ALL
+            SELECT i.id, ts_rank(to_tsvector('portuguese', busca_sem_acentos(p.nome)), q.consulta) * 0.2
+            FROM fluxos_padrao p JOIN fluxos_instancia i ON i.modelo_id = p.id, q
+            WHERE to_tsvector('portuguese', busca_sem_acentos(p.nome)) @@ q.consulta
+            UNION ALL
+            SELECT i.id, ts_rank(to_tsvector('portuguese', busca_sem_acentos(e.nome)), q.consulta) * 0.1
+            FROM etapas_instancia e JOIN fluxos_instancia i ON i.etapa_atual_id = e.id, q
+            WHERE to_tsvector('portuguese', busca_sem_acentos(e.nome)) @@ q.consulta
+        ) encontrados
+        GROUP BY id
+        {depois}
+        ORDER BY SUM(relevancia) DESC, id DESC
+        LIMIT %s
+        """,
+        [_tsquery(termos), *params, limite],
+    )
+
+
+def _comentarios_postgresql(termos, limite, posicao):
+    depois, params = _depois_postgresql(posicao, "WHERE", "relevancia")
+    return _executar(
+        f"""
+        WITH q AS (SELECT to_tsquery('portuguese', busca_sem_acentos(%s)) AS consulta)
+        SELECT id, relevancia FROM (
+            SELECT m.id, ts_rank(to_tsvector('portuguese', busca_sem_acentos(COALESCE(m.comentario, ''))), q.consulta) AS relevancia
+            FROM movimentacoes_fluxo m, q
+            WHERE to_tsvector('portuguese', busca_sem_acentos(COALESCE(m.comentario, ''))) @@ q.consulta
+        ) encontrados
+        {depois}
+        ORDER BY relevancia DESC, id DESC
+        LIMIT %s
+        """,
+        [_tsquery(termos), *params, limite],
+    )
+
+
+_BUSCAS = {
+    "sqlite": {"instancias": _instancias_sqlite, "comentarios": _comentarios_sqlite},
+    "postgresql": {"instancias": _instancias_postgresql, "comentarios": _comentarios_postgresql},
+}
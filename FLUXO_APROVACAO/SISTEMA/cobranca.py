@@ -0,0 +1,271 @@
+# SISTEMA/cobranca.py
+import asyncio
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+
+# ==========================================================
+# ERROS
+# ==========================================================
+class ErroCobranca(Exception):
+    """O AbacatePay não criou a cobrança (erro de rede, HTTP ou resposta inesperada)."""
+
+
+class CircuitoAberto(ErroCobranca):
+    """Muitas falhas seguidas: as chamadas ficam suspensas por alguns segundos."""
+
+
+# ==========================================================
+# CIRCUIT BREAKER
+# ==========================================================
+class Disjuntor:
+    """
+    Abre depois de `limite_falhas` falhas seguidas e recusa chamadas por
+    `tempo_aberto` segundos. Depois disso deixa uma chamada passar (meio-aberto)
+    e recusa as outras até ela terminar: sucesso fecha o circuito, falha abre de novo.
+    """
+
+    def __init__(self, limite_falhas=5, tempo_aberto=30.0):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.falhas = 0
+        self.aberto_ate = 0.0  # 0 = fechado
+        self.meio_aberto = False
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        with self._lock:
+            if not self.aberto_ate:
+                return True
+            if self.meio_aberto or time.monotonic() < self.aberto_ate:
+                return False
+            # a chamada de teste: só ela passa até registrar sucesso ou falha
+            self.meio_aberto = True
+            return True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self.falhas = 0
+            self.aberto_ate = 0.0
+            self.meio_aberto = False
+
+    def registrar_falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.meio_aberto or self.falhas >= self.limite_falhas:
+                self.aberto_ate = time.monotonic() + self.tempo_aberto
+                self.meio_aberto = False
+
+
+# ==========================================================
+# MÉTRICAS
+# ==========================================================
+class Metricas:
+    """Contadores de latência das chamadas ao AbacatePay (por processo)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.chamadas = 0
+        self.erros = 0
+        self.recusadas = 0
+        self.tempo_total = 0.0
+        self.tempo_maximo = 0.0
+
+    def registrar(self, duracao, erro=False):
+        with self._lock:
+            self.chamadas += 1
+            self.erros += int(erro)
+            self.tempo_total += duracao
+            self.tempo_maximo = max(self.tempo_maximo, duracao)
+
+    def registrar_recusa(self):
+        with self._lock:
+            self.recusadas += 1
+
+    def resumo(self):
+        with self._lock:
+            return {
+                'chamadas': self.chamadas,
+                'erros': self.erros,
+                'recusadas': self.recusadas,
+                'tempo_medio_ms': 1000 * self.tempo_total / self.chamadas if self.chamadas else 0.0,
+                'tempo_maximo_ms': 1000 * self.tempo_maximo,
+                'tempo_total_s': self.tempo_total,
+            }
+
+
+# ==========================================================
+# CLIENTES
+# ==========================================================
+# Criar cobrança é POST e não é idempotente: depois de um timeout de leitura,
+# 502 ou 504 o gateway pode já ter criado a cobrança, e repetir cobraria duas
+# vezes. Só se repete o que garantidamente não foi processado: falha ao
+# conectar (o pedido nem saiu) e 503 (serviço recusou o pedido).
+STATUS_REPETIR = (503,)
+
+
+class _BaseCliente:
+    """Regras comuns aos clientes síncrono e assíncrono: disjuntor, métricas e leitura da resposta."""
+
+    def __init__(self, url_base, api_key, disjuntor=None, metricas=None):
+        self.url_base = url_base.rstrip('/')
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+        self.disjuntor = disjuntor or Disjuntor()
+        self.metricas = metricas or Metricas()
+
+    def _verificar_disjuntor(self):
+        if not self.disjuntor.permitir():
+            self.metricas.registrar_recusa()
+            raise CircuitoAberto('Pagamentos indisponíveis no momento. Tente novamente em instantes.')
+
+    def _interpretar(self, status_code, data, inicio):
+        if status_code >= 500:
+            self._falhou(inicio)
+            raise ErroCobranca(f'AbacatePay respondeu {status_code}: {data}')
+
+        # erro 4xx é do nosso pedido, não do serviço: não conta para o disjuntor
+        self.disjuntor.registrar_sucesso()
+        self.metricas.registrar(time.perf_counter() - inicio)
+        if not (isinstance(data, dict) and data.get("data") and "url" in data["data"]):
+            raise ErroCobranca(f'Erro ao criar checkout: {data}')
+        return data["data"]
+
+    def _falhou(self, inicio):
+        self.disjuntor.registrar_falha()
+        self.metricas.registrar(time.perf_counter() - inicio, erro=True)
+
+
+class ClienteAbacatePay(_BaseCliente):
+    """
+    Cliente HTTP compartilhado: uma Session com pool de conexões keep-alive
+    (sem novo handshake TLS a cada checkout), novas tentativas com backoff para
+    falhas de conexão e 503 (ver STATUS_REPETIR), disjuntor e métricas de latência.
+    """
+
+    def __init__(self, url_base, api_key, timeout=(3.05, 10), tentativas=2, backoff=0.3,
+                 tamanho_pool=20, limite_falhas=5, tempo_aberto=30.0):
+        super().__init__(url_base, api_key, Disjuntor(limite_falhas, tempo_aberto))
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        retry = Retry(
+            total=tentativas,
+            connect=tentativas,
+            read=0,  # o pedido já chegou ao gateway
+            other=0,
+            status=tentativas,
+            backoff_factor=backoff,
+            status_forcelist=STATUS_REPETIR,
+            allowed_methods=None,  # POST incluído: connect e status já limitam o que se repete
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=tamanho_pool, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def criar_cobranca(self, payload):
+        """Cria a cobrança e retorna o `data` da resposta (com a `url` do checkout)."""
+        self._verificar_disjuntor()
+
+        inicio = time.perf_counter()
+        try:
+            response = self.session.post(f'{self.url_base}/billing/create', json=payload, timeout=self.timeout)
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            self._falhou(inicio)
+            raise ErroCobranca(f'Falha na comunicação com o AbacatePay: {e}') from e
+
+        return self._interpretar(response.status_code, data, inicio)
+
+
+class ClienteAbacatePayAsync(_BaseCliente):
+    """
+    Versão assíncrona (httpx) para as views ASGI. Um AsyncClient só pode ser usado
+    no event loop em que foi criado, por isso há um cliente por loop (ver
+    obter_cliente_async); disjuntor e métricas são os mesmos do cliente síncrono.
+    """
+
+    def __init__(self, url_base, api_key, disjuntor=None, metricas=None, timeout=(3.05, 10),
+                 tentativas=2, backoff=0.3, tamanho_pool=100):
+        super().__init__(url_base, api_key, disjuntor, metricas)
+        self.tentativas = tentativas
+        self.backoff = backoff
+        limites = httpx.Limits(max_connections=tamanho_pool, max_keepalive_connections=tamanho_pool)
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+            limits=limites,
+            # o transporte só repete ConnectError/ConnectTimeout (o pedido não saiu);
+            # o 503 é repetido abaixo
+            transport=httpx.AsyncHTTPTransport(retries=tentativas, limits=limites),
+        )
+
+    async def criar_cobranca(self, payload):
+        self._verificar_disjuntor()
+
+        inicio = time.perf_counter()
+        try:
+            for tentativa in range(self.tentativas + 1):
+                response = await self.client.post(f'{self.url_base}/billing/create', json=payload)
+                if response.status_code not in STATUS_REPETIR or tentativa == self.tentativas:
+                    break
+                await asyncio.sleep(self.backoff * (2 ** tentativa))
+            data = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            self._falhou(inicio)
+            raise ErroCobranca(f'Falha na comunicação com o AbacatePay: {e}') from e
+
+        return self._interpretar(response.status_code, data, inicio)
+
+
+_cliente = None
+_cliente_lock = threading.Lock()
+_clientes_async = weakref.WeakKeyDictionary()
+
+
+def obter_cliente():
+    """Cliente único por processo, criado na primeira chamada."""
+    global _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                _cliente = ClienteAbacatePay(settings.ABACATEPAY_BASE_URL, settings.ABACATEPAY_API_KEY)
+    return _cliente
+
+
+def obter_cliente_async():
+    """Cliente assíncrono do event loop atual (um worker ASGI usa sempre o mesmo)."""
+    loop = asyncio.get_running_loop()
+    cliente = _clientes_async.get(loop)
+    if cliente is None:
+        sincrono = obter_cliente()
+        cliente = ClienteAbacatePayAsync(
+            settings.ABACATEPAY_BASE_URL, settings.ABACATEPAY_API_KEY, sincrono.disjuntor, sincrono.metricas
+        )
+        _clientes_async[loop] = cliente
+    return cliente
+
+
+def metricas_do_cliente():
+    """Métricas do cliente do processo, sem criá-lo (None se ainda não foi usado)."""
+    cliente = _cliente
+    return cliente.metricas if cliente is not None else None
+
+
+def redefinir_clientes():
+    """Descarta os clientes criados (ex.: depois de trocar ABACATEPAY_BASE_URL)."""
+    global _cliente
+    with _cliente_lock:
+        _cliente = None
+        _clientes_async.clear()
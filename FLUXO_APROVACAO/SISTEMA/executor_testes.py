@@ -0,0 +1,30 @@
+# SISTEMA/executor_testes.py
+import logging
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+# ==========================================================
+# EXECUTOR DE "manage.py test"
+# ==========================================================
+# A instrumentação (SISTEMA/instrumentacao.py) escreve no log as requisições
+# amostradas e as lentas, o que se misturaria com a saída dos testes. Aqui a
+# amostragem começa desligada e o log dela só mostra ERROR. Os testes da
+# instrumentação ligam a amostragem com override_settings e leem o log com
+# assertLogs, que baixa o nível enquanto dura. Com --verbosity 2 o log aparece.
+
+class ExecutorTestes(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._sem_amostragem = override_settings(INSTRUMENTACAO_AMOSTRA=0.0)
+        self._sem_amostragem.enable()
+        logger = logging.getLogger("SISTEMA.instrumentacao")
+        self._nivel_log = logger.level
+        if self.verbosity < 2:
+            logger.setLevel(logging.ERROR)
+
+    def teardown_test_environment(self, **kwargs):
+        logging.getLogger("SISTEMA.instrumentacao").setLevel(self._nivel_log)
+        self._sem_amostragem.disable()
+        super().teardown_test_environment(**kwargs)
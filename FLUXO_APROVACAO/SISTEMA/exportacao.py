@@ -0,0 +1,126 @@
+# SISTEMA/exportacao.py
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from .arquivamento import ler_arquivado
+from .models import FluxoArquivado, MovimentacaoFluxo, Setor
+
+# linhas lidas do banco por vez: memória constante, qualquer que seja o total
+TAMANHO_LOTE = 2000
+
+# coluna do arquivo -> campo consultado (nomes já resolvidos pelos JOINs)
+COLUNAS = {
+    "id": "id",
+    "data_acao": "data_acao",
+    "instancia_id": "fluxo_instancia_id",
+    "instancia": "fluxo_instancia__nome",
+    "modelo": "fluxo_instancia__modelo__nome",
+    "ordem_etapa": "etapa__ordem_etapa",
+    "etapa": "etapa__nome",
+    "setor": "etapa__setor__nome",
+    "usuario": "usuario__username",
+    "acao": "acao__nome",
+    "comentario": "comentario",
+}
+
+
+# ==========================================================
+# CONSULTA
+# ==========================================================
+def movimentacoes_para_exportar(inicio=None, fim=None, modelo_id=None, setor_id=None):
+    """
+    Gera as movimentações (tuplas na ordem de COLUNAS) com instância, modelo,
+    etapa, setor, usuário e ação já resolvidos. `inicio` e `fim` são datas
+    (inclusive). Primeiro as das tabelas de trabalho, em ordem de id; depois
+    as dos fluxos arquivados, fluxo a fluxo.
+    """
+    yield from _movimentacoes(inicio, fim, modelo_id, setor_id).iterator(chunk_size=TAMANHO_LOTE)
+    yield from _movimentacoes_arquivadas(inicio, fim, modelo_id, setor_id)
+
+
+def _movimentacoes(inicio, fim, modelo_id, setor_id):
+    movimentacoes = MovimentacaoFluxo.objects.all()
+    if inicio:
+        movimentacoes = movimentacoes.filter(data_acao__gte=_inicio_do_dia(inicio))
+    if fim:
+        movimentacoes = movimentacoes.filter(data_acao__lt=_inicio_do_dia(fim + timedelta(days=1)))
+    if modelo_id:
+        movimentacoes = movimentacoes.filter(fluxo_instancia__modelo_id=modelo_id)
+    if setor_id:
+        movimentacoes = movimentacoes.filter(etapa__setor_id=setor_id)
+    return movimentacoes.order_by("id").values_list(*COLUNAS.values())
+
+
+def _movimentacoes_arquivadas(inicio, fim, modelo_id, setor_id):
+    # o arquivo guarda só o nome do setor de cada etapa
+    setor = None
+    if setor_id:
+        setor = Setor.objects.filter(id=setor_id).values_list("nome", flat=True).first()
+        if setor is None:
+            return
+    de = _inicio_do_dia(inicio) if inicio else None
+    ate = _inicio_do_dia(fim + timedelta(days=1)) if fim else None
+
+    # o histórico de um fluxo fica entre a criação e a finalização
+    arquivados = FluxoArquivado.objects.all()
+    if de:
+        arquivados = arquivados.filter(finalizado_em__gte=de)
+    if ate:
+        arquivados = arquivados.filter(criado_em__lt=ate)
+    if modelo_id:
+        arquivados = arquivados.filter(modelo_id=modelo_id)
+
+    for arquivado in arquivados.order_by("id").iterator(chunk_size=TAMANHO_LOTE):
+        instancia, etapas, movimentacoes = ler_arquivado(arquivado)
+        setores = {e.ordem_etapa: e.setor.nome if e.setor else None for e in etapas}
+        for mov in reversed(movimentacoes):
+            ordem = mov.etapa.ordem_etapa if mov.etapa else None
+            if (de and mov.data_acao < de) or (ate and mov.data_acao >= ate) or (setor and setores.get(ordem) != setor):
+                continue
+            yield (
+                mov.id, mov.data_acao, instancia.id, instancia.nome, instancia.modelo.nome,
+                ordem, mov.etapa.nome if mov.etapa else None, setores.get(ordem),
+                mov.usuario.username if mov.usuario else None, mov.acao.nome if mov.acao else None, mov.comentario,
+            )
+
+
+def _inicio_do_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+# ==========================================================
+# FORMATOS
+# ==========================================================
+class _Eco:
+    """'Arquivo' que devolve o que recebe: o csv.writer vira um gerador de linhas."""
+
+    def write(self, valor):
+        return valor
+
+
+def linhas_csv(movimentacoes):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(COLUNAS)
+    for linha in movimentacoes:
+        yield escritor.writerow(_formatar(linha))
+
+
+def linhas_jsonl(movimentacoes):
+    for linha in movimentacoes:
+        yield json.dumps(dict(zip(COLUNAS, _formatar(linha))), ensure_ascii=False) + "\n"
+
+
+def _formatar(linha):
+    # datas no fuso do sistema, em ISO 8601
+    return [
+        timezone.localtime(valor).isoformat() if isinstance(valor, datetime) else valor
+        for valor in linha
+    ]
+
+
+FORMATOS = {
+    "csv": (linhas_csv, "text/csv; charset=utf-8"),
+    "jsonl": (linhas_jsonl, "application/x-ndjson; charset=utf-8"),
+}
@@ -0,0 +1,166 @@
+# SISTEMA/fila.py
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from .models import EventoWebhook, Pagamento, Assinatura, Usuario
+from .planos import DURACAO_PLANO
+
+logger = logging.getLogger(__name__)
+
+# depois de MAX_TENTATIVAS falhas o evento fica em "erro" e sai da fila
+MAX_TENTATIVAS = 5
+# espera antes de repetir um evento que falhou: dobra a cada falha, até o máximo
+ESPERA_INICIAL = timedelta(minutes=1)
+ESPERA_MAXIMA = timedelta(hours=1)
+# evento preso em "processando" por mais que isso volta para a fila (worker caiu)
+TEMPO_MAXIMO_PROCESSANDO = timedelta(minutes=10)
+
+# externalId do produto -> plano
+PLANOS_POR_PRODUTO = {
+    "1": "prata",
+    "2": "ouro",
+}
+
+
+# ==========================================================
+# ENTRADA (CHAMADA PELO WEBHOOK)
+# ==========================================================
+def enfileirar_evento(payload, corpo):
+    """
+    Guarda o evento cru para processamento posterior.
+    Retorna (evento, criado); criado=False quando o mesmo event_id já foi recebido.
+    """
+    return EventoWebhook.objects.get_or_create(**_dados_evento(payload, corpo))
+
+
+async def aenfileirar_evento(payload, corpo):
+    """Versão assíncrona de enfileirar_evento, para a view ASGI."""
+    return await EventoWebhook.objects.aget_or_create(**_dados_evento(payload, corpo))
+
+
+def _dados_evento(payload, corpo):
+    event_id = payload.get("id") or hashlib.sha256(corpo).hexdigest()
+    return {
+        "event_id": str(event_id),
+        "defaults": {"tipo": payload.get("event") or "", "payload": payload},
+    }
+
+
+# ==========================================================
+# PROCESSAMENTO (CHAMADO PELO WORKER)
+# ==========================================================
+def processar_pendentes(limite=100):
+    """
+    Processa até `limite` eventos pendentes cuja próxima tentativa já chegou,
+    na ordem em que ficaram disponíveis. Retorna quantos processou.
+    """
+    agora = timezone.now()
+    EventoWebhook.objects.filter(
+        status="processando", reservado_em__lt=agora - TEMPO_MAXIMO_PROCESSANDO
+    ).update(status="pendente")
+
+    ids = list(
+        EventoWebhook.objects.filter(status="pendente", proxima_tentativa_em__lte=agora)
+        .order_by("proxima_tentativa_em", "id")
+        .values_list("id", flat=True)[:limite]
+    )
+    processados = 0
+    for evento_id in ids:
+        # reserva o evento; outro worker pode tê-lo pego antes
+        reservado = EventoWebhook.objects.filter(id=evento_id, status="pendente").update(
+            status="processando", reservado_em=timezone.now()
+        )
+        if not reservado:
+            continue
+        processar_evento(EventoWebhook.objects.get(id=evento_id))
+        processados += 1
+    return processados
+
+
+def processar_evento(evento):
+    try:
+        with transaction.atomic():
+            status = _aplicar_evento(evento)
+    except Exception as e:
+        logger.exception("Falha ao processar evento %s", evento.event_id)
+        evento.tentativas += 1
+        evento.erro = str(e)
+        if evento.tentativas >= MAX_TENTATIVAS:
+            # estado final: só volta à fila se alguém o marcar como "pendente" de novo
+            evento.status = "erro"
+        else:
+            evento.status = "pendente"
+            evento.proxima_tentativa_em = timezone.now() + espera_apos(evento.tentativas)
+        evento.save(update_fields=["tentativas", "erro", "status", "proxima_tentativa_em"])
+        return
+
+    evento.status = status
+    evento.erro = None
+    evento.processado_em = timezone.now()
+    evento.save(update_fields=["status", "erro", "processado_em"])
+
+
+def espera_apos(tentativas):
+    """Espera antes da próxima tentativa, depois de `tentativas` falhas (1 min, 2, 4, ...)."""
+    return min(ESPERA_INICIAL * 2 ** (tentativas - 1), ESPERA_MAXIMA)
+
+
+def _aplicar_evento(evento):
+    """Aplica o evento no banco e retorna o status final ('processado' ou 'ignorado')."""
+    payload = evento.payload
+
+    # Só processa pagamento confirmado
+    if payload.get("event") != "billing.paid":
+        return "ignorado"
+
+    dados = payload.get("data") or {}
+    billing = dados.get("billing") or {}
+    pagamento_dados = dados.get("payment") or {}
+    products = billing.get("products", [])
+    metadata = billing.get("metadata", {})
+
+    # Pega usuário_id do metadata (o mais importante!)
+    usuario_id = metadata.get("usuario_id")
+    if not usuario_id:
+        logger.warning("Evento %s sem metadata.usuario_id", evento.event_id)
+        return "ignorado"
+
+    usuario = Usuario.objects.filter(id=usuario_id).first()
+    if usuario is None:
+        logger.warning("Evento %s: usuário %s não encontrado", evento.event_id, usuario_id)
+        return "ignorado"
+
+    # a mesma cobrança já foi registrada por outro evento
+    billing_id = billing.get("id")
+    if billing_id and Pagamento.objects.filter(billing_id=billing_id).exists():
+        return "ignorado"
+
+    # Mapea externalId → plano
+    external_id = products[0].get("externalId") if products else None
+    plano = PLANOS_POR_PRODUTO.get(str(external_id), "freemium")
+
+    # Cria ou atualiza assinatura
+    assinatura, _ = Assinatura.objects.update_or_create(
+        usuario=usuario,
+        defaults={
+            "plano": plano,
+            "status": "ativo",
+            "data_inicio": timezone.localdate(),
+            "data_fim": timezone.localdate() + DURACAO_PLANO,
+        }
+    )
+
+    Pagamento.objects.create(
+        usuario=usuario,
+        assinatura=assinatura,
+        billing_id=billing_id,
+        event_id=evento.event_id,
+        amount=pagamento_dados.get("amount") or billing.get("amount") or 0,
+        method=pagamento_dados.get("method"),
+        fee=pagamento_dados.get("fee"),
+        raw_payload=payload,
+    )
+    return "processado"
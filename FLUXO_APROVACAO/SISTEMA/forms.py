@@ -2,6 +2,8 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import Group
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import timedelta
 from .models import Usuario, Setor, FluxoPadrao
 
 
@@ -75,3 +77,139 @@ class FluxoPadraoForm(forms.ModelForm):
 class InstanciaFluxoForm(forms.Form):
     fluxo_padrao = forms.ModelChoiceField(queryset=FluxoPadrao.objects.all(), widget=forms.Select(attrs={'class': 'form-control'}))
     nome_instancia = forms.CharField(max_length=200, widget=forms.TextInput(attrs={'class': 'form-control'}))
+
+
+# ==========================================================
+# ETAPAS DO MODELO DE FLUXO
+# ==========================================================
+# modelos reais chegam a 60 etapas; o limite só barra listas absurdas
+MAX_ETAPAS = 200
+
+
+class EtapaFluxoForm(forms.Form):
+    # id de uma etapa existente (edição); vazio para etapa nova
+    id = forms.IntegerField(required=False, widget=forms.HiddenInput)
+    nome = forms.CharField(max_length=200, label="Nome da Etapa")
+    setor = forms.TypedChoiceField(coerce=int, required=False, empty_value=None, label="Setor")
+    perfil_aprovador = forms.ChoiceField(
+        choices=[("padrao", "Padrão"), ("administrador", "Administrador")],
+        required=False,
+        label="Perfil aprovador",
+    )
+
+    def __init__(self, *args, setores=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['setor'].choices = [("", "—")] + list(setores)
+
+    def clean_perfil_aprovador(self):
+        return self.cleaned_data['perfil_aprovador'] or "padrao"
+
+
+class BaseEtapaFluxoFormSet(forms.BaseFormSet):
+    """
+    Valida as etapas enviadas de uma vez. Os setores são lidos em uma única
+    consulta e repassados aos formulários, em vez de um ModelChoiceField por etapa.
+    """
+
+    def __init__(self, *args, etapas_existentes=(), **kwargs):
+        self.etapas_existentes = set(etapas_existentes)
+        self.setores = list(Setor.objects.order_by('nome').values_list('id', 'nome'))
+        super().__init__(*args, **kwargs)
+
+    def get_form_kwargs(self, index):
+        return {**super().get_form_kwargs(index), 'setores': self.setores}
+
+    def clean(self):
+        if any(self.errors):
+            return
+        ids = [f.cleaned_data['id'] for f in self.forms if f.cleaned_data.get('id')]
+        if len(ids) != len(set(ids)):
+            raise forms.ValidationError("A mesma etapa foi enviada mais de uma vez.")
+        if not set(ids) <= self.etapas_existentes:
+            raise forms.ValidationError("Etapa não pertence a este modelo de fluxo.")
+
+    def etapas(self):
+        """Etapas válidas na ordem final (campo ORDER), sem as marcadas para exclusão."""
+        return [form.cleaned_data for form in self.ordered_forms]
+
+
+EtapaFluxoFormSet = forms.formset_factory(
+    EtapaFluxoForm,
+    formset=BaseEtapaFluxoFormSet,
+    extra=0,
+    min_num=1,
+    validate_min=True,
+    max_num=MAX_ETAPAS,
+    validate_max=True,
+    can_order=True,
+    can_delete=True,
+)
+
+
+def dados_formset_etapas(etapas, prefixo='etapas'):
+    """
+    Converte a lista de etapas de um payload JSON ([{"nome", "setor", ...}], já na
+    ordem desejada) nos dados de POST que o EtapaFluxoFormSet espera.
+    """
+    if not isinstance(etapas, list):
+        etapas = []
+    dados = {
+        f'{prefixo}-TOTAL_FORMS': str(len(etapas)),
+        f'{prefixo}-INITIAL_FORMS': '0',
+    }
+    for i, etapa in enumerate(etapas):
+        if not isinstance(etapa, dict):
+            etapa = {}
+        for campo in ('id', 'nome', 'setor', 'perfil_aprovador'):
+            valor = etapa.get(campo)
+            dados[f'{prefixo}-{i}-{campo}'] = '' if valor is None else str(valor)
+        dados[f'{prefixo}-{i}-ORDER'] = str(i + 1)
+    return dados
+
+
+# ==========================================================
+# EXPORTAÇÃO DO HISTÓRICO
+# ==========================================================
+class FiltroExportacaoForm(forms.Form):
+    formato = forms.ChoiceField(choices=[("csv", "CSV"), ("jsonl", "JSON Lines")], required=False)
+    inicio = forms.DateField(required=False)
+    fim = forms.DateField(required=False)
+    modelo = forms.ModelChoiceField(queryset=FluxoPadrao.objects.all(), required=False)
+    setor = forms.ModelChoiceField(queryset=Setor.objects.all(), required=False)
+
+    def clean(self):
+        dados = super().clean()
+        if dados.get("inicio") and dados.get("fim") and dados["inicio"] > dados["fim"]:
+            raise forms.ValidationError("A data inicial é posterior à final.")
+        dados["formato"] = dados.get("formato") or "csv"
+        return dados
+
+    def filtros(self):
+        """Argumentos de exportacao.movimentacoes_para_exportar."""
+        dados = self.cleaned_data
+        return {
+            "inicio": dados["inicio"],
+            "fim": dados["fim"],
+            "modelo_id": dados["modelo"].id if dados["modelo"] else None,
+            "setor_id": dados["setor"].id if dados["setor"] else None,
+        }
+
+
+# período máximo do painel de análises, em dias
+MAX_DIAS_ANALISE = 366
+
+
+class FiltroAnaliseForm(forms.Form):
+    inicio = forms.DateField(required=False)
+    fim = forms.DateField(required=False)
+
+    def clean(self):
+        dados = super().clean()
+        # sem datas: os últimos 30 dias
+        dados["fim"] = dados.get("fim") or timezone.localdate()
+        dados["inicio"] = dados.get("inicio") or dados["fim"] - timedelta(days=29)
+        if dados["inicio"] > dados["fim"]:
+            raise forms.ValidationError("A data inicial é posterior à final.")
+        if (dados["fim"] - dados["inicio"]).days >= MAX_DIAS_ANALISE:
+            raise forms.ValidationError(f"O período pode ter no máximo {MAX_DIAS_ANALISE} dias.")
+        return dados
@@ -0,0 +1,42 @@
+# SISTEMA/fragmentos.py
+import time
+
+from django.core.cache import cache
+
+# Se mudar o HTML de um fragmento em cache, troque o prefixo
+PREFIXO_CACHE = "fragmento:v2:"
+
+MODELOS_FLUXO = "modelos_fluxo"
+
+
+# ==========================================================
+# VERSÕES DOS FRAGMENTOS EM CACHE
+# ==========================================================
+# Cada grupo de fragmentos ({% cache %} nos templates) leva a versão do grupo
+# na chave. Invalidar é só trocar a versão: os fragmentos antigos deixam de ser
+# lidos e expiram sozinhos pelo TTL. Versões e fragmentos ficam no cache
+# compartilhado (settings.CACHES), então a troca feita por um processo vale
+# para todos. Quem grava chama invalidar() depois do commit (signals.py e
+# transaction.on_commit onde há bulk_create/bulk_update).
+
+def _chave(grupo):
+    return f"{PREFIXO_CACHE}{grupo}"
+
+
+def versao(grupo):
+    chave = _chave(grupo)
+    atual = cache.get(chave)
+    if atual is None:
+        # começa do relógio, e não de 1: se a chave for descartada pelo cache,
+        # a nova versão nunca coincide com a de fragmentos antigos
+        cache.add(chave, time.time_ns(), None)
+        atual = cache.get(chave)
+    return atual
+
+
+def invalidar(grupo):
+    try:
+        cache.incr(_chave(grupo))
+    except ValueError:
+        # versão ainda não existe: o próximo versao() cria uma nova
+        pass
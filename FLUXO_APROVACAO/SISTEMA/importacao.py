@@ -0,0 +1,260 @@
+# SISTEMA/importacao.py
+import csv
+import json
+import time
+from itertools import groupby, islice
+
+from django.db import transaction
+from django.utils import timezone
+from .forms import MAX_ETAPAS
+from .models import Setor, FluxoPadrao, EtapaFluxo
+from .services import criar_instancias_em_lote, etapas_do_modelo
+from . import fragmentos
+
+# registros gravados por transação
+LOTE_MODELOS = 500
+LOTE_INSTANCIAS = 5000
+# erros guardados no relatório (os demais só são contados)
+MAX_ERROS = 20
+
+PERFIS = {"padrao", "administrador"}
+FORMATOS = ("csv", "json", "jsonl")
+
+
+# ==========================================================
+# RELATÓRIO
+# ==========================================================
+class RegistroInvalido(Exception):
+    """O registro não pode ser importado; ele é descartado e entra no relatório."""
+
+
+class Relatorio:
+    """Contadores de uma importação (linhas lidas, importadas, rejeitadas e vazão)."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.lidas = 0
+        self.importadas = 0
+        self.rejeitadas = 0
+        self.lotes = 0
+        self.erros = []
+
+    def rejeitar(self, linha, motivo):
+        self.rejeitadas += 1
+        if len(self.erros) < MAX_ERROS:
+            self.erros.append({"linha": linha, "erro": motivo})
+
+    def resumo(self):
+        segundos = time.perf_counter() - self.inicio
+        return {
+            "lidas": self.lidas,
+            "importadas": self.importadas,
+            "rejeitadas": self.rejeitadas,
+            "lotes": self.lotes,
+            "segundos": round(segundos, 2),
+            "por_segundo": round(self.lidas / segundos) if segundos else 0,
+            "erros": self.erros,
+        }
+
+
+# ==========================================================
+# LEITURA DO ARQUIVO (SEM CARREGAR TUDO NA MEMÓRIA)
+# ==========================================================
+def formato_do_arquivo(nome):
+    extensao = nome.rsplit(".", 1)[-1].lower()
+    return extensao if extensao in FORMATOS else None
+
+
+def _registros(arquivo, formato, relatorio):
+    """Gera (número da linha, dict) a partir de um arquivo texto CSV, JSON Lines ou JSON."""
+    if formato == "csv":
+        leitor = csv.DictReader(arquivo)
+        for registro in leitor:
+            yield leitor.line_num, {campo.strip(): (valor or "").strip() for campo, valor in registro.items() if campo}
+    elif formato == "jsonl":
+        for numero, linha in enumerate(arquivo, start=1):
+            if not linha.strip():
+                continue
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                relatorio.lidas += 1
+                relatorio.rejeitar(numero, "JSON inválido")
+                continue
+            yield numero, registro
+    else:
+        # um array JSON precisa ser lido inteiro; para arquivos grandes use JSON Lines
+        try:
+            registros = json.load(arquivo)
+        except ValueError:
+            relatorio.lidas += 1
+            relatorio.rejeitar(1, "JSON inválido")
+            return
+        yield from enumerate(registros if isinstance(registros, list) else [registros], start=1)
+
+
+def _em_lotes(iteravel, tamanho):
+    iterador = iter(iteravel)
+    while lote := list(islice(iterador, tamanho)):
+        yield lote
+
+
+def _mapa_setores():
+    """Nome do setor (sem diferenciar maiúsculas) -> id, lido uma única vez."""
+    return {nome.casefold(): id_ for id_, nome in Setor.objects.values_list("id", "nome")}
+
+
+# ==========================================================
+# MODELOS DE FLUXO
+# ==========================================================
+def importar_modelos(arquivo, formato, usuario=None, lote=LOTE_MODELOS, ao_concluir_lote=None):
+    """
+    Importa modelos com suas etapas. JSON/JSON Lines: um objeto por modelo,
+    {"nome", "descricao", "etapas": [{"nome", "setor", "perfil_aprovador"}]}.
+    CSV: uma linha por etapa (colunas modelo, descricao, etapa, setor,
+    perfil_aprovador); linhas seguidas do mesmo modelo formam um modelo, na ordem do arquivo.
+    """
+    relatorio = Relatorio()
+    setores = _mapa_setores()
+    registros = _registros(arquivo, formato, relatorio)
+    if formato == "csv":
+        registros = _agrupar_etapas_csv(registros)
+
+    for registros_lote in _em_lotes(registros, lote):
+        validos = []
+        for linha, registro in registros_lote:
+            relatorio.lidas += 1
+            try:
+                validos.append(_modelo_valido(registro, setores))
+            except RegistroInvalido as e:
+                relatorio.rejeitar(linha, str(e))
+
+        _gravar_modelos(validos, usuario)
+        relatorio.importadas += len(validos)
+        relatorio.lotes += 1
+        if ao_concluir_lote:
+            ao_concluir_lote(relatorio)
+    return relatorio
+
+
+def _agrupar_etapas_csv(registros):
+    for _, linhas in groupby(registros, key=lambda item: item[1].get("modelo", "")):
+        linhas = list(linhas)
+        primeira = linhas[0][1]
+        yield linhas[0][0], {
+            "nome": primeira.get("modelo"),
+            "descricao": primeira.get("descricao"),
+            "etapas": [
+                {"nome": r.get("etapa"), "setor": r.get("setor"), "perfil_aprovador": r.get("perfil_aprovador")}
+                for _, r in linhas
+            ],
+        }
+
+
+def _modelo_valido(registro, setores):
+    if not isinstance(registro, dict):
+        raise RegistroInvalido("Registro não é um objeto.")
+    nome = str(registro.get("nome") or "").strip()
+    if not nome or len(nome) > 200:
+        raise RegistroInvalido("Nome do modelo vazio ou com mais de 200 caracteres.")
+    etapas = registro.get("etapas")
+    if not isinstance(etapas, list) or not 1 <= len(etapas) <= MAX_ETAPAS:
+        raise RegistroInvalido(f"O modelo precisa ter de 1 a {MAX_ETAPAS} etapas.")
+
+    validas = []
+    for ordem, etapa in enumerate(etapas, start=1):
+        if not isinstance(etapa, dict):
+            raise RegistroInvalido(f"Etapa {ordem} não é um objeto.")
+        nome_etapa = str(etapa.get("nome") or "").strip()
+        if not nome_etapa or len(nome_etapa) > 200:
+            raise RegistroInvalido(f"Etapa {ordem}: nome vazio ou com mais de 200 caracteres.")
+        setor = str(etapa.get("setor") or "").strip()
+        if setor and setor.casefold() not in setores:
+            raise RegistroInvalido(f"Etapa {ordem}: setor '{setor}' não cadastrado.")
+        perfil = etapa.get("perfil_aprovador") or "padrao"
+        if perfil not in PERFIS:
+            raise RegistroInvalido(f"Etapa {ordem}: perfil '{perfil}' inválido.")
+        validas.append({
+            "nome": nome_etapa,
+            "setor_id": setores[setor.casefold()] if setor else None,
+            "perfil_aprovador": perfil,
+        })
+    return {"nome": nome, "descricao": registro.get("descricao") or None, "etapas": validas}
+
+
+def _gravar_modelos(modelos, usuario):
+    if not modelos:
+        return
+    agora = timezone.now()
+    with transaction.atomic():
+        fluxos = FluxoPadrao.objects.bulk_create([
+            FluxoPadrao(nome=m["nome"], descricao=m["descricao"], criado_por=usuario, criado_em=agora)
+            for m in modelos
+        ])
+        EtapaFluxo.objects.bulk_create([
+            EtapaFluxo(fluxo=fluxo, ordem_etapa=ordem, criado_em=agora, **etapa)
+            for fluxo, modelo in zip(fluxos, modelos)
+            for ordem, etapa in enumerate(modelo["etapas"], start=1)
+        ])
+        # bulk_create não dispara post_save
+        transaction.on_commit(lambda: fragmentos.invalidar(fragmentos.MODELOS_FLUXO))
+
+
+# ==========================================================
+# INSTÂNCIAS
+# ==========================================================
+def importar_instancias(arquivo, formato, usuario=None, lote=LOTE_INSTANCIAS, ao_concluir_lote=None):
+    """
+    Inicia instâncias em massa. Cada registro tem `nome` e o modelo, por
+    `modelo_id` ou pelo nome em `modelo` (se houver modelos com o mesmo nome,
+    vale o mais recente). Cada lote é gravado em uma transação.
+    """
+    relatorio = Relatorio()
+    modelos_por_nome = {}
+    modelos_por_id = {}
+    for fluxo in FluxoPadrao.objects.only("id", "nome").order_by("id"):
+        modelos_por_nome[fluxo.nome] = modelos_por_id[fluxo.id] = fluxo
+    # etapas de cada modelo, lidas na primeira instância dele
+    etapas_por_modelo = {}
+
+    for registros_lote in _em_lotes(_registros(arquivo, formato, relatorio), lote):
+        por_modelo = {}
+        for linha, registro in registros_lote:
+            relatorio.lidas += 1
+            try:
+                fluxo, nome = _instancia_valida(registro, modelos_por_nome, modelos_por_id)
+            except RegistroInvalido as e:
+                relatorio.rejeitar(linha, str(e))
+                continue
+            por_modelo.setdefault(fluxo, []).append(nome)
+
+        with transaction.atomic():
+            for fluxo, nomes in por_modelo.items():
+                if fluxo.id not in etapas_por_modelo:
+                    etapas_por_modelo[fluxo.id] = etapas_do_modelo(fluxo)
+                criar_instancias_em_lote(fluxo, nomes, usuario, etapas_modelo=etapas_por_modelo[fluxo.id])
+                relatorio.importadas += len(nomes)
+        relatorio.lotes += 1
+        if ao_concluir_lote:
+            ao_concluir_lote(relatorio)
+    return relatorio
+
+
+def _instancia_valida(registro, modelos_por_nome, modelos_por_id):
+    if not isinstance(registro, dict):
+        raise RegistroInvalido("Registro não é um objeto.")
+    nome = str(registro.get("nome") or "").strip()
+    if not nome or len(nome) > 200:
+        raise RegistroInvalido("Nome da instância vazio ou com mais de 200 caracteres.")
+
+    modelo_id = registro.get("modelo_id")
+    if modelo_id not in (None, ""):
+        try:
+            fluxo = modelos_por_id.get(int(modelo_id))
+        except (TypeError, ValueError):
+            fluxo = None
+    else:
+        fluxo = modelos_por_nome.get(str(registro.get("modelo") or "").strip())
+    if fluxo is None:
+        raise RegistroInvalido("Modelo de fluxo não encontrado.")
+    return fluxo, nome
@@ -0,0 +1,397 @@
+# SISTEMA/instrumentacao.py
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# limites (segundos) dos buckets do histograma de latência
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METODOS = ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS")
+# caracteres do SQL repetido que vão para o log
+TAMANHO_SQL_LOG = 300
+
+# medição da requisição atual (só nas amostradas); os templates leem daqui
+_medicao_atual = ContextVar("medicao_atual", default=None)
+
+
+# ==========================================================
+# MEDIÇÃO DE UMA REQUISIÇÃO
+# ==========================================================
+class Medicao:
+    """
+    Consultas, tempo de banco, consultas repetidas e tempo de template de uma
+    requisição. Recebe as consultas de _medir_consulta enquanto for a medição
+    atual, em qualquer thread para onde o contexto for copiado.
+    """
+
+    def __init__(self):
+        self.consultas = 0
+        self.tempo_banco = 0.0
+        self.tempo_template = 0.0
+        self.renderizando = False
+        self._vistas = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tempo_banco += time.perf_counter() - inicio
+            self.consultas += 1
+            # executemany (bulk_create) não é N+1 e seus parâmetros podem ser enormes
+            if not many:
+                self._vistas[(sql, repr(params))] += 1
+
+    @property
+    def repetidas(self):
+        """Execuções de uma consulta idêntica (mesmo SQL e parâmetros) além da primeira."""
+        return sum(n - 1 for n in self._vistas.values() if n > 1)
+
+    def mais_repetida(self):
+        (sql, _), vezes = self._vistas.most_common(1)[0] if self._vistas else ((None, None), 0)
+        return (sql[:TAMANHO_SQL_LOG], vezes) if vezes > 1 else (None, 0)
+
+
+# Um execute_wrapper fixo em cada conexão repassa as consultas para a medição
+# do contexto atual. Com o ContextVar, as consultas feitas em sync_to_async
+# (ASGI) e durante o consumo de uma StreamingHttpResponse também contam; fora
+# das amostradas o custo é uma chamada de função a mais por consulta.
+
+def _medir_consulta(execute, sql, params, many, context):
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    return medicao(execute, sql, params, many, context)
+
+
+def _instalar(conexao):
+    if _medir_consulta not in conexao.execute_wrappers:
+        conexao.execute_wrappers.append(_medir_consulta)
+
+
+@receiver(connection_created)
+def instalar_na_conexao(sender, connection, **kwargs):
+    _instalar(connection)
+
+
+# ==========================================================
+# TEMPO DE TEMPLATE
+# ==========================================================
+# Backend de templates igual ao do Django, com o render() cronometrado quando
+# a requisição está sendo medida. Só o render de fora conta (includes e
+# render_to_string dentro dele já estão no tempo), e as consultas feitas
+# durante o render (querysets lidos no template) ficam no tempo de banco.
+
+class DjangoTemplatesMedidos(DjangoTemplates):
+    def get_template(self, template_name):
+        return _TemplateMedido(super().get_template(template_name))
+
+    def from_string(self, template_code):
+        return _TemplateMedido(super().from_string(template_code))
+
+
+class _TemplateMedido:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, nome):
+        return getattr(self.template, nome)
+
+    def render(self, context=None, request=None):
+        medicao = _medicao_atual.get()
+        if medicao is None or medicao.renderizando:
+            return self.template.render(context, request)
+        medicao.renderizando = True
+        banco_antes = medicao.tempo_banco
+        inicio = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            medicao.renderizando = False
+            medicao.tempo_template += time.perf_counter() - inicio - (medicao.tempo_banco - banco_antes)
+
+
+# ==========================================================
+# REGISTRO (POR PROCESSO)
+# ==========================================================
+class RegistroMetricas:
+    """
+    Contadores acumulados desde o início do processo, como cobranca.Metricas.
+    Latência e contagem valem para todas as requisições; banco e template, só
+    para as amostradas (divida pelas amostradas para ter a média).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requisicoes = defaultdict(int)
+        self.latencia = {}
+        self.amostras = {}
+
+    def registrar(self, view, metodo, status, duracao, medicao=None):
+        with self._lock:
+            self.requisicoes[(view, metodo, status)] += 1
+            # [contagem de cada bucket..., acima do último, soma das durações]
+            latencia = self.latencia.setdefault(view, [0] * (len(BUCKETS_LATENCIA) + 1) + [0.0])
+            latencia[bisect_left(BUCKETS_LATENCIA, duracao)] += 1
+            latencia[-1] += duracao
+            if medicao is not None:
+                amostra = self.amostras.setdefault(view, Counter())
+                amostra["requisicoes"] += 1
+                amostra["consultas"] += medicao.consultas
+                amostra["repetidas"] += medicao.repetidas
+                amostra["tempo_banco"] += medicao.tempo_banco
+                amostra["tempo_template"] += medicao.tempo_template
+
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+        with self._lock:
+            requisicoes = dict(self.requisicoes)
+            latencia = {view: (valores[:-1], valores[-1]) for view, valores in self.latencia.items()}
+            amostras = {view: Counter(a) for view, a in self.amostras.items()}
+
+        linhas = [
+            "# HELP fluxo_http_requisicoes_total Requisições atendidas, por view, método e status.",
+            "# TYPE fluxo_http_requisicoes_total counter",
+        ]
+        for (view, metodo, status), total in sorted(requisicoes.items()):
+            linhas.append(f"fluxo_http_requisicoes_total{_rotulos(view=view, metodo=metodo, status=status)} {total}")
+
+        linhas += [
+            "# HELP fluxo_http_latencia_segundos Tempo de resposta, por view.",
+            "# TYPE fluxo_http_latencia_segundos histogram",
+        ]
+        for view, (buckets, soma) in sorted(latencia.items()):
+            acumulado = 0
+            for limite, quantidade in zip(BUCKETS_LATENCIA + ("+Inf",), buckets):
+                acumulado += quantidade
+                linhas.append(f"fluxo_http_latencia_segundos_bucket{_rotulos(view=view, le=limite)} {acumulado}")
+            linhas.append(f"fluxo_http_latencia_segundos_sum{_rotulos(view=view)} {soma:.6f}")
+            linhas.append(f"fluxo_http_latencia_segundos_count{_rotulos(view=view)} {acumulado}")
+
+        for nome, chave, descricao in (
+            ("fluxo_http_amostradas_total", "requisicoes", "Requisições medidas em detalhe (amostragem)."),
+            ("fluxo_db_consultas_total", "consultas", "Consultas ao banco nas requisições amostradas."),
+            ("fluxo_db_consultas_repetidas_total", "repetidas", "Consultas idênticas repetidas na mesma requisição (amostradas)."),
+            ("fluxo_db_tempo_segundos_total", "tempo_banco", "Tempo no banco nas requisições amostradas."),
+            ("fluxo_template_tempo_segundos_total", "tempo_template", "Tempo de render de templates, sem o banco (amostradas)."),
+        ):
+            linhas += [f"# HELP {nome} {descricao}", f"# TYPE {nome} counter"]
+            for view, amostra in sorted(amostras.items()):
+                valor = amostra[chave]
+                linhas.append(f"{nome}{_rotulos(view=view)} {valor:.6f}" if isinstance(valor, float) else f"{nome}{_rotulos(view=view)} {valor}")
+
+        linhas += _metricas_cobranca()
+        return "\n".join(linhas) + "\n"
+
+
+def _rotulos(**rotulos):
+    def escapar(valor):
+        return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{nome}="{escapar(valor)}"' for nome, valor in rotulos.items()) + "}"
+
+
+def _metricas_cobranca():
+    # importado aqui: cobranca carrega requests e httpx, que o resto deste módulo não usa
+    from .cobranca import metricas_do_cliente
+    metricas = metricas_do_cliente()
+    if metricas is None:
+        return []
+    resumo = metricas.resumo()
+    linhas = []
+    for nome, valor, descricao in (
+        ("fluxo_abacatepay_chamadas_total", resumo["chamadas"], "Chamadas ao AbacatePay."),
+        ("fluxo_abacatepay_erros_total", resumo["erros"], "Chamadas ao AbacatePay que falharam."),
+        ("fluxo_abacatepay_recusadas_total", resumo["recusadas"], "Chamadas recusadas pelo disjuntor."),
+        ("fluxo_abacatepay_tempo_segundos_total", resumo["tempo_total_s"], "Tempo total das chamadas ao AbacatePay."),
+    ):
+        linhas += [f"# HELP {nome} {descricao}", f"# TYPE {nome} counter", f"{nome} {valor}"]
+    return linhas
+
+
+registro = RegistroMetricas()
+
+
+# ==========================================================
+# MIDDLEWARE
+# ==========================================================
+class InstrumentacaoMiddleware:
+    """
+    Mede toda requisição (latência, por view e status) e, em uma fração
+    INSTRUMENTACAO_AMOSTRA delas, também consultas, tempo de banco, consultas
+    repetidas e tempo de template. As amostradas e as mais lentas que
+    INSTRUMENTACAO_LENTA_MS vão para o log em JSON; os totais, para /metrics.
+
+    Deve ser o primeiro middleware, para a latência incluir os demais. Numa
+    StreamingHttpResponse (as exportações) o registro fica para o fim do
+    envio, com as consultas feitas enquanto o conteúdo é gerado.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+        # conexões abertas antes de este módulo ser importado não passaram pelo sinal
+        for alias in connections:
+            _instalar(connections[alias])
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self._acall(request)
+
+        inicio = time.perf_counter()
+        medicao = _amostrar()
+        token = _medicao_atual.set(medicao)
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+        return self._concluir(request, response, inicio, medicao)
+
+    async def _acall(self, request):
+        inicio = time.perf_counter()
+        medicao = _amostrar()
+        token = _medicao_atual.set(medicao)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+        return self._concluir(request, response, inicio, medicao)
+
+    def _concluir(self, request, response, inicio, medicao):
+        # FileResponse vai pelo wsgi.file_wrapper, sem passar por streaming_content
+        if not response.streaming or getattr(response, "file_to_stream", None) is not None:
+            self._registrar(request, response, time.perf_counter() - inicio, medicao)
+            return response
+
+        def concluido():
+            self._registrar(request, response, time.perf_counter() - inicio, medicao)
+
+        gerar = _gerar_medindo_async if response.is_async else _gerar_medindo
+        response.streaming_content = gerar(response.streaming_content, medicao, concluido)
+        return response
+
+    def _registrar(self, request, response, duracao, medicao=None):
+        correspondencia = getattr(request, "resolver_match", None)
+        # rótulos com valores limitados: nome da rota, nunca o caminho
+        view = correspondencia.view_name if correspondencia else "nao_encontrada"
+        metodo = request.method if request.method in METODOS else "OUTRO"
+        registro.registrar(view, metodo, response.status_code, duracao, medicao)
+
+        lenta = duracao * 1000 >= settings.INSTRUMENTACAO_LENTA_MS
+        if medicao is None and not lenta:
+            return
+        evento = {
+            "view": view,
+            "metodo": request.method,
+            "caminho": request.path,
+            "status": response.status_code,
+            "duracao_ms": round(duracao * 1000, 2),
+            "usuario_id": getattr(getattr(request, "user", None), "pk", None),
+        }
+        if medicao is not None:
+            sql, vezes = medicao.mais_repetida()
+            evento.update({
+                "consultas": medicao.consultas,
+                "banco_ms": round(medicao.tempo_banco * 1000, 2),
+                "template_ms": round(medicao.tempo_template * 1000, 2),
+                "repetidas": medicao.repetidas,
+            })
+            if vezes:
+                evento.update({"mais_repetida": sql, "mais_repetida_vezes": vezes})
+        logger.log(
+            logging.WARNING if lenta else logging.INFO,
+            "%s %s %s %.1fms", request.method, view, response.status_code, duracao * 1000,
+            extra={"metricas": evento},
+        )
+
+
+def _amostrar():
+    return Medicao() if random.random() < settings.INSTRUMENTACAO_AMOSTRA else None
+
+
+# O servidor consome o conteúdo depois que o middleware retornou: cada parte é
+# gerada com a medição como atual, e o registro sai quando o envio termina (ou
+# é interrompido, pelo close() da resposta).
+
+def _gerar_medindo(conteudo, medicao, concluido):
+    try:
+        conteudo = iter(conteudo)
+        while True:
+            token = _medicao_atual.set(medicao)
+            try:
+                parte = next(conteudo)
+            except StopIteration:
+                return
+            finally:
+                _medicao_atual.reset(token)
+            yield parte
+    finally:
+        concluido()
+
+
+async def _gerar_medindo_async(conteudo, medicao, concluido):
+    try:
+        conteudo = aiter(conteudo)
+        while True:
+            token = _medicao_atual.set(medicao)
+            try:
+                parte = await anext(conteudo)
+            except StopAsyncIteration:
+                return
+            finally:
+                _medicao_atual.reset(token)
+            yield parte
+    finally:
+        concluido()
+
+
+# ==========================================================
+# /metrics
+# ==========================================================
+def acesso_permitido(request):
+    """
+    Com METRICAS_TOKEN, exige "Authorization: Bearer <token>". Sem ele, só com
+    DEBUG e só para a própria máquina: atrás de um proxy reverso local toda
+    requisição chega de 127.0.0.1, então fora do DEBUG o token é obrigatório.
+    """
+    token = settings.METRICAS_TOKEN
+    if token:
+        enviado = request.headers.get("Authorization", "")
+        return hmac.compare_digest(enviado.encode(), f"Bearer {token}".encode())
+    return settings.DEBUG and request.META.get("REMOTE_ADDR") in ("127.0.0.1", "::1")
+
+
+# ==========================================================
+# LOG ESTRUTURADO
+# ==========================================================
+class FormatadorJSON(logging.Formatter):
+    """Uma linha JSON por registro, com os campos de `extra={"metricas": {...}}` no nível de cima."""
+
+    def format(self, record):
+        linha = {
+            "momento": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensagem": record.getMessage(),
+            **getattr(record, "metricas", {}),
+        }
+        if record.exc_info:
+            linha["erro"] = self.formatException(record.exc_info)
+        return json.dumps(linha, ensure_ascii=False, default=str)
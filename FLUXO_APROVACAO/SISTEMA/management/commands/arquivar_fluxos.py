@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from SISTEMA.arquivamento import arquivar_finalizados, LOTE_ARQUIVAMENTO
+
+
+class Command(BaseCommand):
+    help = (
+        "Move os fluxos finalizados há mais de N dias (com etapas e histórico) para a tabela "
+        "compacta fluxos_arquivados, em lotes, uma transação por lote. Continuam visíveis na tela de detalhes "
+        "e na exportação de movimentações; antes de apagar as movimentações, os agregados diários das "
+        "análises (permanência por etapa e tempo de ciclo) são gravados em analises_arquivadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=settings.ARQUIVAR_APOS_DIAS,
+                            help='Arquiva os finalizados há mais dias que isso (padrão: ARQUIVAR_APOS_DIAS).')
+        parser.add_argument('--lote', type=int, default=LOTE_ARQUIVAMENTO, help='Fluxos por transação.')
+        parser.add_argument('--limite', type=int, help='Arquiva no máximo esta quantidade nesta execução.')
+
+    def handle(self, *args, **opts):
+        def progresso(resumo):
+            self.stdout.write(f"{resumo['arquivados']} fluxos arquivados", ending='\r')
+
+        resumo = arquivar_finalizados(opts['dias'], opts['lote'], opts['limite'], ao_concluir_lote=progresso)
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{resumo['arquivados']} fluxo(s) arquivado(s): {resumo['etapas']} etapa(s) e "
+            f"{resumo['movimentacoes']} movimentação(ões) removidas das tabelas de trabalho "
+            f"em {resumo['lotes']} lote(s), {resumo['segundos']}s"
+        ))
@@ -0,0 +1,102 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from SISTEMA.benchmark import carga, cenarios
+
+
+class Command(BaseCommand):
+    help = (
+        "Roda os cenários de carga (login, listagem, detalhe, transições, rajada de webhooks) sobre os "
+        "dados de semear_benchmark, em processo (Client do Django) e/ou por HTTP (servidor local ou --url), "
+        "e grava os resultados em JSON para comparar execuções."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cenarios', default=','.join(cenarios.CENARIOS),
+                            help=f"Separados por vírgula (padrão: {','.join(cenarios.CENARIOS)}).")
+        parser.add_argument('--drivers', default=','.join(carga.DRIVERS), help='processo, http ou ambos.')
+        parser.add_argument('--requisicoes', type=int, default=200, help='Requisições por cenário e driver.')
+        parser.add_argument('--concorrencia', type=int, default=4, help='Threads simultâneas.')
+        parser.add_argument('--rajada', type=int, default=32, help='Threads simultâneas no cenário de webhook.')
+        parser.add_argument('--url', help='Servidor já em execução para o driver http (padrão: sobe um local).')
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--saida', help='Arquivo JSON com os resultados.')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior: mostra a diferença de p95 e vazão.')
+
+    def handle(self, *args, **opts):
+        nomes = [n for n in opts['cenarios'].split(',') if n]
+        drivers = [d for d in opts['drivers'].split(',') if d]
+        invalidos = set(nomes) - set(cenarios.CENARIOS) | set(drivers) - set(carga.DRIVERS)
+        if invalidos:
+            raise CommandError(f"Desconhecido(s): {', '.join(sorted(invalidos))}")
+
+        parametros = {k: opts[k] for k in ('requisicoes', 'concorrencia', 'rajada', 'url', 'semente')}
+        parametros.update(cenarios=nomes, drivers=drivers)
+        resultado = carga.novo_resultado(parametros)
+
+        # as requisições lentas da carga (login, rajadas) inundariam a saída
+        # com o log da instrumentação; com -v 2 ele aparece
+        instrumentacao = logging.getLogger('SISTEMA.instrumentacao')
+        nivel = instrumentacao.level
+        if opts['verbosity'] < 2:
+            instrumentacao.setLevel(logging.ERROR)
+        try:
+            self._executar(nomes, drivers, opts, resultado)
+        finally:
+            instrumentacao.setLevel(nivel)
+
+        if opts['saida']:
+            with open(opts['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {opts['saida']}"))
+        if opts['comparar']:
+            with open(opts['comparar'], encoding='utf-8') as arquivo:
+                self._comparar(json.load(arquivo), resultado)
+
+    def _executar(self, nomes, drivers, opts, resultado):
+        with override_settings(ALLOWED_HOSTS=['*']):
+            for nome in nomes:
+                concorrencia = opts['rajada'] if nome == 'webhook' else opts['concorrencia']
+                try:
+                    trabalhos = cenarios.preparar(nome, concorrencia, opts['requisicoes'], opts['semente'])
+                except ValueError as e:
+                    raise CommandError(str(e))
+                for driver in drivers:
+                    try:
+                        resumo = self._rodar(nome, driver, concorrencia, trabalhos, opts['url'])
+                    finally:
+                        cenarios.limpar(nome)
+                    resultado['resultados'].append(resumo)
+                    self._mostrar(resumo)
+
+    def _rodar(self, nome, driver, concorrencia, trabalhos, url):
+        if driver == 'http' and not url:
+            with carga.servidor_local() as local:
+                amostras, duracao = carga.executar(trabalhos, driver, local)
+        else:
+            amostras, duracao = carga.executar(trabalhos, driver, url)
+        return carga.resumir(nome, driver, concorrencia, amostras, duracao)
+
+    def _mostrar(self, r):
+        latencia = r['latencia_ms']
+        consultas = f"  consultas {r['consultas_por_requisicao']}" if r['consultas_por_requisicao'] is not None else ''
+        self.stdout.write(
+            f"{r['cenario']:<11} {r['driver']:<9} {r['vazao_rps']:8.1f} req/s  "
+            f"p50 {latencia['p50']:8.1f} ms  p95 {latencia['p95']:8.1f} ms  p99 {latencia['p99']:8.1f} ms  "
+            f"status {r['status']}{consultas}"
+        )
+
+    def _comparar(self, anterior, atual):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"== comparação com {anterior['ambiente'].get('commit')} ({anterior['executado_em']}) =="
+        ))
+        for cenario, driver, p95_antes, p95, vazao_antes, vazao in carga.comparar(anterior, atual):
+            variacao = (p95 - p95_antes) / p95_antes * 100 if p95_antes else 0.0
+            estilo = self.style.ERROR if variacao > 10 else self.style.SUCCESS if variacao < -10 else str
+            self.stdout.write(estilo(
+                f"{cenario:<11} {driver:<9} p95 {p95_antes:8.1f} -> {p95:8.1f} ms ({variacao:+.0f}%)  "
+                f"vazão {vazao_antes:8.1f} -> {vazao:8.1f} req/s"
+            ))
@@ -0,0 +1,100 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from SISTEMA.benchmark import semeadura
+from SISTEMA.benchmark.banco import banco_temporario
+from SISTEMA.models import Usuario, Setor, FluxoInstancia, EtapaInstancia, MovimentacaoFluxo, Assinatura
+
+# índices que atendem as consultas medidas (removidos e recriados só no banco temporário)
+INDICES = (
+    (FluxoInstancia, 'fluxo_inst_andamento_idx'),
+    (MovimentacaoFluxo, 'mov_inst_data_idx'),
+    (EtapaInstancia, 'etapa_inst_pendente_idx'),
+    (Assinatura, 'assin_usuario_status_idx'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede plano de execução e latência das consultas principais do fluxo sem e com os índices "
+        "que as atendem. Roda num banco temporário, semeado por SISTEMA/benchmark/semeadura.py e "
+        "apagado no fim: o banco configurado não é alterado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--instancias', type=int, default=100_000, help='Instâncias a gerar no banco temporário.')
+        parser.add_argument('--repeticoes', type=int, default=50, help='Execuções de cada consulta por medição.')
+        parser.add_argument('--semente', type=int, default=42)
+
+    def handle(self, *args, **opts):
+        with banco_temporario() as nome:
+            self.stdout.write(f"Semeando {opts['instancias']} instâncias em {nome}...")
+            resumo = semeadura.semear(
+                setores=10, usuarios=max(opts['instancias'] // 10, 1), modelos=5, etapas_max=10,
+                instancias=opts['instancias'], semente=opts['semente'],
+            )
+            self.stdout.write(
+                f"{resumo['etapas']} etapas e {resumo['movimentacoes']} movimentações em {resumo['segundos']}s"
+            )
+            self._comparar(opts['repeticoes'])
+
+    def _comparar(self, repeticoes):
+        consultas = self._consultas()
+        indices = self._indices()
+
+        self.stdout.write(self.style.MIGRATE_HEADING('== SEM ÍNDICES =='))
+        with connection.schema_editor() as editor:
+            for modelo, indice in indices:
+                editor.remove_index(modelo, indice)
+        try:
+            antes = self._medir(consultas, repeticoes)
+        finally:
+            with connection.schema_editor() as editor:
+                for modelo, indice in indices:
+                    editor.add_index(modelo, indice)
+
+        self.stdout.write(self.style.MIGRATE_HEADING('== COM ÍNDICES =='))
+        depois = self._medir(consultas, repeticoes)
+
+        self.stdout.write(self.style.MIGRATE_HEADING('== RESUMO (ms por consulta) =='))
+        for nome in consultas:
+            self.stdout.write(
+                f'{nome:<24} antes {antes[nome]:8.3f}  depois {depois[nome]:8.3f}  '
+                f'ganho {antes[nome] / max(depois[nome], 1e-6):6.1f}x'
+            )
+
+    def _indices(self):
+        return [
+            (modelo, next(indice for indice in modelo._meta.indexes if indice.name == nome))
+            for modelo, nome in INDICES
+        ]
+
+    def _consultas(self):
+        instancia_id = FluxoInstancia.objects.order_by('-id').values_list('id', flat=True).first()
+        setor_id = Setor.objects.values_list('id', flat=True).first()
+        usuario_id = Usuario.objects.order_by('-id').values_list('id', flat=True).first()
+        return {
+            'listagem_andamento': lambda: FluxoInstancia.objects.filter(finalizado=False).order_by('-criado_em', '-id')[:50],
+            'historico_instancia': lambda: MovimentacaoFluxo.objects.filter(fluxo_instancia_id=instancia_id).order_by('-data_acao')[:50],
+            'pendentes_setor': lambda: EtapaInstancia.objects.filter(
+                setor_id=setor_id, perfil_aprovador='padrao', concluida=False
+            ).order_by()[:50],
+            'assinatura_atual': lambda: Assinatura.objects.filter(
+                usuario_id=usuario_id, status='ativo'
+            ).order_by('-data_inicio')[:1],
+        }
+
+    def _medir(self, consultas, repeticoes):
+        resultados = {}
+        for nome, consulta in consultas.items():
+            self.stdout.write(self.style.SQL_KEYWORD(f'-- {nome}'))
+            self.stdout.write(consulta().explain())
+            list(consulta())  # aquece o cache de páginas
+            inicio = time.perf_counter()
+            for _ in range(repeticoes):
+                list(consulta())
+            resultados[nome] = (time.perf_counter() - inicio) * 1000 / repeticoes
+            self.stdout.write(f'{resultados[nome]:.3f} ms\n')
+        return resultados
@@ -0,0 +1,108 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from SISTEMA.benchmark import semeadura
+from SISTEMA.benchmark.banco import banco_temporario
+from SISTEMA.models import Usuario, FluxoPadrao, FluxoInstancia, MovimentacaoFluxo
+from SISTEMA.services import criar_instancias_em_lote
+
+ETAPAS_POR_FLUXO = 10
+FLUXOS_POR_THREAD = 5
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a vazão de mover_etapa com várias threads no motor configurado (DB_ENGINE), num banco "
+        "temporário apagado no fim. "
+        "Cenário 'independentes': cada thread avança seus próprios fluxos. "
+        "Cenário 'disputados': todas as threads disputam os mesmos fluxos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--movimentos', type=int, default=100, help='Movimentações por thread.')
+        parser.add_argument('--disputados', type=int, default=4, help='Fluxos compartilhados no segundo cenário.')
+
+    def handle(self, *args, **opts):
+        with banco_temporario():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {self._perfil()} =='))
+            semeadura.semear(setores=1, usuarios=1, tamanhos=[ETAPAS_POR_FLUXO], instancias=0)
+            self.usuario = Usuario.objects.get()
+            self.modelo = FluxoPadrao.objects.get()
+
+            threads, movimentos = opts['threads'], opts['movimentos']
+            with override_settings(ALLOWED_HOSTS=['*']):
+                independentes = criar_instancias_em_lote(self.modelo, ['Benchmark'] * (threads * FLUXOS_POR_THREAD), self.usuario)
+                self._cenario('independentes', [
+                    [i.id for i in independentes[t * FLUXOS_POR_THREAD:(t + 1) * FLUXOS_POR_THREAD]] for t in range(threads)
+                ], movimentos)
+
+                disputados = [i.id for i in criar_instancias_em_lote(self.modelo, ['Benchmark'] * opts['disputados'], self.usuario)]
+                self._cenario('disputados', [disputados] * threads, movimentos)
+
+    def _perfil(self):
+        if connection.vendor != 'sqlite':
+            return f'{connection.vendor} (pool={bool(connection.settings_dict["OPTIONS"].get("pool"))})'
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous')
+            synchronous = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}[cursor.fetchone()[0]]
+        opcoes = connection.settings_dict['OPTIONS']
+        return (
+            f'sqlite journal_mode={journal} synchronous={synchronous} '
+            f'timeout={opcoes.get("timeout", 5)}s transaction_mode={opcoes.get("transaction_mode") or "DEFERRED"} '
+            f'CONN_MAX_AGE={connection.settings_dict["CONN_MAX_AGE"]}'
+        )
+
+    def _cenario(self, nome, ids_por_thread, movimentos):
+        todos = {i for ids in ids_por_thread for i in ids}
+        antes = MovimentacaoFluxo.objects.filter(fluxo_instancia_id__in=todos).count()
+        erros = []
+
+        def trabalhar(ids):
+            client = Client()
+            client.force_login(self.usuario)
+            try:
+                for n in range(movimentos):
+                    instancia_id = ids[n % len(ids)]
+                    # lê a versão e a etapa atual como a tela de detalhe faria
+                    etapa_id, ordem, versao = FluxoInstancia.objects.filter(id=instancia_id).values_list(
+                        'etapa_atual_id', 'etapa_atual__ordem_etapa', 'versao'
+                    ).get()
+                    # na última etapa retorna em vez de finalizar, para o fluxo continuar aberto
+                    acao = 'retornar' if ordem == ETAPAS_POR_FLUXO else 'avancar'
+                    resposta = client.post(
+                        reverse('mover_etapa', args=[instancia_id, etapa_id]),
+                        {'acao': acao, 'versao': versao},
+                    )
+                    if resposta.status_code != 302:
+                        erros.append(resposta.status_code)
+            except Exception as e:
+                erros.append(repr(e))
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=trabalhar, args=(ids,)) for ids in ids_por_thread]
+        inicio = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        duracao = time.perf_counter() - inicio
+
+        tentativas = len(ids_por_thread) * movimentos
+        aceitos = MovimentacaoFluxo.objects.filter(fluxo_instancia_id__in=todos).count() - antes
+        self.stdout.write(
+            f'{nome:<14} {tentativas} tentativas em {duracao:6.2f}s  '
+            f'aceitas {aceitos:5d} ({aceitos / duracao:7.1f}/s)  '
+            f'recusadas {tentativas - aceitos - len(erros):5d}  erros {len(erros)}'
+        )
+        if erros:
+            self.stdout.write(self.style.ERROR(f'  primeiros erros: {erros[:3]}'))
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import path
+
+from SISTEMA import cobranca, views
+from SISTEMA.benchmark.banco import banco_temporario
+from SISTEMA.models import Usuario
+
+# urlconf usada só durante a carga: as duas versões de cada endpoint lado a lado
+urlpatterns = [
+    path('wsgi/checkout/prata/', views.checkout_prata),
+    path('wsgi/webhook/', views.abacatepay_webhook),
+    path('asgi/checkout/prata/', views.checkout_prata_async),
+    path('asgi/webhook/', views.abacatepay_webhook_async),
+    path('login/', views.login_view, name='login'),
+]
+
+
+class StubPagamentos(BaseHTTPRequestHandler):
+    """Imita POST /billing/create do AbacatePay com latência fixa."""
+    protocol_version = 'HTTP/1.1'
+    latencia = 0.2
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(StubPagamentos.latencia)
+        resposta = json.dumps({"data": {"url": "https://pay.test/checkout"}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(resposta)))
+        self.end_headers()
+        self.wfile.write(resposta)
+
+    def log_message(self, *args):
+        pass
+
+
+class ServidorStub(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # o padrão (5) derruba conexões quando chegam dezenas ao mesmo tempo
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga de checkout e webhook: views síncronas em N threads (como N workers WSGI) "
+        "contra views async em um único event loop (um worker ASGI), com o AbacatePay simulado localmente. "
+        "Usuário e eventos ficam num banco temporário, apagado no fim."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=200, help='Requisições por cenário.')
+        parser.add_argument('--workers', type=int, default=4, help='Threads do cenário WSGI.')
+        parser.add_argument('--concorrencia', type=int, default=50, help='Requisições simultâneas no cenário ASGI.')
+        parser.add_argument('--latencia', type=float, default=200, help='Latência do AbacatePay simulado (ms).')
+
+    def handle(self, *args, **opts):
+        StubPagamentos.latencia = opts['latencia'] / 1000
+        servidor = ServidorStub(('127.0.0.1', 0), StubPagamentos)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+        self.secret = f'?secret={views.WEBHOOK_SECRET}' if views.WEBHOOK_SECRET else ''
+
+        configuracao = override_settings(
+            ROOT_URLCONF=__name__,
+            ABACATEPAY_BASE_URL=f'http://127.0.0.1:{servidor.server_port}',
+            ALLOWED_HOSTS=['*'],
+        )
+        configuracao.enable()
+        cobranca.redefinir_clientes()
+        try:
+            with banco_temporario():
+                self.usuario = Usuario.objects.create(username='carga_checkout')
+                for endpoint in ('checkout/prata/', 'webhook/'):
+                    wsgi = self._carga_wsgi(endpoint, opts['requisicoes'], opts['workers'])
+                    asgi = asyncio.run(self._carga_asgi(endpoint, opts['requisicoes'], opts['concorrencia']))
+                    self._relatorio(endpoint, wsgi, asgi)
+        finally:
+            configuracao.disable()
+            cobranca.redefinir_clientes()
+            servidor.shutdown()
+
+    def _requisicao(self, endpoint):
+        if endpoint == 'webhook/':
+            corpo = json.dumps({"id": f"carga-{uuid.uuid4()}", "event": "billing.paid"})
+            return {'path': f'webhook/{self.secret}', 'data': corpo, 'content_type': 'application/json'}
+        return {'path': endpoint}
+
+    def _carga_wsgi(self, endpoint, total, workers):
+        local = threading.local()
+
+        def enviar(_):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                local.client.force_login(self.usuario)
+            req = self._requisicao(endpoint)
+            inicio = time.perf_counter()
+            if endpoint == 'webhook/':
+                resposta = local.client.post(f"/wsgi/{req['path']}", req['data'], content_type=req['content_type'])
+            else:
+                resposta = local.client.get(f"/wsgi/{req['path']}")
+            return time.perf_counter() - inicio, resposta.status_code
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(workers) as executor:
+            resultados = list(executor.map(enviar, range(total)))
+            # cada thread abriu a própria conexão com o banco
+            executor.map(lambda _: connections.close_all(), range(workers))
+        return resultados, time.perf_counter() - inicio
+
+    async def _carga_asgi(self, endpoint, total, concorrencia):
+        client = AsyncClient()
+        await client.aforce_login(self.usuario)
+        limite = asyncio.Semaphore(concorrencia)
+
+        async def enviar():
+            async with limite:
+                req = self._requisicao(endpoint)
+                inicio = time.perf_counter()
+                if endpoint == 'webhook/':
+                    resposta = await client.post(f"/asgi/{req['path']}", req['data'], content_type=req['content_type'])
+                else:
+                    resposta = await client.get(f"/asgi/{req['path']}")
+                return time.perf_counter() - inicio, resposta.status_code
+
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*(enviar() for _ in range(total)))
+        return resultados, time.perf_counter() - inicio
+
+    def _relatorio(self, endpoint, *cenarios):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {endpoint} =='))
+        for nome, (resultados, duracao) in zip(('WSGI', 'ASGI'), cenarios):
+            tempos = sorted(t for t, _ in resultados)
+            erros = sum(1 for _, status in resultados if status >= 400)
+            self.stdout.write(
+                f'{nome}: {len(resultados) / duracao:7.1f} req/s  '
+                f'p50 {1000 * statistics.median(tempos):7.1f} ms  '
+                f'p95 {1000 * tempos[int(len(tempos) * 0.95) - 1]:7.1f} ms  '
+                f'erros {erros}'
+            )
@@ -0,0 +1,29 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from SISTEMA.planos import assinaturas_vencidas, expirar_vencidas
+
+
+class Command(BaseCommand):
+    help = "Rebaixa para freemium, em lote, todas as assinaturas vencidas. Pode ser agendado (cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Assinaturas por UPDATE.')
+        parser.add_argument('--data', type=date.fromisoformat, help='Data de referência (AAAA-MM-DD). Padrão: hoje.')
+        parser.add_argument('--simular', action='store_true', help='Só conta as vencidas, sem alterar nada.')
+
+    def handle(self, *args, **opts):
+        inicio = time.perf_counter()
+
+        if opts['simular']:
+            total = assinaturas_vencidas(opts['data']).count()
+            self.stdout.write(f'{total} assinatura(s) vencida(s).')
+            return
+
+        expiradas, lotes = expirar_vencidas(opts['data'], opts['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{expiradas} assinatura(s) expirada(s) em {lotes} lote(s), '
+            f'{time.perf_counter() - inicio:.2f}s'
+        ))
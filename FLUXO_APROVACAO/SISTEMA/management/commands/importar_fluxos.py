@@ -0,0 +1,58 @@
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SISTEMA.importacao import importar_modelos, importar_instancias, formato_do_arquivo, FORMATOS
+from SISTEMA.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa modelos de fluxo (com etapas) ou inicia instâncias em massa a partir de CSV, "
+        "JSON Lines ou JSON. O arquivo é lido aos poucos e gravado em lotes, uma transação por lote."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=['modelos', 'instancias'])
+        parser.add_argument('arquivo')
+        parser.add_argument('--formato', choices=FORMATOS, help='Padrão: pela extensão do arquivo.')
+        parser.add_argument('--usuario', help='Username gravado como criador dos registros.')
+        parser.add_argument('--lote', type=int, help='Registros por transação.')
+
+    def handle(self, *args, **opts):
+        formato = opts['formato'] or formato_do_arquivo(opts['arquivo'])
+        if formato is None:
+            raise CommandError('Não foi possível deduzir o formato pela extensão; use --formato.')
+
+        usuario = None
+        if opts['usuario']:
+            usuario = Usuario.objects.filter(username=opts['usuario']).first()
+            if usuario is None:
+                raise CommandError(f"Usuário '{opts['usuario']}' não encontrado.")
+
+        importar = importar_modelos if opts['tipo'] == 'modelos' else importar_instancias
+        extras = {'lote': opts['lote']} if opts['lote'] else {}
+
+        def progresso(relatorio):
+            resumo = relatorio.resumo()
+            self.stdout.write(
+                f"{resumo['lidas']} lidas, {resumo['importadas']} importadas ({resumo['por_segundo']}/s)",
+                ending='\r',
+            )
+
+        # utf-8-sig descarta o BOM que o Excel grava no início do CSV
+        with open(opts['arquivo'], encoding='utf-8-sig', newline='') as arquivo:
+            try:
+                relatorio = importar(arquivo, formato, usuario, ao_concluir_lote=progresso, **extras)
+            except UnicodeDecodeError as erro:
+                raise CommandError(
+                    f"O arquivo precisa estar em UTF-8 ({erro.reason} no byte {erro.start}); "
+                    "os lotes anteriores ao erro já foram gravados."
+                )
+
+        resumo = relatorio.resumo()
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{resumo['importadas']} {opts['tipo']} importado(s), {resumo['rejeitadas']} rejeitado(s), "
+            f"{resumo['lidas']} registro(s) em {resumo['segundos']}s ({resumo['por_segundo']} registros/s)"
+        ))
+        for erro in resumo['erros']:
+            self.stdout.write(self.style.WARNING(f"linha {erro['linha']}: {erro['erro']}"))
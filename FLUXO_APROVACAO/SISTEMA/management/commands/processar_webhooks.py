@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from SISTEMA.fila import processar_pendentes
+
+
+class Command(BaseCommand):
+    help = "Worker da fila de eventos do AbacatePay (tabela eventos_webhook)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true', help='Esvazia a fila e termina.')
+        parser.add_argument('--lote', type=int, default=100, help='Eventos reservados por rodada.')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos de espera com a fila vazia.')
+
+    def handle(self, *args, **opts):
+        total = 0
+        while True:
+            processados = processar_pendentes(opts['lote'])
+            total += processados
+            if processados:
+                self.stdout.write(f'{processados} evento(s) processado(s)')
+                continue
+            if opts['uma_vez']:
+                break
+            time.sleep(opts['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS(f'Fila vazia. Total processado: {total}'))
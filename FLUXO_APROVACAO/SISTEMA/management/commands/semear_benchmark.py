@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from SISTEMA.benchmark import semeadura
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera dados sintéticos para benchmarks no banco configurado: setores, usuários (senha "
+        f"'{semeadura.SENHA}'), modelos de 3 a N etapas e instâncias com etapas e histórico. "
+        "Use um banco separado: nada do que é gerado é removido depois."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--setores', type=int, default=20)
+        parser.add_argument('--usuarios', type=int, default=200)
+        parser.add_argument('--modelos', type=int, default=20)
+        parser.add_argument('--etapas-max', type=int, default=50, help='Etapas do maior modelo.')
+        parser.add_argument('--instancias', type=int, default=1_000_000)
+        parser.add_argument('--dias', type=int, default=365, help='Período em que as instâncias foram criadas.')
+        parser.add_argument('--semente', type=int, default=42, help='Mesma semente, mesmos dados.')
+        parser.add_argument('--lote', type=int, default=semeadura.LOTE, help='Instâncias por transação.')
+
+    def handle(self, *args, **opts):
+        def progresso(resumo):
+            self.stdout.write(
+                f"{resumo['instancias']}/{opts['instancias']} instâncias, {resumo['etapas']} etapas, "
+                f"{resumo['movimentacoes']} movimentações",
+                ending='\r',
+            )
+
+        resumo = semeadura.semear(
+            setores=opts['setores'], usuarios=opts['usuarios'], modelos=opts['modelos'],
+            etapas_max=opts['etapas_max'], instancias=opts['instancias'], dias=opts['dias'],
+            semente=opts['semente'], lote=opts['lote'], ao_concluir_lote=progresso,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{resumo['setores']} setores, {resumo['usuarios']} usuários, {resumo['modelos']} modelos; "
+            f"{resumo['instancias']} instâncias, {resumo['etapas']} etapas e {resumo['movimentacoes']} "
+            f"movimentações criadas em {resumo['segundos']}s "
+            f"({resumo['instancias'] / max(resumo['segundos'], 0.001):.0f} instâncias/s)"
+        ))
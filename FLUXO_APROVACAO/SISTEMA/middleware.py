@@ -0,0 +1,29 @@
+# SISTEMA/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import SimpleLazyObject
+from .planos import plano_do_usuario, PLANO_PADRAO
+
+
+class PlanoMiddleware:
+    """
+    Expõe `request.plano` (freemium/prata/ouro/diamante). O valor é resolvido só
+    quando alguém o lê, no máximo uma vez por requisição, e vem do cache de planos.
+    Funciona em WSGI e ASGI sem troca de thread (não faz I/O ao ser chamado).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.plano = SimpleLazyObject(lambda: self._resolver(request))
+        # em modo async get_response devolve a corrotina, que o Django aguarda
+        return self.get_response(request)
+
+    def _resolver(self, request):
+        if not request.user.is_authenticated:
+            return PLANO_PADRAO
+        return plano_do_usuario(request.user.id)
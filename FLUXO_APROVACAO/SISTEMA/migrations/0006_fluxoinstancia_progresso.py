@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2025-11-24 10:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def preencher_progresso(apps, schema_editor):
+    FluxoInstancia = apps.get_model('SISTEMA', 'FluxoInstancia')
+    EtapaInstancia = apps.get_model('SISTEMA', 'EtapaInstancia')
+
+    # um único UPDATE com subconsultas correlacionadas, como em
+    # services.criar_instancias_em_lote, em vez de um UPDATE por instância
+    etapas = EtapaInstancia.objects.filter(fluxo_instancia_id=OuterRef('pk')).order_by()
+
+    def contagem(queryset):
+        return Coalesce(Subquery(queryset.values('fluxo_instancia_id').annotate(n=Count('id')).values('n')), 0)
+
+    FluxoInstancia.objects.update(
+        total_etapas=contagem(etapas),
+        etapas_concluidas=contagem(etapas.filter(concluida=True)),
+        etapa_atual_id=Subquery(etapas.filter(concluida=False).order_by('ordem_etapa').values('id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0005_alter_assinatura_plano_alter_usuario_groups_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fluxoinstancia',
+            name='etapa_atual',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='SISTEMA.etapainstancia'),
+        ),
+        migrations.AddField(
+            model_name='fluxoinstancia',
+            name='etapas_concluidas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fluxoinstancia',
+            name='total_etapas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(preencher_progresso, migrations.RunPython.noop),
+    ]
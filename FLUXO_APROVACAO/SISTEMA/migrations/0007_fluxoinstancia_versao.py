@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2025-11-25 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0006_fluxoinstancia_progresso'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fluxoinstancia',
+            name='versao',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2025-11-25 14:05
+
+from django.db import migrations
+
+
+ACOES = [
+    ('Avançar', 'Conclui a etapa atual e segue para a próxima.'),
+    ('Retornar', 'Reabre a etapa anterior.'),
+    ('Rejeitar', 'Reprova a etapa e reinicia o fluxo.'),
+]
+
+
+def semear_acoes(apps, schema_editor):
+    AcaoFluxo = apps.get_model('SISTEMA', 'AcaoFluxo')
+    for nome, descricao in ACOES:
+        AcaoFluxo.objects.get_or_create(nome=nome, defaults={'descricao': descricao})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0007_fluxoinstancia_versao'),
+    ]
+
+    operations = [
+        migrations.RunPython(semear_acoes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0008_semear_acoes_fluxo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assinatura',
+            index=models.Index(fields=['usuario', 'status', '-data_inicio'], name='assin_usuario_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='etapainstancia',
+            index=models.Index(condition=models.Q(('concluida', False)), fields=['setor', 'perfil_aprovador'], name='etapa_inst_pendente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fluxoinstancia',
+            index=models.Index(condition=models.Q(('finalizado', False)), fields=['-criado_em', '-id'], name='fluxo_inst_andamento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fluxoinstancia',
+            index=models.Index(condition=models.Q(('finalizado', True)), fields=['-criado_em', '-id'], name='fluxo_inst_finalizado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaofluxo',
+            index=models.Index(fields=['fluxo_instancia', '-data_acao'], name='mov_inst_data_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_setor_atual(apps, schema_editor):
+    FluxoInstancia = apps.get_model('SISTEMA', 'FluxoInstancia')
+    EtapaInstancia = apps.get_model('SISTEMA', 'EtapaInstancia')
+
+    etapa_atual = EtapaInstancia.objects.filter(id=OuterRef('etapa_atual_id'))
+    FluxoInstancia.objects.filter(etapa_atual__isnull=False).update(
+        setor_atual_id=Subquery(etapa_atual.values('setor_id')[:1]),
+        perfil_atual=Subquery(etapa_atual.values('perfil_aprovador')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0009_indices_consultas_fluxo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fluxoinstancia',
+            name='perfil_atual',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='fluxoinstancia',
+            name='setor_atual',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='SISTEMA.setor'),
+        ),
+        migrations.AddIndex(
+            model_name='fluxoinstancia',
+            index=models.Index(condition=models.Q(('finalizado', False)), fields=['setor_atual', 'perfil_atual', '-criado_em', '-id'], name='fluxo_inst_caixa_idx'),
+        ),
+        migrations.RunPython(preencher_setor_atual, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0010_caixa_entrada_setor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoWebhook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('tipo', models.CharField(blank=True, max_length=100)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('processado', 'Processado'), ('ignorado', 'Ignorado'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('erro', models.TextField(blank=True, null=True)),
+                ('recebido_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('reservado_em', models.DateTimeField(blank=True, null=True)),
+                ('processado_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Evento de Webhook',
+                'verbose_name_plural': 'Eventos de Webhook',
+                'db_table': 'eventos_webhook',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pagamento',
+            constraint=models.UniqueConstraint(condition=models.Q(('event_id__isnull', False)), fields=('event_id',), name='pagamento_event_id_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='pagamento',
+            constraint=models.UniqueConstraint(condition=models.Q(('billing_id__isnull', False)), fields=('billing_id',), name='pagamento_billing_id_unico'),
+        ),
+        migrations.AddIndex(
+            model_name='eventowebhook',
+            index=models.Index(fields=['status', 'recebido_em'], name='evento_status_recebido_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:11
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def preencher_data_fim(apps, schema_editor):
+    # antes o vencimento era calculado na tela: data_inicio + 30 dias
+    Assinatura = apps.get_model('SISTEMA', 'Assinatura')
+    Assinatura.objects.filter(status='ativo', data_fim__isnull=True).exclude(plano='freemium').update(
+        data_fim=F('data_inicio') + timedelta(days=30)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0011_fila_webhook'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assinatura',
+            index=models.Index(condition=models.Q(('status', 'ativo')), fields=['data_fim', 'id'], name='assin_vencimento_idx'),
+        ),
+        migrations.RunPython(preencher_data_fim, migrations.RunPython.noop),
+    ]
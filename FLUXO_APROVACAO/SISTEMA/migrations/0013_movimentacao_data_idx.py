@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0012_vencimento_assinaturas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimentacaofluxo',
+            index=models.Index(fields=['data_acao'], name='mov_data_idx'),
+        ),
+    ]
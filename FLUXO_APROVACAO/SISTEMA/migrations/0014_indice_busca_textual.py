@@ -0,0 +1,125 @@
+# Índices de busca textual (SISTEMA/busca.py). Não há modelo para eles: no
+# SQLite são tabelas virtuais FTS5 mantidas por gatilhos; no PostgreSQL,
+# índices GIN sobre to_tsvector das próprias colunas.
+#
+# Atenção: no SQLite, uma migração que recria fluxos_instancia ou
+# movimentacoes_fluxo (AlterField, RemoveField...) descarta os gatilhos; ela
+# precisa recriá-los com os comandos de SQLITE abaixo.
+
+from django.db import migrations
+
+SQLITE = [
+    # instâncias: nome, nome do modelo e nome da etapa atual (rowid = id da instância)
+    """CREATE VIRTUAL TABLE busca_instancias USING fts5(
+        nome, modelo, etapa, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """INSERT INTO busca_instancias (rowid, nome, modelo, etapa)
+        SELECT i.id, i.nome, p.nome, e.nome
+        FROM fluxos_instancia i
+        JOIN fluxos_padrao p ON p.id = i.modelo_id
+        LEFT JOIN etapas_instancia e ON e.id = i.etapa_atual_id""",
+    """CREATE TRIGGER busca_instancias_ai AFTER INSERT ON fluxos_instancia BEGIN
+        INSERT INTO busca_instancias (rowid, nome, modelo, etapa) VALUES (
+            new.id, new.nome,
+            (SELECT nome FROM fluxos_padrao WHERE id = new.modelo_id),
+            (SELECT nome FROM etapas_instancia WHERE id = new.etapa_atual_id)
+        );
+    END""",
+    # o save() do ORM regrava todas as colunas: só reindexa se algo indexado mudou
+    """CREATE TRIGGER busca_instancias_au AFTER UPDATE OF nome, modelo_id, etapa_atual_id ON fluxos_instancia
+    WHEN old.nome IS NOT new.nome OR old.modelo_id IS NOT new.modelo_id OR old.etapa_atual_id IS NOT new.etapa_atual_id
+    BEGIN
+        DELETE FROM busca_instancias WHERE rowid = old.id;
+        INSERT INTO busca_instancias (rowid, nome, modelo, etapa) VALUES (
+            new.id, new.nome,
+            (SELECT nome FROM fluxos_padrao WHERE id = new.modelo_id),
+            (SELECT nome FROM etapas_instancia WHERE id = new.etapa_atual_id)
+        );
+    END""",
+    """CREATE TRIGGER busca_instancias_ad AFTER DELETE ON fluxos_instancia BEGIN
+        DELETE FROM busca_instancias WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER busca_modelos_au AFTER UPDATE OF nome ON fluxos_padrao
+    WHEN old.nome IS NOT new.nome
+    BEGIN
+        UPDATE busca_instancias SET modelo = new.nome
+        WHERE rowid IN (SELECT id FROM fluxos_instancia WHERE modelo_id = new.id);
+    END""",
+
+    # comentários: conteúdo externo, o texto fica só em movimentacoes_fluxo
+    """CREATE VIRTUAL TABLE busca_comentarios USING fts5(
+        comentario, content = 'movimentacoes_fluxo', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """INSERT INTO busca_comentarios (rowid, comentario)
+        SELECT id, comentario FROM movimentacoes_fluxo WHERE COALESCE(comentario, '') <> ''""",
+    # com conteúdo externo, o 'delete' precisa receber exatamente o texto indexado
+    """CREATE TRIGGER busca_comentarios_ai AFTER INSERT ON movimentacoes_fluxo
+    WHEN COALESCE(new.comentario, '') <> ''
+    BEGIN
+        INSERT INTO busca_comentarios (rowid, comentario) VALUES (new.id, new.comentario);
+    END""",
+    """CREATE TRIGGER busca_comentarios_ad AFTER DELETE ON movimentacoes_fluxo
+    WHEN COALESCE(old.comentario, '') <> ''
+    BEGIN
+        INSERT INTO busca_comentarios (busca_comentarios, rowid, comentario) VALUES ('delete', old.id, old.comentario);
+    END""",
+    # um gatilho só, para o 'delete' do texto antigo vir antes da inclusão do novo
+    # (a ordem entre gatilhos diferentes não é garantida)
+    """CREATE TRIGGER busca_comentarios_au AFTER UPDATE OF comentario ON movimentacoes_fluxo
+    WHEN old.comentario IS NOT new.comentario
+    BEGIN
+        INSERT INTO busca_comentarios (busca_comentarios, rowid, comentario)
+            SELECT 'delete', old.id, old.comentario WHERE COALESCE(old.comentario, '') <> '';
+        INSERT INTO busca_comentarios (rowid, comentario)
+            SELECT new.id, new.comentario WHERE COALESCE(new.comentario, '') <> '';
+    END""",
+]
+
+SQLITE_DESFAZER = [
+    "DROP TRIGGER IF EXISTS busca_instancias_ai",
+    "DROP TRIGGER IF EXISTS busca_instancias_au",
+    "DROP TRIGGER IF EXISTS busca_instancias_ad",
+    "DROP TRIGGER IF EXISTS busca_modelos_au",
+    "DROP TRIGGER IF EXISTS busca_comentarios_ai",
+    "DROP TRIGGER IF EXISTS busca_comentarios_ad",
+    "DROP TRIGGER IF EXISTS busca_comentarios_au",
+    "DROP TABLE IF EXISTS busca_instancias",
+    "DROP TABLE IF EXISTS busca_comentarios",
+]
+
+# a expressão precisa ser idêntica à usada em SISTEMA/busca.py para o índice ser usado
+POSTGRESQL = [
+    "CREATE INDEX busca_instancia_nome_gin ON fluxos_instancia USING gin (to_tsvector('portuguese', nome))",
+    "CREATE INDEX busca_modelo_nome_gin ON fluxos_padrao USING gin (to_tsvector('portuguese', nome))",
+    "CREATE INDEX busca_etapa_nome_gin ON etapas_instancia USING gin (to_tsvector('portuguese', nome))",
+    "CREATE INDEX busca_comentario_gin ON movimentacoes_fluxo USING gin (to_tsvector('portuguese', COALESCE(comentario, '')))",
+]
+
+POSTGRESQL_DESFAZER = [
+    "DROP INDEX IF EXISTS busca_instancia_nome_gin",
+    "DROP INDEX IF EXISTS busca_modelo_nome_gin",
+    "DROP INDEX IF EXISTS busca_etapa_nome_gin",
+    "DROP INDEX IF EXISTS busca_comentario_gin",
+]
+
+
+def _executar(comandos_por_banco):
+    def executar(apps, schema_editor):
+        for sql in comandos_por_banco.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return executar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0013_movimentacao_data_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _executar({'sqlite': SQLITE, 'postgresql': POSTGRESQL}),
+            _executar({'sqlite': SQLITE_DESFAZER, 'postgresql': POSTGRESQL_DESFAZER}),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0014_indice_busca_textual'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FluxoArquivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('nome', models.CharField(max_length=200)),
+                ('modelo_id', models.BigIntegerField(blank=True, null=True)),
+                ('modelo_nome', models.CharField(max_length=200)),
+                ('criado_por', models.CharField(blank=True, default='', max_length=150)),
+                ('criado_em', models.DateTimeField()),
+                ('finalizado_em', models.DateTimeField()),
+                ('total_etapas', models.PositiveIntegerField(default=0)),
+                ('arquivado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('conteudo', models.BinaryField()),
+            ],
+            options={
+                'verbose_name': 'Fluxo Arquivado',
+                'verbose_name_plural': 'Fluxos Arquivados',
+                'db_table': 'fluxos_arquivados',
+            },
+        ),
+    ]
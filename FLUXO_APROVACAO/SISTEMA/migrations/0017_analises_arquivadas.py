@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 22:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0016_tabela_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnaliseArquivada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metrica', models.CharField(choices=[('permanencia', 'Permanência por etapa'), ('ciclo', 'Tempo de ciclo')], max_length=20)),
+                ('dia', models.DateField()),
+                ('modelo_id', models.BigIntegerField(blank=True, null=True)),
+                ('modelo', models.CharField(blank=True, default='', max_length=200)),
+                ('ordem', models.PositiveIntegerField(blank=True, null=True)),
+                ('etapa', models.CharField(blank=True, default='', max_length=200)),
+                ('quantidade', models.PositiveIntegerField()),
+                ('soma', models.FloatField()),
+                ('maximo', models.FloatField()),
+            ],
+            options={
+                'verbose_name': 'Análise Arquivada',
+                'verbose_name_plural': 'Análises Arquivadas',
+                'db_table': 'analises_arquivadas',
+                'indexes': [models.Index(fields=['metrica', 'dia'], name='analise_arq_metrica_dia_idx')],
+            },
+        ),
+    ]
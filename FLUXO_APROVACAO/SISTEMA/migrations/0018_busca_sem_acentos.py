@@ -0,0 +1,59 @@
+# Busca sem acentos também no PostgreSQL, como o remove_diacritics do FTS5 no
+# SQLite (SISTEMA/busca.py). unaccent() não é IMMUTABLE (o dicionário pode
+# mudar), então não pode entrar na expressão de um índice; busca_sem_acentos()
+# fixa o dicionário e pode. Os índices GIN da 0014 são recriados sobre ela.
+#
+# CREATE EXTENSION exige um usuário com permissão para isso (ou a extensão já
+# instalada no schema public por um administrador). No SQLite nada muda.
+
+from django.db import migrations
+
+POSTGRESQL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent SCHEMA public",
+    """CREATE OR REPLACE FUNCTION busca_sem_acentos(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$""",
+    "DROP INDEX IF EXISTS busca_instancia_nome_gin",
+    "DROP INDEX IF EXISTS busca_modelo_nome_gin",
+    "DROP INDEX IF EXISTS busca_etapa_nome_gin",
+    "DROP INDEX IF EXISTS busca_comentario_gin",
+    # a expressão precisa ser idêntica à usada em SISTEMA/busca.py para o índice ser usado
+    "CREATE INDEX busca_instancia_nome_gin ON fluxos_instancia USING gin (to_tsvector('portuguese', busca_sem_acentos(nome)))",
+    "CREATE INDEX busca_modelo_nome_gin ON fluxos_padrao USING gin (to_tsvector('portuguese', busca_sem_acentos(nome)))",
+    "CREATE INDEX busca_etapa_nome_gin ON etapas_instancia USING gin (to_tsvector('portuguese', busca_sem_acentos(nome)))",
+    "CREATE INDEX busca_comentario_gin ON movimentacoes_fluxo USING gin (to_tsvector('portuguese', busca_sem_acentos(COALESCE(comentario, ''))))",
+]
+
+# volta aos índices da 0014; a extensão fica, pode estar em uso por outros
+POSTGRESQL_DESFAZER = [
+    "DROP INDEX IF EXISTS busca_instancia_nome_gin",
+    "DROP INDEX IF EXISTS busca_modelo_nome_gin",
+    "DROP INDEX IF EXISTS busca_etapa_nome_gin",
+    "DROP INDEX IF EXISTS busca_comentario_gin",
+    "CREATE INDEX busca_instancia_nome_gin ON fluxos_instancia USING gin (to_tsvector('portuguese', nome))",
+    "CREATE INDEX busca_modelo_nome_gin ON fluxos_padrao USING gin (to_tsvector('portuguese', nome))",
+    "CREATE INDEX busca_etapa_nome_gin ON etapas_instancia USING gin (to_tsvector('portuguese', nome))",
+    "CREATE INDEX busca_comentario_gin ON movimentacoes_fluxo USING gin (to_tsvector('portuguese', COALESCE(comentario, '')))",
+    "DROP FUNCTION IF EXISTS busca_sem_acentos(text)",
+]
+
+
+def _executar(comandos_por_banco):
+    def executar(apps, schema_editor):
+        for sql in comandos_por_banco.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return executar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0017_analises_arquivadas'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _executar({'postgresql': POSTGRESQL}),
+            _executar({'postgresql': POSTGRESQL_DESFAZER}),
+        ),
+    ]
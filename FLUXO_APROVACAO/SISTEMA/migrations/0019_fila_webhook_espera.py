@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 22:54
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def disponivel_desde_o_recebimento(apps, schema_editor):
+    # eventos já na fila ficam disponíveis desde que chegaram, mantendo a ordem
+    EventoWebhook = apps.get_model('SISTEMA', 'EventoWebhook')
+    EventoWebhook.objects.update(proxima_tentativa_em=F('recebido_em'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SISTEMA', '0018_busca_sem_acentos'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='eventowebhook',
+            name='evento_status_recebido_idx',
+        ),
+        migrations.AddField(
+            model_name='eventowebhook',
+            name='proxima_tentativa_em',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(disponivel_desde_o_recebimento, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='eventowebhook',
+            index=models.Index(fields=['status', 'proxima_tentativa_em'], name='evento_status_proxima_idx'),
+        ),
+    ]
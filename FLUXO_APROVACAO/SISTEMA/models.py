@@ -41,6 +41,11 @@ class Usuario(AbstractUser):
     def assinatura_atual(self):
         return self.assinaturas.filter(status="ativo").order_by('-data_inicio').first()
 
+    def resumo_assinatura(self):
+        """Resumo da assinatura ativa ({'plano', 'data_inicio', 'data_fim'}) ou None, pelo cache de planos."""
+        from .planos import assinatura_vigente
+        return assinatura_vigente(self.id)
+
     def __str__(self):
         return self.username
 
@@ -71,6 +76,12 @@ class Assinatura(models.Model):
         db_table = "assinaturas"
         verbose_name = "Assinatura"
         verbose_name_plural = "Assinaturas"
+        indexes = [
+            # Usuario.assinatura_atual / assinatura_view
+            models.Index(fields=["usuario", "status", "-data_inicio"], name="assin_usuario_status_idx"),
+            # expirar_assinaturas: só as ativas entram no índice
+            models.Index(fields=["data_fim", "id"], condition=models.Q(status="ativo"), name="assin_vencimento_idx"),
+        ]
 
     def __str__(self):
         return f"{self.usuario.username} - {self.plano} ({self.status})"
@@ -103,6 +114,53 @@ class Pagamento(models.Model):
         db_table = "pagamentos"
         verbose_name = "Pagamento"
         verbose_name_plural = "Pagamentos"
+        constraints = [
+            # reenvios do webhook não geram pagamentos duplicados
+            models.UniqueConstraint(
+                fields=["event_id"], condition=models.Q(event_id__isnull=False), name="pagamento_event_id_unico"
+            ),
+            models.UniqueConstraint(
+                fields=["billing_id"], condition=models.Q(billing_id__isnull=False), name="pagamento_billing_id_unico"
+            ),
+        ]
+
+
+class EventoWebhook(models.Model):
+    """
+    Eventos recebidos do AbacatePay, guardados crus e processados em segundo
+    plano (SISTEMA/fila.py). Um evento que falha volta para "pendente" só em
+    proxima_tentativa_em; depois de fila.MAX_TENTATIVAS falhas fica em "erro".
+    """
+    STATUS_CHOICES = [
+        ("pendente", "Pendente"),
+        ("processando", "Processando"),
+        ("processado", "Processado"),
+        ("ignorado", "Ignorado"),
+        ("erro", "Erro"),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    tipo = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pendente")
+    tentativas = models.PositiveIntegerField(default=0)
+    erro = models.TextField(blank=True, null=True)
+    recebido_em = models.DateTimeField(default=timezone.now)
+    reservado_em = models.DateTimeField(null=True, blank=True)
+    processado_em = models.DateTimeField(null=True, blank=True)
+    proxima_tentativa_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "eventos_webhook"
+        verbose_name = "Evento de Webhook"
+        verbose_name_plural = "Eventos de Webhook"
+        indexes = [
+            # worker: pendentes cuja vez já chegou, na ordem em que ficaram disponíveis
+            models.Index(fields=["status", "proxima_tentativa_em"], name="evento_status_proxima_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo or 'evento'} {self.event_id} ({self.status})"
 
 
 # ==========================================================
@@ -162,14 +220,54 @@ class FluxoInstancia(models.Model):
     atualizado_em = models.DateTimeField(auto_now=True)
     finalizado = models.BooleanField(default=False)
 
+    # Progresso desnormalizado: atualizado a cada movimentação para que telas e
+    # filtros não precisem percorrer as etapas para descobrir a etapa atual.
+    etapa_atual = models.ForeignKey(
+        "EtapaInstancia", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    # setor e perfil da etapa atual, copiados para a caixa de entrada por setor
+    setor_atual = models.ForeignKey(Setor, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    perfil_atual = models.CharField(max_length=20, blank=True, default="")
+    etapas_concluidas = models.PositiveIntegerField(default=0)
+    total_etapas = models.PositiveIntegerField(default=0)
+    # Incrementada a cada movimentação (trava otimista, ver SISTEMA/transicoes.py)
+    versao = models.PositiveIntegerField(default=0)
+
     class Meta:
         db_table = "fluxos_instancia"
         verbose_name = "Fluxo em Execução"
         verbose_name_plural = "Fluxos em Execução"
+        indexes = [
+            # abas de listar_instancias_fluxo (paginação por criado_em/id). Índices
+            # parciais, um por aba: o SQLite compila o filtro booleano como
+            # `NOT finalizado`, que não usa um índice composto iniciado por ele.
+            models.Index(
+                fields=["-criado_em", "-id"],
+                condition=models.Q(finalizado=False),
+                name="fluxo_inst_andamento_idx",
+            ),
+            models.Index(
+                fields=["-criado_em", "-id"],
+                condition=models.Q(finalizado=True),
+                name="fluxo_inst_finalizado_idx",
+            ),
+            # caixa de entrada: fluxos abertos cuja etapa atual é do setor/perfil
+            models.Index(
+                fields=["setor_atual", "perfil_atual", "-criado_em", "-id"],
+                condition=models.Q(finalizado=False),
+                name="fluxo_inst_caixa_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.nome} (baseado em {self.modelo.nome})"
 
+    def definir_etapa_atual(self, etapa):
+        """Aponta a etapa atual (ou None) e copia seu setor/perfil. Não salva."""
+        self.etapa_atual = etapa
+        self.setor_atual_id = etapa.setor_id if etapa else None
+        self.perfil_atual = etapa.perfil_aprovador if etapa else ""
+
 
 class EtapaInstancia(models.Model):
     """Etapas reais, clonadas do modelo, para controle de status."""
@@ -191,6 +289,14 @@ class EtapaInstancia(models.Model):
         verbose_name_plural = "Etapas da Instância"
         unique_together = ("fluxo_instancia", "ordem_etapa")
         ordering = ["fluxo_instancia", "ordem_etapa"]
+        indexes = [
+            # caixa de entrada por setor: só as etapas pendentes entram no índice
+            models.Index(
+                fields=["setor", "perfil_aprovador"],
+                condition=models.Q(concluida=False),
+                name="etapa_inst_pendente_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.fluxo_instancia.nome} - Etapa {self.ordem_etapa}: {self.nome}"
@@ -233,7 +339,72 @@ class MovimentacaoFluxo(models.Model):
         verbose_name = "Movimentação do Fluxo"
         verbose_name_plural = "Movimentações do Fluxo"
         ordering = ["-data_acao"]
+        indexes = [
+            # histórico de uma instância, do mais recente para o mais antigo
+            models.Index(fields=["fluxo_instancia", "-data_acao"], name="mov_inst_data_idx"),
+            # período das análises e da exportação (SISTEMA/analises.py)
+            models.Index(fields=["data_acao"], name="mov_data_idx"),
+        ]
 
     def __str__(self):
         usuario = self.usuario.username if self.usuario else "Sistema"
-        return f"{self.fluxo_instancia.nome if self.fluxo_instancia else 'Sem Fluxo'} | {self.etapa.nome if self.etapa else '—'} | {self.acao.nome if self.acao else '—'} por {usuario}"
\ No newline at end of file
+        return f"{self.fluxo_instancia.nome if self.fluxo_instancia else 'Sem Fluxo'} | {self.etapa.nome if self.etapa else '—'} | {self.acao.nome if self.acao else '—'} por {usuario}"
+
+# ==========================================================
+# ARQUIVO (FLUXOS FINALIZADOS HÁ MUITO TEMPO)
+# ==========================================================
+class FluxoArquivado(models.Model):
+    """
+    Fluxo finalizado retirado das tabelas de trabalho (SISTEMA/arquivamento.py).
+    Uma linha por fluxo: as etapas e o histórico ficam em `conteudo`, JSON
+    comprimido. O id é o mesmo da FluxoInstancia original.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    nome = models.CharField(max_length=200)
+    # sem chave estrangeira: o modelo pode ser excluído depois do arquivamento
+    modelo_id = models.BigIntegerField(null=True, blank=True)
+    modelo_nome = models.CharField(max_length=200)
+    criado_por = models.CharField(max_length=150, blank=True, default="")
+    criado_em = models.DateTimeField()
+    finalizado_em = models.DateTimeField()
+    total_etapas = models.PositiveIntegerField(default=0)
+    arquivado_em = models.DateTimeField(default=timezone.now)
+    conteudo = models.BinaryField()
+
+    class Meta:
+        db_table = "fluxos_arquivados"
+        verbose_name = "Fluxo Arquivado"
+        verbose_name_plural = "Fluxos Arquivados"
+
+    def __str__(self):
+        return f"{self.nome} (arquivado, baseado em {self.modelo_nome})"
+
+
+class AnaliseArquivada(models.Model):
+    """
+    Contribuição dos fluxos arquivados para as análises (SISTEMA/analises.py),
+    por métrica e por dia, gravada antes de as movimentações serem apagadas.
+    Os cálculos somam estas linhas às das tabelas de trabalho.
+    """
+    METRICAS = [("permanencia", "Permanência por etapa"), ("ciclo", "Tempo de ciclo")]
+
+    metrica = models.CharField(max_length=20, choices=METRICAS)
+    dia = models.DateField()
+    modelo_id = models.BigIntegerField(null=True, blank=True)
+    modelo = models.CharField(max_length=200, blank=True, default="")
+    # só na permanência por etapa
+    ordem = models.PositiveIntegerField(null=True, blank=True)
+    etapa = models.CharField(max_length=200, blank=True, default="")
+    quantidade = models.PositiveIntegerField()
+    # em segundos
+    soma = models.FloatField()
+    maximo = models.FloatField()
+
+    class Meta:
+        db_table = "analises_arquivadas"
+        verbose_name = "Análise Arquivada"
+        verbose_name_plural = "Análises Arquivadas"
+        indexes = [models.Index(fields=["metrica", "dia"], name="analise_arq_metrica_dia_idx")]
+
+    def __str__(self):
+        return f"{self.metrica} {self.dia} {self.modelo}"
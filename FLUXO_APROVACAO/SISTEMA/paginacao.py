@@ -0,0 +1,52 @@
+# SISTEMA/paginacao.py
+import base64
+from datetime import datetime
+from django.db.models import Q
+
+TAMANHO_PAGINA = 50
+
+
+# ==========================================================
+# PAGINAÇÃO POR CURSOR (KEYSET)
+# ==========================================================
+def codificar_cursor(data, pk):
+    """Transforma (data, id) em um token opaco para a URL."""
+    bruto = f"{data.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(bruto.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """Retorna (data, id) do cursor, ou None se o cursor for inválido."""
+    if not cursor:
+        return None
+    try:
+        data, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(data), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def paginar_por_cursor(queryset, cursor=None, campo_data='criado_em', tamanho=TAMANHO_PAGINA):
+    """
+    Pagina o queryset em ordem decrescente de (campo_data, id).
+    Em vez de OFFSET, filtra a partir da última linha vista, então o custo de
+    qualquer página é o mesmo da primeira. Retorna (itens, proximo_cursor).
+    """
+    queryset = queryset.order_by(f'-{campo_data}', '-id')
+
+    posicao = decodificar_cursor(cursor)
+    if posicao:
+        data, pk = posicao
+        queryset = queryset.filter(
+            Q(**{f'{campo_data}__lt': data}) | Q(**{campo_data: data, 'id__lt': pk})
+        )
+
+    # busca um item a mais só para saber se existe próxima página
+    itens = list(queryset[:tamanho + 1])
+    proximo_cursor = None
+    if len(itens) > tamanho:
+        itens = itens[:tamanho]
+        ultimo = itens[-1]
+        proximo_cursor = codificar_cursor(getattr(ultimo, campo_data), ultimo.pk)
+
+    return itens, proximo_cursor
@@ -0,0 +1,116 @@
+# SISTEMA/planos.py
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import Assinatura
+
+PLANO_PADRAO = "freemium"
+# Cada plano pago dura 30 dias a partir do pagamento
+DURACAO_PLANO = timedelta(days=30)
+# Se mudar o formato guardado no cache, troque o prefixo
+PREFIXO_CACHE = "plano:v1:"
+# usuários guardados na memória do processo (acima disso ela é esvaziada)
+MAX_MEMORIA = 10_000
+
+
+# ==========================================================
+# PLANO DO USUÁRIO (CACHE POR USUÁRIO COM TTL)
+# ==========================================================
+# Duas camadas: o cache compartilhado (settings.CACHES), que é invalidado
+# quando uma Assinatura muda e vale para todos os processos, e na frente dele
+# uma memória do processo que guarda o plano por PLANO_MEMORIA_TTL segundos.
+# Sem ela, com o DatabaseCache, ler request.plano custaria uma consulta por
+# requisição. invalidar() limpa a memória do próprio processo na hora; nos
+# outros, o plano antigo dura no máximo PLANO_MEMORIA_TTL segundos.
+_memoria = {}
+
+
+def _chave(usuario_id):
+    return f"{PREFIXO_CACHE}{usuario_id}"
+
+
+def assinatura_vigente(usuario_id):
+    """
+    Resumo da assinatura ativa mais recente: {'plano', 'data_inicio', 'data_fim'},
+    ou None se o usuário não tiver assinatura ativa. Consulta o banco no máximo
+    uma vez por TTL; o cache é invalidado quando uma Assinatura muda.
+    """
+    agora = time.monotonic()
+    guardado = _memoria.get(usuario_id)
+    if guardado is not None and guardado[0] > agora:
+        return dict(guardado[1]) or None
+
+    chave = _chave(usuario_id)
+    resumo = cache.get(chave)
+    if resumo is None:
+        assinatura = (
+            Assinatura.objects.filter(usuario_id=usuario_id, status="ativo")
+            .order_by("-data_inicio")
+            .values("plano", "data_inicio", "data_fim")
+            .first()
+        )
+        # guarda também a ausência de assinatura, para não consultar de novo
+        resumo = assinatura or {}
+        cache.set(chave, resumo, settings.PLANO_CACHE_TTL)
+    if settings.PLANO_MEMORIA_TTL:
+        if len(_memoria) >= MAX_MEMORIA:
+            _memoria.clear()
+        _memoria[usuario_id] = (agora + settings.PLANO_MEMORIA_TTL, resumo)
+    return dict(resumo) or None
+
+
+def plano_do_usuario(usuario_id):
+    assinatura = assinatura_vigente(usuario_id)
+    return assinatura["plano"] if assinatura else PLANO_PADRAO
+
+
+def invalidar(*usuario_ids):
+    for usuario_id in usuario_ids:
+        _memoria.pop(usuario_id, None)
+    cache.delete_many([_chave(usuario_id) for usuario_id in usuario_ids])
+
+
+def limpar_memoria():
+    """Esvazia a memória deste processo (o cache compartilhado fica como está)."""
+    _memoria.clear()
+
+
+# ==========================================================
+# EXPIRAÇÃO EM LOTE
+# ==========================================================
+def assinaturas_vencidas(hoje=None):
+    """Assinaturas ativas cujo prazo terminou (índice assin_vencimento_idx)."""
+    hoje = hoje or timezone.localdate()
+    return Assinatura.objects.filter(status="ativo", data_fim__lt=hoje)
+
+
+def expirar_vencidas(hoje=None, lote=1000):
+    """
+    Rebaixa para freemium todas as assinaturas vencidas, `lote` por vez, com um
+    UPDATE por lote. Pode ser executada de novo sem efeito colateral: cada UPDATE
+    refaz o filtro de status/vencimento. Retorna (expiradas, lotes).
+    """
+    hoje = hoje or timezone.localdate()
+    expiradas = lotes = 0
+    ultimo_id = 0
+    while True:
+        vencidas = list(
+            assinaturas_vencidas(hoje).filter(id__gt=ultimo_id)
+            .order_by("id").values_list("id", "usuario_id")[:lote]
+        )
+        if not vencidas:
+            break
+        ultimo_id = vencidas[-1][0]
+
+        # mesmo efeito de Assinatura.expire(), mas para o lote inteiro
+        expiradas += assinaturas_vencidas(hoje).filter(id__in=[i for i, _ in vencidas]).update(
+            plano=PLANO_PADRAO, status="inativo", data_fim=None
+        )
+        lotes += 1
+        # UPDATE em massa não dispara sinais: invalida o cache de planos aqui
+        invalidar(*{usuario_id for _, usuario_id in vencidas})
+
+    return expiradas, lotes
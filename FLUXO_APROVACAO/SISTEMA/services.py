@@ -0,0 +1,166 @@
+# SISTEMA/services.py
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import F, OuterRef, Subquery
+from .models import FluxoPadrao, EtapaFluxo, FluxoInstancia, EtapaInstancia
+from . import fragmentos
+
+
+# ==========================================================
+# MODELOS DE FLUXO
+# ==========================================================
+def criar_modelo_fluxo(fluxo, etapas):
+    """
+    Salva o modelo (ainda não salvo, vindo do FluxoPadraoForm) e suas etapas
+    em uma transação: ou o modelo fica completo, ou nada é gravado.
+    """
+    with transaction.atomic():
+        fluxo.save()
+        salvar_etapas_modelo(fluxo, etapas)
+    return fluxo
+
+
+def salvar_etapas_modelo(fluxo, etapas):
+    """
+    Substitui as etapas do modelo pela lista `etapas` (dicts com nome, setor,
+    perfil_aprovador e, para etapas existentes, id), já na ordem final.
+    Etapas existentes fora da lista são excluídas. Número fixo de consultas,
+    qualquer que seja a quantidade de etapas.
+    """
+    agora = timezone.now()
+    with transaction.atomic():
+        existentes = {e.id: e for e in fluxo.etapas.all()}
+        maior_ordem = max((e.ordem_etapa for e in existentes.values()), default=0)
+        mantidas, novas = [], []
+        for ordem, dados in enumerate(etapas, start=1):
+            etapa = existentes.pop(dados.get('id'), None)
+            if etapa is None:
+                etapa = EtapaFluxo(fluxo=fluxo, criado_em=agora)
+                novas.append(etapa)
+            else:
+                etapa.atualizado_em = agora
+                mantidas.append(etapa)
+            etapa.ordem_etapa = ordem
+            etapa.nome = dados['nome']
+            etapa.setor_id = dados.get('setor')
+            etapa.perfil_aprovador = dados.get('perfil_aprovador') or 'padrao'
+
+        if existentes:
+            EtapaFluxo.objects.filter(id__in=existentes).delete()
+        if mantidas:
+            # (fluxo, ordem_etapa) é único: primeiro afasta as mantidas para
+            # depois da maior ordem atual e da maior ordem final, senão trocar
+            # duas de lugar (ou crescer a lista) colide no bulk_update
+            EtapaFluxo.objects.filter(id__in=[e.id for e in mantidas]).update(
+                ordem_etapa=F('ordem_etapa') + maior_ordem + len(etapas)
+            )
+            EtapaFluxo.objects.bulk_update(
+                mantidas, ['ordem_etapa', 'nome', 'setor', 'perfil_aprovador', 'atualizado_em']
+            )
+        EtapaFluxo.objects.bulk_create(novas)
+        FluxoPadrao.objects.filter(id=fluxo.id).update(atualizado_em=agora)
+
+        # bulk_create/bulk_update não disparam post_save
+        transaction.on_commit(lambda: fragmentos.invalidar(fragmentos.MODELOS_FLUXO))
+
+
+# ==========================================================
+# INSTANCIAÇÃO DE FLUXOS
+# ==========================================================
+def etapas_do_modelo(fluxo_padrao):
+    """Lê as etapas do modelo em uma única consulta, só com os campos clonados."""
+    return list(
+        fluxo_padrao.etapas.order_by('ordem_etapa').values('nome', 'setor_id', 'perfil_aprovador')
+    )
+
+
+def _clonar_etapas(instancias, etapas_modelo, agora):
+    """Monta (sem salvar) as EtapaInstancia de cada instância a partir das etapas do modelo."""
+    return [
+        EtapaInstancia(
+            fluxo_instancia=instancia,
+            ordem_etapa=i,
+            nome=etapa['nome'],
+            setor_id=etapa['setor_id'],
+            perfil_aprovador=etapa['perfil_aprovador'],
+            criado_em=agora,
+        )
+        for instancia in instancias
+        for i, etapa in enumerate(etapas_modelo, start=1)
+    ]
+
+
+def criar_instancia(fluxo_padrao, nome, usuario=None):
+    """
+    Cria uma instância do fluxo padrão e clona suas etapas.
+    Tudo ocorre em uma transação: um INSERT da instância e um bulk_create das etapas.
+    """
+    return criar_instancias_em_lote(fluxo_padrao, [nome], usuario)[0]
+
+
+def criar_instancias_em_lote(fluxo_padrao, nomes, usuario=None, batch_size=1000, etapas_modelo=None):
+    """
+    Cria várias instâncias do mesmo fluxo padrão de uma só vez.
+    As etapas do modelo são lidas uma única vez e clonadas para todas as instâncias;
+    quem chama várias vezes para o mesmo modelo pode passá-las em `etapas_modelo`.
+    """
+    nomes = list(nomes)
+    if not nomes:
+        return []
+
+    agora = timezone.now()
+    if etapas_modelo is None:
+        etapas_modelo = etapas_do_modelo(fluxo_padrao)
+
+    with transaction.atomic():
+        instancias = FluxoInstancia.objects.bulk_create(
+            [
+                FluxoInstancia(
+                    modelo=fluxo_padrao,
+                    nome=nome,
+                    criado_por=usuario,
+                    criado_em=agora,
+                    total_etapas=len(etapas_modelo),
+                )
+                for nome in nomes
+            ],
+            batch_size=batch_size,
+        )
+        etapas = EtapaInstancia.objects.bulk_create(
+            _clonar_etapas(instancias, etapas_modelo, agora),
+            batch_size=batch_size,
+        )
+
+        # a etapa atual de cada instância nova é a primeira clonada. Um UPDATE por
+        # lote com subconsulta (índice único fluxo_instancia+ordem_etapa): o
+        # bulk_update montaria um CASE com um ramo por instância
+        if etapas_modelo:
+            for instancia, primeira in zip(instancias, etapas[::len(etapas_modelo)]):
+                instancia.definir_etapa_atual(primeira)
+            primeira_etapa = EtapaInstancia.objects.filter(
+                fluxo_instancia=OuterRef('pk'), ordem_etapa=1
+            ).values('id')[:1]
+            for inicio in range(0, len(instancias), batch_size):
+                FluxoInstancia.objects.filter(
+                    id__in=[i.id for i in instancias[inicio:inicio + batch_size]]
+                ).update(
+                    etapa_atual=Subquery(primeira_etapa),
+                    setor_atual_id=etapas_modelo[0]['setor_id'],
+                    perfil_atual=etapas_modelo[0]['perfil_aprovador'],
+                )
+
+    return instancias
+
+
+# ==========================================================
+# CAIXA DE ENTRADA POR SETOR
+# ==========================================================
+def pendencias_do_setor(setor_id, perfil):
+    """
+    Fluxos abertos cuja etapa atual espera o setor/perfil informado.
+    Filtra pelos campos copiados da etapa atual (índice fluxo_inst_caixa_idx),
+    sem percorrer as etapas de cada fluxo.
+    """
+    return FluxoInstancia.objects.filter(
+        finalizado=False, setor_atual_id=setor_id, perfil_atual=perfil
+    ).select_related('modelo', 'etapa_atual')
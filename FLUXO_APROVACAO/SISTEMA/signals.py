@@ -0,0 +1,38 @@
+# SISTEMA/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import AcaoFluxo, Assinatura, FluxoPadrao, EtapaFluxo, Usuario
+from . import acoes, fragmentos, planos
+
+
+@receiver([post_save, post_delete], sender=AcaoFluxo)
+def invalidar_registro_acoes(sender, **kwargs):
+    acoes.limpar_cache()
+
+
+@receiver([post_save, post_delete], sender=Assinatura)
+def invalidar_plano_do_usuario(sender, instance, **kwargs):
+    # só depois do commit, para ninguém recolocar no cache o plano antigo
+    transaction.on_commit(lambda: planos.invalidar(instance.usuario_id))
+
+
+@receiver(post_save, sender=Usuario)
+def esquecer_plano_de_usuario_novo(sender, instance, created, **kwargs):
+    # um id pode ser reaproveitado (SQLite reusa o maior id apagado): o usuário
+    # novo não herda o plano que ficou em cache para o antigo
+    if created:
+        planos.invalidar(instance.id)
+
+
+@receiver([post_save, post_delete], sender=FluxoPadrao)
+@receiver([post_save, post_delete], sender=EtapaFluxo)
+def invalidar_fragmentos_modelos(sender, **kwargs):
+    transaction.on_commit(lambda: fragmentos.invalidar(fragmentos.MODELOS_FLUXO))
+
+
+@receiver(post_save, sender=Usuario)
+def invalidar_fragmentos_do_criador(sender, update_fields=None, **kwargs):
+    # a listagem de modelos mostra o username de quem criou; o login só grava last_login
+    if update_fields is None or 'username' in update_fields:
+        transaction.on_commit(lambda: fragmentos.invalidar(fragmentos.MODELOS_FLUXO))
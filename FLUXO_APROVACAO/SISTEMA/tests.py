@@ -1,3 +1,1543 @@
-from django.test import TestCase
+import csv
+import json
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Usuario, Setor, FluxoPadrao, EtapaFluxo, FluxoInstancia, EtapaInstancia, MovimentacaoFluxo, AcaoFluxo,
+    Assinatura, Pagamento, EventoWebhook, FluxoArquivado,
+)
+from .services import criar_instancia, criar_instancias_em_lote, salvar_etapas_modelo
+from .paginacao import TAMANHO_PAGINA
+from . import acoes, analises, arquivamento, busca, cobranca, exportacao, fila, importacao, instrumentacao, planos, transicoes, urls, views
+from .benchmark import cenarios, semeadura
+from .middleware import PlanoMiddleware
+from .transicoes import TransicaoInvalida, ConflitoTransicao
+
+
+def criar_modelo(num_etapas=3, nome="Compras"):
+    """Cria um FluxoPadrao com `num_etapas` etapas alternando entre dois setores."""
+    setores = [
+        Setor.objects.get_or_create(nome="Financeiro")[0],
+        Setor.objects.get_or_create(nome="Engenharia")[0],
+    ]
+    fluxo = FluxoPadrao.objects.create(nome=nome)
+    EtapaFluxo.objects.bulk_create([
+        EtapaFluxo(fluxo=fluxo, ordem_etapa=i, nome=f"Etapa {i}", setor=setores[i % 2])
+        for i in range(1, num_etapas + 1)
+    ])
+    return fluxo
+
+
+def consultas_fora_do_cache(contexto):
+    """Consultas capturadas, menos as da tabela do cache compartilhado (settings.CACHES).
+
+    O DatabaseCache grava dentro de transaction.atomic, então os SAVEPOINT que
+    ele abre também ficam de fora.
+    """
+    tabela = settings.CACHES["default"].get("LOCATION", "")
+    return [
+        q["sql"] for q in contexto.captured_queries
+        if f'"{tabela}"' not in q["sql"] and "SAVEPOINT" not in q["sql"]
+    ]
+
+
+class CriarInstanciaServiceTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.modelo = criar_modelo(num_etapas=30)
+
+    def test_clona_etapas_na_ordem_do_modelo(self):
+        instancia = criar_instancia(self.modelo, "Pedido 1", self.usuario)
+
+        etapas = list(instancia.etapas.order_by('ordem_etapa'))
+        modelo = list(self.modelo.etapas.order_by('ordem_etapa'))
+        self.assertEqual(len(etapas), 30)
+        self.assertEqual(
+            [(e.ordem_etapa, e.nome, e.setor_id) for e in etapas],
+            [(m.ordem_etapa, m.nome, m.setor_id) for m in modelo],
+        )
+        self.assertEqual(instancia.criado_por, self.usuario)
+
+    def test_numero_de_consultas_nao_depende_do_numero_de_etapas(self):
+        # leitura das etapas + INSERT da instância + INSERT das etapas
+        # + ponteiro da etapa atual + savepoint
+        with self.assertNumQueries(6):
+            criar_instancia(self.modelo, "Pedido 1", self.usuario)
+
+    def test_inicializa_progresso(self):
+        instancia = criar_instancia(self.modelo, "Pedido 1", self.usuario)
+        instancia.refresh_from_db()
+
+        self.assertEqual(instancia.total_etapas, 30)
+        self.assertEqual(instancia.etapas_concluidas, 0)
+        self.assertEqual(instancia.etapa_atual.ordem_etapa, 1)
+
+    def test_lote_cria_todas_as_instancias(self):
+        instancias = criar_instancias_em_lote(self.modelo, [f"Pedido {i}" for i in range(10)], self.usuario)
+
+        self.assertEqual(len(instancias), 10)
+        self.assertEqual(FluxoInstancia.objects.count(), 10)
+        self.assertEqual(EtapaInstancia.objects.count(), 300)
+
+
+class ListarInstanciasTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.client.force_login(self.usuario)
+        self.modelo = criar_modelo(num_etapas=2)
+
+    def _criar_instancias(self, quantidade, finalizado=False):
+        instancias = criar_instancias_em_lote(
+            self.modelo, [f"Pedido {i}" for i in range(quantidade)], self.usuario
+        )
+        FluxoInstancia.objects.filter(id__in=[i.id for i in instancias]).update(finalizado=finalizado)
+
+    def _contar_consultas(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.get(reverse('listar_instancias_fluxo'))
+        return len(contexto)
+
+    def test_numero_de_consultas_constante(self):
+        self._criar_instancias(3)
+        self._criar_instancias(3, finalizado=True)
+        poucas = self._contar_consultas()
+
+        self._criar_instancias(TAMANHO_PAGINA * 2)
+        self._criar_instancias(TAMANHO_PAGINA * 2, finalizado=True)
+        muitas = self._contar_consultas()
+
+        self.assertEqual(poucas, muitas)
+
+    def test_cursor_percorre_todas_as_instancias_sem_repetir(self):
+        self._criar_instancias(TAMANHO_PAGINA + 7)
+
+        vistos = []
+        cursor = ''
+        while True:
+            resposta = self.client.get(reverse('listar_instancias_fluxo'), {'cursor_andamento': cursor})
+            vistos += [i.id for i in resposta.context['em_andamento']]
+            cursor = resposta.context['proximo_andamento']
+            if not cursor:
+                break
+
+        self.assertEqual(len(vistos), TAMANHO_PAGINA + 7)
+        self.assertEqual(len(set(vistos)), len(vistos))
+
+    def test_cursor_invalido_volta_para_primeira_pagina(self):
+        self._criar_instancias(3)
+        resposta = self.client.get(reverse('listar_instancias_fluxo'), {'cursor_andamento': 'lixo'})
+        self.assertEqual(len(resposta.context['em_andamento']), 3)
+
+
+class ProgressoInstanciaTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.client.force_login(self.usuario)
+        self.instancia = criar_instancia(criar_modelo(num_etapas=3), "Pedido 1", self.usuario)
+
+    def _mover(self, acao, ordem):
+        etapa = self.instancia.etapas.get(ordem_etapa=ordem)
+        self.client.post(
+            reverse('mover_etapa', args=[self.instancia.id, etapa.id]), {'acao': acao}
+        )
+        self.instancia.refresh_from_db()
+
+    def test_avancar_move_ponteiro_e_contadores(self):
+        self._mover('avancar', 1)
+
+        self.assertEqual(self.instancia.etapas_concluidas, 1)
+        self.assertEqual(self.instancia.etapa_atual.ordem_etapa, 2)
+        self.assertFalse(self.instancia.finalizado)
+
+    def test_avancar_ultima_etapa_finaliza(self):
+        for ordem in (1, 2, 3):
+            self._mover('avancar', ordem)
+
+        self.assertEqual(self.instancia.etapas_concluidas, 3)
+        self.assertIsNone(self.instancia.etapa_atual)
+        self.assertTrue(self.instancia.finalizado)
+
+    def test_retornar_reabre_etapa_anterior(self):
+        for ordem in (1, 2, 3):
+            self._mover('avancar', ordem)
+        self._mover('retornar', 3)
+
+        self.assertEqual(self.instancia.etapas_concluidas, 1)
+        self.assertEqual(self.instancia.etapa_atual.ordem_etapa, 2)
+        self.assertFalse(self.instancia.finalizado)
+
+
+class TransicoesTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.instancia = criar_instancia(criar_modelo(num_etapas=3), "Pedido 1", self.usuario)
+        self.etapas = list(self.instancia.etapas.order_by('ordem_etapa'))
+
+    def test_avancar_etapa_fora_de_ordem_e_recusado(self):
+        with self.assertRaises(TransicaoInvalida):
+            transicoes.avancar(self.instancia.id, self.etapas[1].id, self.usuario)
+        self.assertFalse(MovimentacaoFluxo.objects.exists())
+
+    def test_versao_desatualizada_gera_conflito(self):
+        transicoes.avancar(self.instancia.id, self.etapas[0].id, self.usuario, versao=0)
+
+        with self.assertRaises(ConflitoTransicao):
+            transicoes.avancar(self.instancia.id, self.etapas[1].id, self.usuario, versao=0)
+        self.assertEqual(MovimentacaoFluxo.objects.count(), 1)
+
+    def test_transicao_invalida_nao_consome_versao(self):
+        with self.assertRaises(TransicaoInvalida):
+            transicoes.retornar(self.instancia.id, self.etapas[0].id, self.usuario)
+        self.instancia.refresh_from_db()
+        self.assertEqual(self.instancia.versao, 0)
+
+    def test_rejeitar_volta_para_primeira_etapa(self):
+        transicoes.avancar(self.instancia.id, self.etapas[0].id, self.usuario)
+        transicoes.avancar(self.instancia.id, self.etapas[1].id, self.usuario)
+        instancia = transicoes.rejeitar(self.instancia.id, self.etapas[2].id, self.usuario)
+
+        self.assertEqual(instancia.etapa_atual_id, self.etapas[0].id)
+        self.assertEqual(instancia.etapas_concluidas, 0)
+        self.assertFalse(EtapaInstancia.objects.filter(concluida=True).exists())
+
+
+class RegistroAcoesTests(TestCase):
+    def setUp(self):
+        acoes.limpar_cache()
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.instancia = criar_instancia(criar_modelo(num_etapas=3), "Pedido 1", self.usuario)
+        self.etapas = list(self.instancia.etapas.order_by('ordem_etapa'))
+
+    def test_transicao_nao_consulta_tabela_de_acoes(self):
+        transicoes.avancar(self.instancia.id, self.etapas[0].id, self.usuario)
+
+        with CaptureQueriesContext(connection) as contexto:
+            transicoes.avancar(self.instancia.id, self.etapas[1].id, self.usuario)
+        self.assertFalse([q for q in contexto.captured_queries if '"acoes_fluxo"' in q['sql']])
+
+    def test_alteracao_de_acao_invalida_o_registro(self):
+        self.assertEqual(acoes.obter_acao_id(acoes.AVANCAR), AcaoFluxo.objects.get(nome=acoes.AVANCAR).id)
+
+        AcaoFluxo.objects.filter(nome=acoes.AVANCAR).delete()
+        nova = AcaoFluxo.objects.create(nome=acoes.AVANCAR)
+
+        self.assertEqual(acoes.obter_acao_id(acoes.AVANCAR), nova.id)
+
+    def test_acao_criada_em_outro_processo_recarrega_o_registro(self):
+        acoes.obter_acao_id(acoes.AVANCAR)
+        # como em outro processo: bulk_create não dispara o sinal que limparia o registro
+        AcaoFluxo.objects.bulk_create([AcaoFluxo(nome="Arquivar")])
+
+        self.assertEqual(acoes.obter_acao_id("Arquivar"), AcaoFluxo.objects.get(nome="Arquivar").id)
+        self.assertEqual(AcaoFluxo.objects.filter(nome="Arquivar").count(), 1)
+
+
+class RegistroAcoesDesatualizadoTests(TransactionTestCase):
+    def setUp(self):
+        acoes.limpar_cache()
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.instancia = criar_instancia(criar_modelo(num_etapas=3), "Pedido 1", self.usuario)
+
+    def test_id_removido_em_outro_processo_repete_a_transicao(self):
+        acoes.obter_acao_id(acoes.AVANCAR)
+        # a ação foi excluída e recriada por outro worker; o registro deste ficou velho
+        acoes._ids_por_nome[acoes.AVANCAR] = AcaoFluxo.objects.order_by('-id').first().id + 100
+
+        transicoes.avancar(self.instancia.id, self.instancia.etapa_atual_id, self.usuario)
+
+        movimentacao = MovimentacaoFluxo.objects.get(fluxo_instancia=self.instancia)
+        self.assertEqual(movimentacao.acao.nome, acoes.AVANCAR)
+        self.assertEqual(FluxoInstancia.objects.get(id=self.instancia.id).versao, self.instancia.versao + 1)
+
+
+class TransicoesConcorrentesTests(TransactionTestCase):
+    THREADS = 8
+    MOVIMENTOS_POR_THREAD = 40
+
+    def setUp(self):
+        # TransactionTestCase esvazia as tabelas sem disparar sinais
+        acoes.limpar_cache()
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.instancia = criar_instancia(criar_modelo(num_etapas=5), "Pedido 1", self.usuario)
+
+    def _aprovador(self, semente, resultados):
+        aleatorio = random.Random(semente)
+        sucessos = conflitos = 0
+        try:
+            for _ in range(self.MOVIMENTOS_POR_THREAD):
+                instancia = FluxoInstancia.objects.get(id=self.instancia.id)
+                etapa_id = instancia.etapa_atual_id
+                if etapa_id is None:
+                    etapa_id = instancia.etapas.order_by('-ordem_etapa').values_list('id', flat=True).first()
+                acao = aleatorio.choice([transicoes.avancar, transicoes.avancar, transicoes.retornar])
+                try:
+                    acao(instancia.id, etapa_id, self.usuario, versao=instancia.versao)
+                    sucessos += 1
+                except ConflitoTransicao:
+                    conflitos += 1
+                except TransicaoInvalida:
+                    pass
+        finally:
+            connections.close_all()
+        resultados.append((sucessos, conflitos))
+
+    def test_historico_e_estado_consistentes_sob_concorrencia(self):
+        resultados = []
+        threads = [
+            threading.Thread(target=self._aprovador, args=(semente, resultados))
+            for semente in range(self.THREADS)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(resultados), self.THREADS)
+        sucessos = sum(s for s, _ in resultados)
+
+        instancia = FluxoInstancia.objects.get(id=self.instancia.id)
+        etapas = list(instancia.etapas.order_by('ordem_etapa'))
+        concluidas = [e.concluida for e in etapas]
+        pendentes = [e for e in etapas if not e.concluida]
+
+        # uma movimentação e um incremento de versão por transição aceita
+        self.assertEqual(MovimentacaoFluxo.objects.filter(fluxo_instancia=instancia).count(), sucessos)
+        self.assertEqual(instancia.versao, sucessos)
+        # etapas concluídas formam sempre um prefixo do fluxo
+        self.assertEqual(concluidas, sorted(concluidas, reverse=True))
+        self.assertEqual(instancia.etapas_concluidas, len(etapas) - len(pendentes))
+        self.assertEqual(instancia.etapa_atual_id, pendentes[0].id if pendentes else None)
+        self.assertEqual(instancia.finalizado, not pendentes)
+
+
+class DetalharInstanciaTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.client.force_login(self.usuario)
+
+    def _contar_consultas(self, num_etapas, ciclos):
+        instancia = criar_instancia(criar_modelo(num_etapas=num_etapas, nome=f"Modelo {num_etapas}"), "Pedido", self.usuario)
+        etapas = list(instancia.etapas.order_by('ordem_etapa'))
+        # avança e retorna a segunda etapa repetidamente para acumular histórico
+        transicoes.avancar(instancia.id, etapas[0].id, self.usuario)
+        for _ in range(ciclos):
+            transicoes.avancar(instancia.id, etapas[1].id, self.usuario)
+            transicoes.retornar(instancia.id, etapas[2].id, self.usuario)
+
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(reverse('detalhar_instancia_fluxo', args=[instancia.id]))
+        self.assertEqual(resposta.status_code, 200)
+        return len(contexto)
+
+    def test_numero_de_consultas_nao_cresce_com_historico(self):
+        self.assertEqual(self._contar_consultas(3, 1), self._contar_consultas(30, TAMANHO_PAGINA))
+
+
+class CaixaEntradaTests(TestCase):
+    def setUp(self):
+        self.modelo = criar_modelo(num_etapas=3)
+        self.etapas_modelo = list(self.modelo.etapas.order_by('ordem_etapa'))
+        # etapa 1 -> Engenharia, etapa 2 -> Financeiro (ver criar_modelo)
+        self.usuario = Usuario.objects.create_user(
+            username="ana", password="senha-forte-123", setor=self.etapas_modelo[1].setor
+        )
+        self.client.force_login(self.usuario)
+
+    def test_lista_apenas_fluxos_com_etapa_atual_do_setor(self):
+        aguardando, outro = criar_instancias_em_lote(self.modelo, ["Aguardando", "Outro setor"], self.usuario)
+        transicoes.avancar(aguardando.id, aguardando.etapas.get(ordem_etapa=1).id, self.usuario)
+
+        resposta = self.client.get(reverse('caixa_entrada_json'))
+
+        itens = resposta.json()['itens']
+        self.assertEqual([i['instancia_id'] for i in itens], [aguardando.id])
+        self.assertEqual(itens[0]['ordem_etapa'], 2)
+
+    def test_numero_de_consultas_constante(self):
+        def contar():
+            cache.clear()
+            with CaptureQueriesContext(connection) as contexto:
+                self.client.get(reverse('caixa_entrada'))
+            return len(contexto)
+
+        instancias = criar_instancias_em_lote(self.modelo, ["Pedido"] * 3, self.usuario)
+        for instancia in instancias:
+            transicoes.avancar(instancia.id, instancia.etapa_atual_id, self.usuario)
+        poucas = contar()
+
+        instancias = criar_instancias_em_lote(self.modelo, ["Pedido"] * (TAMANHO_PAGINA + 5), self.usuario)
+        for instancia in instancias:
+            transicoes.avancar(instancia.id, instancia.etapa_atual_id, self.usuario)
+        self.assertEqual(poucas, contar())
+
+
+@mock.patch('SISTEMA.views.WEBHOOK_SECRET', 'segredo')
+class WebhookTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+
+    def _payload(self, event_id="evt_1", billing_id="bill_1", external_id="1"):
+        return {
+            "id": event_id,
+            "event": "billing.paid",
+            "data": {
+                "payment": {"amount": 8990, "fee": 80, "method": "PIX"},
+                "billing": {
+                    "id": billing_id,
+                    "amount": 8990,
+                    "products": [{"externalId": external_id}],
+                    "metadata": {"usuario_id": str(self.usuario.id)},
+                },
+            },
+        }
+
+    def _enviar(self, payload):
+        return self.client.post(
+            reverse('abacatepay_webhook') + '?secret=segredo',
+            data=json.dumps(payload),
+            content_type='application/json',
+        )
+
+    def test_webhook_so_enfileira(self):
+        resposta = self._enviar(self._payload())
+
+        self.assertEqual(resposta.json(), {"status": "queued"})
+        self.assertEqual(EventoWebhook.objects.get().status, "pendente")
+        self.assertFalse(Assinatura.objects.exists())
+
+    def test_reenvio_do_mesmo_evento_e_descartado(self):
+        self._enviar(self._payload())
+        resposta = self._enviar(self._payload())
+
+        self.assertEqual(resposta.json(), {"status": "duplicate"})
+        self.assertEqual(EventoWebhook.objects.count(), 1)
+
+    def test_worker_ativa_assinatura_e_registra_pagamento(self):
+        self._enviar(self._payload(external_id="2"))
+
+        self.assertEqual(fila.processar_pendentes(), 1)
+
+        self.assertEqual(EventoWebhook.objects.get().status, "processado")
+        self.assertEqual(Assinatura.objects.get(usuario=self.usuario).plano, "ouro")
+        pagamento = Pagamento.objects.get()
+        self.assertEqual((pagamento.billing_id, pagamento.amount, pagamento.fee), ("bill_1", 8990, 80))
+
+    def test_mesma_cobranca_em_eventos_diferentes_gera_um_pagamento(self):
+        self._enviar(self._payload(event_id="evt_1"))
+        self._enviar(self._payload(event_id="evt_2"))
+
+        fila.processar_pendentes()
+
+        self.assertEqual(Pagamento.objects.count(), 1)
+        self.assertEqual(
+            sorted(EventoWebhook.objects.values_list("status", flat=True)), ["ignorado", "processado"]
+        )
+
+    def test_falha_espera_antes_de_repetir_e_para_no_limite(self):
+        self._enviar(self._payload())
+
+        with mock.patch.object(fila, "_aplicar_evento", side_effect=RuntimeError("banco fora")), \
+                self.assertLogs("SISTEMA.fila", "ERROR"):
+            for tentativa in range(1, fila.MAX_TENTATIVAS):
+                antes = timezone.now()
+                self.assertEqual(fila.processar_pendentes(), 1)
+                evento = EventoWebhook.objects.get()
+                self.assertEqual((evento.status, evento.tentativas), ("pendente", tentativa))
+                self.assertGreaterEqual(evento.proxima_tentativa_em, antes + fila.espera_apos(tentativa))
+                # antes da hora marcada o evento não é pego de novo
+                self.assertEqual(fila.processar_pendentes(), 0)
+                EventoWebhook.objects.update(proxima_tentativa_em=timezone.now())
+
+            self.assertEqual(fila.processar_pendentes(), 1)
+
+        evento = EventoWebhook.objects.get()
+        self.assertEqual((evento.status, evento.tentativas, evento.erro), ("erro", fila.MAX_TENTATIVAS, "banco fora"))
+        # "erro" é final: sai da fila mesmo com a hora marcada vencida
+        self.assertEqual(fila.processar_pendentes(), 0)
+
+    def test_espera_dobra_ate_o_maximo(self):
+        self.assertEqual(
+            [fila.espera_apos(n) for n in (1, 2, 3)],
+            [timedelta(minutes=1), timedelta(minutes=2), timedelta(minutes=4)],
+        )
+        self.assertEqual(fila.espera_apos(20), fila.ESPERA_MAXIMA)
+
+    async def test_webhook_async_enfileira_e_descarta_reenvio(self):
+        def requisicao():
+            return AsyncRequestFactory().post(
+                '/webhook/?secret=segredo', data=json.dumps(self._payload()), content_type='application/json'
+            )
+
+        primeira = await views.abacatepay_webhook_async(requisicao())
+        segunda = await views.abacatepay_webhook_async(requisicao())
+
+        self.assertEqual(json.loads(primeira.content), {"status": "queued"})
+        self.assertEqual(json.loads(segunda.content), {"status": "duplicate"})
+        self.assertEqual(await EventoWebhook.objects.acount(), 1)
+
+
+class StubAbacatePay(BaseHTTPRequestHandler):
+    """Servidor local que imita POST /billing/create; `respostas` é consumida em ordem."""
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    respostas = []
+    conexoes = set()
+
+    def do_POST(self):
+        StubAbacatePay.conexoes.add(self.client_address)
+        corpo = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        status = StubAbacatePay.respostas.pop(0) if StubAbacatePay.respostas else 200
+        dados = {"data": {"url": f"https://pay.test/{corpo['products'][0]['externalId']}"}} if status == 200 else {"error": "falhou"}
+        resposta = json.dumps(dados).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(resposta)))
+        self.end_headers()
+        self.wfile.write(resposta)
+
+    def log_message(self, *args):
+        pass
+
+
+class ClienteAbacatePayTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servidor = ThreadingHTTPServer(('127.0.0.1', 0), StubAbacatePay)
+        cls.servidor.daemon_threads = True
+        threading.Thread(target=cls.servidor.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.servidor.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubAbacatePay.respostas = []
+        StubAbacatePay.conexoes = set()
+        self.cliente = cobranca.ClienteAbacatePay(self.url, 'chave', backoff=0, limite_falhas=2, tempo_aberto=60)
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.client.force_login(self.usuario)
+
+    def test_checkouts_redirecionam_e_reaproveitam_conexao(self):
+        with mock.patch('SISTEMA.views.obter_cliente', return_value=self.cliente):
+            prata = self.client.get(reverse('checkout_prata'))
+            ouro = self.client.get(reverse('checkout_ouro'))
+
+        self.assertEqual(prata.url, 'https://pay.test/1')
+        self.assertEqual(ouro.url, 'https://pay.test/2')
+        # keep-alive: as duas chamadas usaram a mesma conexão TCP
+        self.assertEqual(len(StubAbacatePay.conexoes), 1)
+        self.assertEqual(self.cliente.metricas.resumo()['chamadas'], 2)
+
+    def test_repete_quando_gateway_falha(self):
+        StubAbacatePay.respostas = [503]
+        self.assertEqual(self.cliente.criar_cobranca({"products": [{"externalId": "1"}]})['url'], 'https://pay.test/1')
+
+    def test_disjuntor_abre_apos_falhas_seguidas(self):
+        StubAbacatePay.respostas = [500] * 10
+        for _ in range(2):
+            with self.assertRaises(cobranca.ErroCobranca):
+                self.cliente.criar_cobranca({"products": [{"externalId": "1"}]})
+
+        with mock.patch('SISTEMA.views.obter_cliente', return_value=self.cliente):
+            resposta = self.client.get(reverse('checkout_prata'))
+
+        self.assertEqual(resposta.status_code, 503)
+        self.assertEqual(self.cliente.metricas.resumo()['recusadas'], 1)
+
+    def test_nao_repete_post_quando_o_gateway_pode_ter_cobrado(self):
+        StubAbacatePay.respostas = [502, 504]
+        with self.assertRaises(cobranca.ErroCobranca):
+            self.cliente.criar_cobranca({"products": [{"externalId": "1"}]})
+        # um só pedido: o 504 seguinte não foi consumido
+        self.assertEqual(StubAbacatePay.respostas, [504])
+
+    def test_disjuntor_meio_aberto_deixa_uma_chamada_passar(self):
+        disjuntor = cobranca.Disjuntor(limite_falhas=1, tempo_aberto=60)
+        disjuntor.registrar_falha()
+        self.assertFalse(disjuntor.permitir())
+
+        disjuntor.aberto_ate = time.monotonic() - 1  # o tempo aberto passou
+        self.assertTrue(disjuntor.permitir())
+        self.assertFalse(disjuntor.permitir())  # as outras esperam a chamada de teste
+        disjuntor.registrar_falha()
+        self.assertFalse(disjuntor.permitir())  # falhou: abre de novo
+
+        disjuntor.aberto_ate = time.monotonic() - 1
+        self.assertTrue(disjuntor.permitir())
+        disjuntor.registrar_sucesso()
+        self.assertTrue(disjuntor.permitir())
+        self.assertTrue(disjuntor.permitir())
+
+    async def test_checkout_async_usa_o_mesmo_stub(self):
+        cliente = cobranca.ClienteAbacatePayAsync(self.url, 'chave', backoff=0)
+        StubAbacatePay.respostas = [503]
+        request = AsyncRequestFactory().get('/checkout/ouro/')
+
+        async def auser():
+            return self.usuario
+        request.auser = auser
+
+        try:
+            with mock.patch('SISTEMA.views.obter_cliente_async', return_value=cliente):
+                resposta = await views.checkout_ouro_async(request)
+        finally:
+            await cliente.client.aclose()
+
+        # o 503 foi repetido e a segunda tentativa criou a cobrança
+        self.assertEqual(resposta.url, 'https://pay.test/2')
+        self.assertEqual(cliente.metricas.resumo()['chamadas'], 1)
+
+
+class PlanoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+
+    def _plano_da_requisicao(self):
+        request = RequestFactory().get('/')
+        request.user = self.usuario
+        PlanoMiddleware(lambda r: None)(request)
+        return request.plano
+
+    def test_sem_assinatura_e_freemium(self):
+        self.assertEqual(self._plano_da_requisicao(), "freemium")
+
+    def test_plano_em_cache_nao_consulta_o_banco(self):
+        Assinatura.objects.create(usuario=self.usuario, plano="prata", data_inicio=timezone.localdate())
+        self.assertEqual(str(self._plano_da_requisicao()), "prata")
+
+        # nem o banco nem a tabela do cache compartilhado: vem da memória do processo
+        with self.assertNumQueries(0):
+            self.assertEqual(str(self._plano_da_requisicao()), "prata")
+
+    def test_sem_memoria_le_o_cache_compartilhado(self):
+        Assinatura.objects.create(usuario=self.usuario, plano="prata", data_inicio=timezone.localdate())
+        self.assertEqual(planos.plano_do_usuario(self.usuario.id), "prata")
+        # outro processo: só o cache compartilhado, sem consultar assinaturas
+        planos.limpar_memoria()
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(planos.plano_do_usuario(self.usuario.id), "prata")
+        self.assertEqual(consultas_fora_do_cache(ctx), [])
+
+    def test_resumo_assinatura_vem_do_cache(self):
+        assinatura = Assinatura.objects.create(usuario=self.usuario, plano="ouro", data_inicio=timezone.localdate())
+        self.assertEqual(self.usuario.resumo_assinatura()["plano"], "ouro")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.usuario.resumo_assinatura()["plano"], "ouro")
+        # o método do modelo continua devolvendo a Assinatura
+        self.assertEqual(self.usuario.assinatura_atual(), assinatura)
+
+    def test_alteracao_da_assinatura_invalida_o_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            assinatura = Assinatura.objects.create(usuario=self.usuario, plano="prata", data_inicio=timezone.localdate())
+        self.assertEqual(planos.plano_do_usuario(self.usuario.id), "prata")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            assinatura.plano = "ouro"
+            assinatura.save()
+
+        self.assertEqual(planos.plano_do_usuario(self.usuario.id), "ouro")
+
+
+class ExpirarAssinaturasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        hoje = timezone.localdate()
+        self.usuarios = Usuario.objects.bulk_create([Usuario(username=f"u{i}") for i in range(5)])
+        self.vencidas = Assinatura.objects.bulk_create([
+            Assinatura(usuario=u, plano="prata", data_inicio=hoje - timedelta(days=40), data_fim=hoje - timedelta(days=10))
+            for u in self.usuarios[:3]
+        ])
+        self.vigente = Assinatura.objects.create(
+            usuario=self.usuarios[3], plano="ouro", data_inicio=hoje, data_fim=hoje + timedelta(days=30)
+        )
+
+    def test_expira_so_as_vencidas_em_lotes(self):
+        # carrega o cache antes, para conferir a invalidação
+        self.assertEqual(planos.plano_do_usuario(self.usuarios[0].id), "prata")
+
+        saida = StringIO()
+        call_command('expirar_assinaturas', '--lote', '2', stdout=saida)
+
+        self.assertIn('3 assinatura(s) expirada(s) em 2 lote(s)', saida.getvalue())
+        self.assertEqual(Assinatura.objects.filter(status="ativo").get(), self.vigente)
+        self.assertEqual(planos.plano_do_usuario(self.usuarios[0].id), "freemium")
+
+    def test_reexecucao_nao_altera_nada(self):
+        self.assertEqual(planos.expirar_vencidas(), (3, 1))
+        self.assertEqual(planos.expirar_vencidas(), (0, 0))
+
+
+class ListarModelosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.client.force_login(self.usuario)
+
+    def _criar_modelos(self, quantidade, inicio=0):
+        for i in range(inicio, inicio + quantidade):
+            modelo = criar_modelo(i % 4 + 1, nome=f"Modelo {i:03d}")
+            modelo.criado_por = self.usuario
+            modelo.save()
+
+    def _consultas(self, params=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('listar_modelos_fluxo'), params)
+        return len(ctx.captured_queries)
+
+    def test_numero_de_consultas_constante(self):
+        self._criar_modelos(3)
+        poucas = self._consultas()
+        self._criar_modelos(TAMANHO_PAGINA + 10, inicio=3)
+
+        self.assertEqual(poucas, self._consultas())
+        self.assertEqual(poucas, self._consultas({'ordem': '-etapas', 'pagina': 2}))
+
+    def test_ordena_pela_contagem_de_etapas_e_pagina(self):
+        self._criar_modelos(TAMANHO_PAGINA + 10)
+
+        resposta = self.client.get(reverse('listar_modelos_fluxo'), {'ordem': '-etapas'})
+        contagens = [f.num_etapas for f in resposta.context['fluxos']]
+        self.assertEqual(contagens, sorted(contagens, reverse=True))
+        self.assertEqual(len(contagens), TAMANHO_PAGINA)
+
+        resposta = self.client.get(reverse('listar_modelos_fluxo'), {'ordem': '-etapas', 'pagina': 2})
+        self.assertEqual(len(resposta.context['fluxos']), 10)
+        self.assertContains(resposta, "Página 2 de 2")
+
+    def test_ordem_invalida_usa_a_padrao(self):
+        resposta = self.client.get(reverse('listar_modelos_fluxo'), {'ordem': 'senha'})
+        self.assertEqual(resposta.context['ordem'], '-criado_em')
+
+
+class FragmentosModelosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.client.force_login(self.usuario)
+        self.modelo = criar_modelo(3, nome="Modelo")
+
+    def _etapas_na_listagem(self):
+        resposta = self.client.get(reverse('listar_modelos_fluxo'))
+        return resposta.content.decode().count("<td>4</td>")
+
+    def test_pagina_em_cache_nao_consulta_as_linhas(self):
+        self._etapas_na_listagem()
+        with CaptureQueriesContext(connection) as consultas:
+            self._etapas_na_listagem()
+
+        # só o COUNT do paginador; o SELECT das linhas fica dentro do fragmento
+        modelos = [q for q in consultas_fora_do_cache(consultas) if '"fluxos_padrao"' in q]
+        self.assertEqual(len(modelos), 1)
+        self.assertIn("COUNT(", modelos[0])
+
+    def test_linha_em_cache_e_reaproveitada(self):
+        self._etapas_na_listagem()
+        # sem commit a versão não muda: a linha continua vindo do cache
+        EtapaFluxo.objects.create(fluxo=self.modelo, ordem_etapa=4, nome="Etapa 4")
+
+        self.assertEqual(self._etapas_na_listagem(), 0)
+
+    def test_alterar_etapa_invalida_os_fragmentos(self):
+        self._etapas_na_listagem()
+        with self.captureOnCommitCallbacks(execute=True):
+            EtapaFluxo.objects.create(fluxo=self.modelo, ordem_etapa=4, nome="Etapa 4")
+
+        self.assertEqual(self._etapas_na_listagem(), 1)
+
+    def test_editar_etapas_em_lote_invalida_os_fragmentos(self):
+        self._etapas_na_listagem()
+        etapas = [{"id": e.id, "nome": e.nome} for e in self.modelo.etapas.order_by("ordem_etapa")]
+        with self.captureOnCommitCallbacks(execute=True):
+            salvar_etapas_modelo(self.modelo, etapas + [{"nome": "Etapa 4"}])
+
+        self.assertEqual(self._etapas_na_listagem(), 1)
+
+
+class ModeloFluxoEtapasTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.client.force_login(self.usuario)
+        self.setor = Setor.objects.create(nome="Financeiro")
+
+    def _criar_json(self, etapas, nome="Compras"):
+        return self.client.post(
+            reverse('criar_modelos_fluxo'),
+            data=json.dumps({"nome": nome, "etapas": etapas}),
+            content_type='application/json',
+        )
+
+    def _etapas(self, fluxo):
+        return list(fluxo.etapas.order_by('ordem_etapa').values_list('ordem_etapa', 'nome'))
+
+    def test_formset_cria_modelo_e_etapas(self):
+        dados = {
+            'nome': 'Compras',
+            'etapas-TOTAL_FORMS': '2', 'etapas-INITIAL_FORMS': '0',
+            'etapas-0-nome': 'Solicitar', 'etapas-0-setor': str(self.setor.id),
+            'etapas-1-nome': 'Aprovar', 'etapas-1-perfil_aprovador': 'administrador',
+        }
+        resposta = self.client.post(reverse('criar_modelos_fluxo'), dados)
+
+        self.assertRedirects(resposta, reverse('listar_modelos_fluxo'))
+        fluxo = FluxoPadrao.objects.get()
+        self.assertEqual(fluxo.criado_por, self.usuario)
+        self.assertEqual(self._etapas(fluxo), [(1, 'Solicitar'), (2, 'Aprovar')])
+        self.assertEqual(fluxo.etapas.get(ordem_etapa=2).perfil_aprovador, 'administrador')
+
+    def test_numero_de_consultas_nao_depende_do_numero_de_etapas(self):
+        def contar(quantidade):
+            with CaptureQueriesContext(connection) as ctx:
+                self._criar_json([{"nome": f"Etapa {i}"} for i in range(quantidade)])
+            return len(ctx.captured_queries)
+
+        self.assertEqual(contar(2), contar(40))
+
+    def test_etapa_invalida_nao_grava_nada(self):
+        resposta = self._criar_json([{"nome": "Solicitar"}, {"nome": "Aprovar", "setor": 999999}])
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn("setor", resposta.json()["erros"]["etapas"][1])
+        self.assertFalse(FluxoPadrao.objects.exists())
+
+    def test_reordenar_editar_incluir_e_excluir_etapas(self):
+        fluxo = FluxoPadrao.objects.get(id=self._criar_json([{"nome": n} for n in "ABC"]).json()["id"])
+        a, b, c = fluxo.etapas.order_by('ordem_etapa')
+
+        resposta = self.client.post(
+            reverse('editar_etapas_modelo', args=[fluxo.id]),
+            data=json.dumps({"etapas": [{"id": c.id, "nome": "C"}, {"id": a.id, "nome": "A2"}, {"nome": "D"}]}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(self._etapas(fluxo), [(1, 'C'), (2, 'A2'), (3, 'D')])
+        self.assertFalse(EtapaFluxo.objects.filter(id=b.id).exists())
+        self.assertEqual(fluxo.etapas.get(nome='C').id, c.id)
+
+    def test_novas_etapas_antes_das_mantidas_invertidas(self):
+        fluxo = FluxoPadrao.objects.get(id=self._criar_json([{"nome": "S1"}, {"nome": "S2"}]).json()["id"])
+        s1, s2 = fluxo.etapas.order_by('ordem_etapa')
+
+        resposta = self.client.post(
+            reverse('editar_etapas_modelo', args=[fluxo.id]),
+            data=json.dumps({"etapas": [
+                {"nome": "N1"}, {"nome": "N2"}, {"id": s2.id, "nome": "S2"}, {"id": s1.id, "nome": "S1"},
+            ]}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(self._etapas(fluxo), [(1, 'N1'), (2, 'N2'), (3, 'S2'), (4, 'S1')])
+
+    def test_aceita_modelos_com_mais_de_60_etapas(self):
+        resposta = self._criar_json([{"nome": f"Etapa {i}"} for i in range(80)])
+
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(FluxoPadrao.objects.get().etapas.count(), 80)
+
+    def test_formset_de_edicao_usa_order_e_delete(self):
+        fluxo = FluxoPadrao.objects.get(id=self._criar_json([{"nome": n} for n in "AB"]).json()["id"])
+        a, b = fluxo.etapas.order_by('ordem_etapa')
+        self.assertEqual(self.client.get(reverse('editar_etapas_modelo', args=[fluxo.id])).status_code, 200)
+
+        self.client.post(reverse('editar_etapas_modelo', args=[fluxo.id]), {
+            'etapas-TOTAL_FORMS': '3', 'etapas-INITIAL_FORMS': '2',
+            'etapas-0-id': str(a.id), 'etapas-0-nome': 'A', 'etapas-0-ORDER': '2',
+            'etapas-1-id': str(b.id), 'etapas-1-nome': 'B', 'etapas-1-ORDER': '1', 'etapas-1-DELETE': 'on',
+            'etapas-2-nome': 'N', 'etapas-2-ORDER': '1',
+        })
+
+        self.assertEqual(self._etapas(fluxo), [(1, 'N'), (2, 'A')])
+
+    def test_etapa_de_outro_modelo_e_recusada(self):
+        outro = criar_modelo(1, nome="Outro")
+        fluxo = FluxoPadrao.objects.get(id=self._criar_json([{"nome": "A"}]).json()["id"])
+
+        resposta = self.client.post(
+            reverse('editar_etapas_modelo', args=[fluxo.id]),
+            data=json.dumps({"etapas": [{"id": outro.etapas.get().id, "nome": "X"}]}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(outro.etapas.get().nome, "Etapa 1")
+
+
+class ExportarMovimentacoesTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.client.force_login(self.usuario)
+        self.modelo = criar_modelo(3)
+        self.instancia = criar_instancia(self.modelo, "Pedido 1", self.usuario)
+        for _ in range(2):
+            transicoes.avancar(self.instancia.id, FluxoInstancia.objects.get(id=self.instancia.id).etapa_atual_id, self.usuario)
+        outro = criar_instancia(criar_modelo(1, nome="Outro"), "Pedido 2", self.usuario)
+        transicoes.avancar(outro.id, outro.etapa_atual_id, self.usuario)
+
+    def _exportar(self, **params):
+        resposta = self.client.get(reverse('exportar_movimentacoes'), params)
+        return resposta, b''.join(resposta.streaming_content).decode()
+
+    def test_csv_traz_nomes_resolvidos(self):
+        resposta, conteudo = self._exportar(modelo=self.modelo.id)
+
+        self.assertEqual(resposta['Content-Type'], 'text/csv; charset=utf-8')
+        linhas = list(csv.DictReader(StringIO(conteudo)))
+        self.assertEqual([l['etapa'] for l in linhas], ['Etapa 1', 'Etapa 2'])
+        self.assertEqual(
+            {(l['instancia'], l['modelo'], l['usuario'], l['acao']) for l in linhas},
+            {('Pedido 1', 'Compras', 'ana', acoes.AVANCAR)},
+        )
+
+    def test_jsonl_filtra_por_setor_e_periodo(self):
+        engenharia = Setor.objects.get(nome="Engenharia")
+        hoje = timezone.localdate()
+
+        _, conteudo = self._exportar(formato='jsonl', setor=engenharia.id, inicio=hoje, fim=hoje)
+        linhas = [json.loads(l) for l in conteudo.splitlines()]
+        self.assertEqual({l['setor'] for l in linhas}, {'Engenharia'})
+        self.assertEqual(len(linhas), 2)
+
+        _, conteudo = self._exportar(formato='jsonl', inicio=hoje + timedelta(days=1))
+        self.assertEqual(conteudo, '')
+
+    def test_filtro_invalido(self):
+        resposta = self.client.get(reverse('exportar_movimentacoes'), {'inicio': '2025-02-01', 'fim': '2025-01-01'})
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_comando_exporta_para_saida_padrao(self):
+        saida = StringIO()
+        call_command('exportar_movimentacoes', formato='jsonl', stdout=saida, stderr=StringIO())
+        self.assertEqual(len(saida.getvalue().splitlines()), 3)
+
+
+class ImportacaoTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        Setor.objects.create(nome="Financeiro")
+        Setor.objects.create(nome="Engenharia")
+
+    def test_modelos_csv_agrupa_etapas_e_resolve_setores(self):
+        arquivo = StringIO(
+            "modelo,descricao,etapa,setor,perfil_aprovador\n"
+            "Compras,Pedido de compra,Solicitar,financeiro,\n"
+            "Compras,,Aprovar,Engenharia,administrador\n"
+            "Férias,,Pedir,,\n"
+            "Viagem,,Aprovar,Marketing,\n"
+        )
+
+        relatorio = importacao.importar_modelos(arquivo, "csv", self.usuario)
+
+        self.assertEqual((relatorio.importadas, relatorio.rejeitadas), (2, 1))
+        self.assertIn("Marketing", relatorio.erros[0]["erro"])
+        compras = FluxoPadrao.objects.get(nome="Compras")
+        self.assertEqual(
+            list(compras.etapas.values_list("ordem_etapa", "nome", "setor__nome", "perfil_aprovador")),
+            [(1, "Solicitar", "Financeiro", "padrao"), (2, "Aprovar", "Engenharia", "administrador")],
+        )
+
+    def test_instancias_jsonl_em_lotes(self):
+        modelo = criar_modelo(3)
+        linhas = [json.dumps({"modelo": "Compras", "nome": f"Pedido {i}"}) for i in range(25)]
+        linhas += ['{"modelo": "Inexistente", "nome": "X"}', "não é json", json.dumps({"modelo_id": modelo.id, "nome": "Por id"})]
+
+        with CaptureQueriesContext(connection) as ctx:
+            relatorio = importacao.importar_instancias(StringIO("\n".join(linhas)), "jsonl", self.usuario, lote=10)
+
+        self.assertEqual((relatorio.lidas, relatorio.importadas, relatorio.rejeitadas, relatorio.lotes), (28, 26, 2, 3))
+        self.assertEqual(FluxoInstancia.objects.filter(modelo=modelo, criado_por=self.usuario).count(), 26)
+        self.assertEqual(EtapaInstancia.objects.count(), 26 * 3)
+        self.assertFalse(FluxoInstancia.objects.filter(etapa_atual__isnull=True).exists())
+        # as etapas do modelo são lidas uma vez, não uma vez por lote
+        consultas_etapas = [q for q in ctx.captured_queries if 'FROM "etapas_fluxo"' in q['sql']]
+        self.assertEqual(len(consultas_etapas), 1)
+
+    def test_api_recebe_upload(self):
+        criar_modelo(2)
+        self.client.force_login(self.usuario)
+        arquivo = SimpleUploadedFile("instancias.csv", "modelo,nome\nCompras,Pedido 1\nCompras,Pedido 2\n".encode())
+
+        resposta = self.client.post(reverse('importar_fluxos'), {"tipo": "instancias", "arquivo": arquivo})
+
+        self.assertEqual(resposta.json()["importadas"], 2)
+        self.assertEqual(FluxoInstancia.objects.count(), 2)
+
+    def test_api_ignora_bom_do_excel(self):
+        criar_modelo(2)
+        self.client.force_login(self.usuario)
+        arquivo = SimpleUploadedFile("instancias.csv", "modelo,nome\nCompras,Pedido 1\n".encode("utf-8-sig"))
+
+        resposta = self.client.post(reverse('importar_fluxos'), {"tipo": "instancias", "arquivo": arquivo})
+
+        self.assertEqual((resposta.json()["importadas"], resposta.json()["rejeitadas"]), (1, 0))
+
+    def test_api_recusa_arquivo_fora_de_utf8(self):
+        criar_modelo(2)
+        self.client.force_login(self.usuario)
+        arquivo = SimpleUploadedFile("instancias.csv", "modelo,nome\nCompras,Solicitação\n".encode("latin-1"))
+
+        resposta = self.client.post(reverse('importar_fluxos'), {"tipo": "instancias", "arquivo": arquivo})
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn("UTF-8", resposta.json()["error"])
+        self.assertFalse(FluxoInstancia.objects.exists())
+
+    def test_comando(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as arquivo:
+            json.dump([{"nome": "Compras", "etapas": [{"nome": "Solicitar", "setor": "Financeiro"}]}], arquivo)
+        saida = StringIO()
+        call_command("importar_fluxos", "modelos", arquivo.name, usuario="ana", stdout=saida)
+
+        self.assertIn("1 modelos importado(s)", saida.getvalue())
+        self.assertEqual(FluxoPadrao.objects.get().criado_por, self.usuario)
+
+    def test_comando_recusa_arquivo_fora_de_utf8(self):
+        with tempfile.NamedTemporaryFile("wb", suffix=".csv", delete=False) as arquivo:
+            arquivo.write("modelo,etapa\nSolicitação,Pedir\n".encode("latin-1"))
+
+        with self.assertRaisesMessage(CommandError, "UTF-8"):
+            call_command("importar_fluxos", "modelos", arquivo.name, stdout=StringIO())
+
+
+class AnalisesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.client.force_login(self.usuario)
+        self.ontem = timezone.localdate() - timedelta(days=1)
+        self.modelo = criar_modelo(3)
+
+        # criada ontem às 10h; etapas aprovadas às 12h, 15h e 16h (finaliza)
+        instancia = criar_instancia(self.modelo, "Pedido 1", self.usuario)
+        for _ in range(3):
+            transicoes.avancar(instancia.id, FluxoInstancia.objects.get(id=instancia.id).etapa_atual_id, self.usuario)
+        FluxoInstancia.objects.filter(id=instancia.id).update(criado_em=self._ontem_as(10))
+        for ordem, hora in ((1, 12), (2, 15), (3, 16)):
+            MovimentacaoFluxo.objects.filter(fluxo_instancia=instancia, etapa__ordem_etapa=ordem).update(data_acao=self._ontem_as(hora))
+
+        # outra instância, aberta, parada na etapa 2 (Financeiro)
+        aberta = criar_instancia(self.modelo, "Pedido 2", self.usuario)
+        transicoes.avancar(aberta.id, aberta.etapa_atual_id, self.usuario)
+
+    def _ontem_as(self, hora):
+        return timezone.make_aware(timezone.datetime.combine(self.ontem, timezone.datetime.min.time())) + timedelta(hours=hora)
+
+    def test_permanencia_por_etapa_usa_a_movimentacao_anterior(self):
+        linhas = analises.permanencia_por_etapa(self.ontem, self.ontem)
+
+        self.assertEqual(
+            [(l["ordem"], l["quantidade"], l["media"]) for l in linhas],
+            [(1, 1, timedelta(hours=2)), (2, 1, timedelta(hours=3)), (3, 1, timedelta(hours=1))],
+        )
+
+    def test_tempo_de_ciclo_por_modelo(self):
+        linhas = analises.tempo_de_ciclo(self.ontem, timezone.localdate())
+
+        self.assertEqual(len(linhas), 1)
+        self.assertEqual((linhas[0]["modelo"], linhas[0]["quantidade"]), ("Compras", 1))
+        self.assertEqual(linhas[0]["media"], timedelta(hours=6))
+
+    def test_cache_incremental_por_dia(self):
+        hoje = timezone.localdate()
+        analises.permanencia_por_etapa(self.ontem, hoje)
+
+        # período já calculado: só o cache é lido
+        with CaptureQueriesContext(connection) as consultas:
+            analises.permanencia_por_etapa(self.ontem, hoje)
+        self.assertEqual(consultas_fora_do_cache(consultas), [])
+        # um dia a mais: só o dia que falta é consultado (movimentações e agregados arquivados)
+        with CaptureQueriesContext(connection) as consultas:
+            linhas = analises.permanencia_por_etapa(self.ontem - timedelta(days=1), hoje)
+        self.assertEqual(len(consultas_fora_do_cache(consultas)), 2)
+        self.assertEqual(sum(l["quantidade"] for l in linhas), 4)
+
+    def test_pendencias_por_setor(self):
+        linhas = {l["setor_nome"]: l for l in analises.pendencias_por_setor()}
+
+        # só fluxos abertos: o Pedido 2, parado na etapa 2 (Financeiro), com 2 etapas por aprovar
+        self.assertEqual(list(linhas), ["Financeiro"])
+        self.assertEqual((linhas["Financeiro"]["aguardando"], linhas["Financeiro"]["etapas_restantes"]), (1, 2))
+
+    def test_painel(self):
+        resposta = self.client.get(reverse('painel_analises'), {'inicio': self.ontem.isoformat()})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, "6:00:00")
+        self.assertEqual(len(resposta.context["permanencia"]), 3)
+
+
+class BuscaTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.client.force_login(self.usuario)
+        self.modelo = criar_modelo(3, nome="Compras de TI")
+        self.notebook = criar_instancia(self.modelo, "Notebook da diretoria", self.usuario)
+        self.cadeira = criar_instancia(criar_modelo(1, nome="Mobiliário"), "Cadeira do escritório", self.usuario)
+        transicoes.avancar(self.notebook.id, self.notebook.etapa_atual_id, self.usuario, comentario="Aprovado pela diretoria financeira")
+        transicoes.avancar(self.cadeira.id, self.cadeira.etapa_atual_id, self.usuario, comentario="Conferir <b>orçamento</b> antes")
+
+    def _ids(self, texto, **kwargs):
+        return [r.id for r in busca.buscar(texto, **kwargs)[0]]
+
+    def test_busca_por_prefixo_sem_acentos(self):
+        self.assertEqual(self._ids("escritorio"), [self.cadeira.id])
+        self.assertEqual(self._ids("NOTEBOOK dir"), [self.notebook.id])
+        self.assertEqual(self._ids("note dir"), [])
+
+    def test_busca_pelo_modelo_e_pela_etapa_atual(self):
+        self.assertEqual(self._ids("compras"), [self.notebook.id])
+        # o notebook avançou para a etapa 2
+        self.assertEqual(self._ids("etapa 2"), [self.notebook.id])
+
+    def test_comentarios_com_trecho_destacado_e_escapado(self):
+        resultados, _ = busca.buscar("orcamento", "comentarios")
+
+        self.assertEqual(len(resultados), 1)
+        self.assertIn("<mark>orçamento</mark>", resultados[0].trecho)
+        self.assertIn("&lt;b&gt;", resultados[0].trecho)
+
+    def test_indices_acompanham_as_tabelas(self):
+        FluxoInstancia.objects.filter(id=self.cadeira.id).update(nome="Mesa de reunião")
+        MovimentacaoFluxo.objects.filter(fluxo_instancia=self.notebook).update(comentario="Reprovado")
+        lote = criar_instancias_em_lote(self.modelo, ["Monitor extra"], self.usuario)
+
+        self.assertEqual(self._ids("cadeira"), [])
+        self.assertEqual(self._ids("mesa"), [self.cadeira.id])
+        self.assertEqual(self._ids("monitor"), [lote[0].id])
+        self.assertEqual(self._ids("diretoria", tipo="comentarios"), [])
+        self.assertEqual(len(self._ids("reprovado", tipo="comentarios")), 1)
+
+        self.notebook.delete()
+        self.assertEqual(self._ids("notebook"), [])
+        self.assertEqual(self._ids("reprovado", tipo="comentarios"), [])
+
+    def test_operadores_sao_ignorados(self):
+        self.assertEqual(self._ids('"notebook* OR ( NEAR'), [])
+        self.assertEqual(self._ids("  "), [])
+
+    def test_paginacao(self):
+        criar_instancias_em_lote(self.modelo, ["Pedido"] * 3, self.usuario)
+
+        primeira, cursor = busca.buscar("pedido", tamanho=2)
+        segunda, fim = busca.buscar("pedido", cursor=cursor, tamanho=2)
+        self.assertIsNotNone(cursor)
+        self.assertIsNone(fim)
+        self.assertEqual(len({i.id for i in primeira + segunda}), 3)
+        # cursor inválido volta para a primeira página
+        self.assertEqual(busca.buscar("pedido", cursor="x", tamanho=2)[0], primeira)
+
+    def test_relevancia_vale_para_todas_as_ocorrencias(self):
+        # o nome da instância pesa mais que o modelo: a mais antiga, que tem
+        # o termo no nome, vem antes das mais novas que só o têm no modelo
+        antiga = criar_instancia(criar_modelo(1, nome="Outros"), "Reforma", self.usuario)
+        novas = criar_instancias_em_lote(criar_modelo(1, nome="Reforma predial"), ["Pintura"] * 30, self.usuario)
+
+        paginas, cursor = [], None
+        while True:
+            pagina, cursor = busca.buscar("reforma", cursor=cursor, tamanho=5)
+            paginas.append([i.id for i in pagina])
+            if cursor is None:
+                break
+
+        self.assertEqual(paginas[0][0], antiga.id)
+        self.assertEqual(len(paginas), 7)
+        self.assertEqual(paginas[-1], [novas[0].id])
+        self.assertEqual(len({id_ for pagina in paginas for id_ in pagina}), 31)
+
+    def test_pagina_e_api(self):
+        resposta = self.client.get(reverse('buscar_fluxos'), {'q': 'diretoria', 'tipo': 'comentarios'})
+        self.assertContains(resposta, "<mark>diretoria</mark>")
+
+        dados = self.client.get(reverse('buscar_fluxos_json'), {'q': 'cadeira'}).json()
+        self.assertEqual([i['instancia_id'] for i in dados['itens']], [self.cadeira.id])
+        self.assertIsNone(dados['proximo_cursor'])
+
+
+class ArquivamentoTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.client.force_login(self.usuario)
+        self.modelo = criar_modelo(2)
+
+        self.antigo = criar_instancia(self.modelo, "Pedido antigo", self.usuario)
+        for comentario in ("Primeira ok", "Tudo certo"):
+            etapa_id = FluxoInstancia.objects.get(id=self.antigo.id).etapa_atual_id
+            transicoes.avancar(self.antigo.id, etapa_id, self.usuario, comentario=comentario)
+        FluxoInstancia.objects.filter(id=self.antigo.id).update(atualizado_em=timezone.now() - timedelta(days=400))
+
+        self.recente = criar_instancia(self.modelo, "Pedido recente", self.usuario)
+        for _ in range(2):
+            transicoes.avancar(self.recente.id, FluxoInstancia.objects.get(id=self.recente.id).etapa_atual_id, self.usuario)
+        self.aberto = criar_instancia(self.modelo, "Pedido aberto", self.usuario)
+
+    def test_move_so_os_finalizados_antigos(self):
+        resumo = arquivamento.arquivar_finalizados(dias=180)
+
+        self.assertEqual((resumo["arquivados"], resumo["etapas"], resumo["movimentacoes"]), (1, 2, 2))
+        self.assertFalse(FluxoInstancia.objects.filter(id=self.antigo.id).exists())
+        self.assertFalse(EtapaInstancia.objects.filter(fluxo_instancia_id=self.antigo.id).exists())
+        self.assertFalse(MovimentacaoFluxo.objects.filter(fluxo_instancia_id=self.antigo.id).exists())
+        self.assertEqual(set(FluxoInstancia.objects.values_list("id", flat=True)), {self.recente.id, self.aberto.id})
+        # e some da busca junto com as tabelas de trabalho
+        self.assertEqual(busca.buscar("antigo")[0], [])
+
+    def test_conteudo_arquivado_preserva_etapas_e_historico(self):
+        arquivamento.arquivar_finalizados(dias=180)
+        arquivado = FluxoArquivado.objects.get(id=self.antigo.id)
+
+        instancia, etapas, movimentacoes = arquivamento.ler_arquivado(arquivado)
+        self.assertEqual((instancia.nome, instancia.modelo.nome), ("Pedido antigo", "Compras"))
+        self.assertEqual([(e.nome, e.setor.nome, e.concluida) for e in etapas],
+                         [("Etapa 1", "Engenharia", True), ("Etapa 2", "Financeiro", True)])
+        self.assertEqual([m.comentario for m in movimentacoes], ["Tudo certo", "Primeira ok"])
+        self.assertEqual({(m.acao.nome, m.usuario.username) for m in movimentacoes}, {(acoes.AVANCAR, "ana")})
+
+    def test_detalhe_le_o_arquivo(self):
+        arquivamento.arquivar_finalizados(dias=180)
+
+        resposta = self.client.get(reverse('detalhar_instancia_fluxo', args=[self.antigo.id]))
+        self.assertContains(resposta, "Arquivado em")
+        self.assertContains(resposta, "Tudo certo")
+        self.assertNotContains(resposta, 'onclick="abrirModal(this)"')
+        self.assertEqual(self.client.get(reverse('detalhar_instancia_fluxo', args=[999999])).status_code, 404)
+
+    def test_lotes_e_limite(self):
+        FluxoInstancia.objects.filter(id=self.recente.id).update(atualizado_em=timezone.now() - timedelta(days=400))
+
+        resumo = arquivamento.arquivar_finalizados(dias=180, lote=1, limite=1)
+        self.assertEqual((resumo["arquivados"], resumo["lotes"]), (1, 1))
+        resumo = arquivamento.arquivar_finalizados(dias=180, lote=1)
+        self.assertEqual((resumo["arquivados"], resumo["lotes"]), (1, 1))
+        self.assertEqual(FluxoArquivado.objects.count(), 2)
+
+    def test_comando(self):
+        saida = StringIO()
+        call_command('arquivar_fluxos', dias=180, stdout=saida)
+        self.assertIn("1 fluxo(s) arquivado(s)", saida.getvalue())
+
+    def test_exportacao_inclui_o_historico_arquivado(self):
+        arquivamento.arquivar_finalizados(dias=180)
+        financeiro = Setor.objects.get(nome="Financeiro")
+
+        linhas = [json.loads(l) for l in exportacao.linhas_jsonl(exportacao.movimentacoes_para_exportar(setor_id=financeiro.id))]
+
+        arquivadas = [l for l in linhas if l["instancia_id"] == self.antigo.id]
+        self.assertEqual([(l["etapa"], l["setor"], l["comentario"]) for l in arquivadas], [("Etapa 2", "Financeiro", "Tudo certo")])
+        self.assertEqual(len(linhas), 2)
+
+    def test_analises_mantem_o_historico_arquivado(self):
+        cache.clear()
+        hoje = timezone.localdate()
+        antes = (analises.permanencia_por_etapa(hoje, hoje), analises.tempo_de_ciclo(hoje, hoje))
+
+        arquivamento.arquivar_finalizados(dias=180)
+        cache.clear()
+
+        self.assertEqual((analises.permanencia_por_etapa(hoje, hoje), analises.tempo_de_ciclo(hoje, hoje)), antes)
+        self.assertEqual(analises.tempo_de_ciclo(hoje, hoje)[0]["quantidade"], 2)
+
+
+class InstrumentacaoTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123")
+        self.client.force_login(self.usuario)
+        self.instancia = criar_instancia(criar_modelo(num_etapas=3), "Pedido", self.usuario)
+        registro = mock.patch.object(instrumentacao, "registro", instrumentacao.RegistroMetricas())
+        self.registro = registro.start()
+        self.addCleanup(registro.stop)
+
+    @override_settings(INSTRUMENTACAO_AMOSTRA=1.0)
+    def test_requisicao_amostrada_mede_banco_e_template(self):
+        with self.assertLogs("SISTEMA.instrumentacao", "INFO") as logs:
+            self.client.get(reverse('detalhar_instancia_fluxo', args=[self.instancia.id]))
+
+        evento = logs.records[0].metricas
+        self.assertEqual((evento["view"], evento["status"]), ("detalhar_instancia_fluxo", 200))
+        self.assertGreater(evento["consultas"], 0)
+        self.assertGreater(evento["template_ms"], 0)
+        self.assertEqual(self.registro.amostras["detalhar_instancia_fluxo"]["requisicoes"], 1)
+        # a linha do log é JSON com os campos da medição
+        linha = json.loads(instrumentacao.FormatadorJSON().format(logs.records[0]))
+        self.assertEqual(linha["consultas"], evento["consultas"])
+
+    @override_settings(INSTRUMENTACAO_AMOSTRA=0.0)
+    def test_sem_amostragem_so_conta_latencia(self):
+        with self.assertNoLogs("SISTEMA.instrumentacao", "INFO"):
+            self.client.get(reverse('detalhar_instancia_fluxo', args=[self.instancia.id]))
+
+        self.assertEqual(self.registro.requisicoes[("detalhar_instancia_fluxo", "GET", 200)], 1)
+        self.assertEqual(self.registro.amostras, {})
+
+    @override_settings(INSTRUMENTACAO_AMOSTRA=1.0)
+    def test_exportacao_conta_as_consultas_do_streaming(self):
+        with self.assertLogs("SISTEMA.instrumentacao", "INFO") as logs:
+            resposta = self.client.get(reverse('exportar_movimentacoes'))
+            # o registro só sai depois que o conteúdo é consumido
+            self.assertEqual(logs.records, [])
+            with CaptureQueriesContext(connection) as consultas:
+                b''.join(resposta.streaming_content)
+
+        evento = logs.records[0].metricas
+        self.assertEqual(evento["view"], "exportar_movimentacoes")
+        self.assertGreater(len(consultas), 0)
+        # as da view (sessão, usuário) mais as do streaming
+        self.assertGreater(evento["consultas"], len(consultas))
+
+    @override_settings(INSTRUMENTACAO_AMOSTRA=1.0)
+    async def test_asgi_conta_consultas(self):
+        async def view(request):
+            await Usuario.objects.filter(id=self.usuario.id).afirst()
+            await Usuario.objects.filter(id=0).afirst()
+            return HttpResponse("ok")
+
+        middleware = instrumentacao.InstrumentacaoMiddleware(view)
+        with self.assertLogs("SISTEMA.instrumentacao", "INFO") as logs:
+            await middleware(AsyncRequestFactory().get('/'))
+
+        self.assertEqual(logs.records[0].metricas["consultas"], 2)
+        self.assertEqual(self.registro.amostras["nao_encontrada"]["consultas"], 2)
+
+    def test_consultas_repetidas(self):
+        medicao = instrumentacao.Medicao()
+        with connection.execute_wrapper(medicao):
+            for _ in range(3):
+                list(Usuario.objects.filter(id=self.usuario.id))
+            list(Usuario.objects.filter(id=0))
+
+        self.assertEqual((medicao.consultas, medicao.repetidas), (4, 2))
+        sql, vezes = medicao.mais_repetida()
+        self.assertIn("usuarios", sql.lower())
+        self.assertEqual(vezes, 3)
+
+    @override_settings(DEBUG=True)
+    def test_metrics_no_formato_do_prometheus(self):
+        self.client.get(reverse('detalhar_instancia_fluxo', args=[self.instancia.id]))
+
+        texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('fluxo_http_requisicoes_total{view="detalhar_instancia_fluxo",metodo="GET",status="200"} 1', texto)
+        self.assertIn('fluxo_http_latencia_segundos_bucket{view="detalhar_instancia_fluxo",le="+Inf"} 1', texto)
+        self.assertIn('# TYPE fluxo_http_latencia_segundos histogram', texto)
+
+    def test_metrics_exige_token_quando_configurado(self):
+        with override_settings(METRICAS_TOKEN="segredo"), self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+            resposta = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION="Bearer segredo")
+            self.assertEqual(resposta.status_code, 200)
+        with override_settings(DEBUG=True), self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.client.get(reverse('metricas'), REMOTE_ADDR="10.0.0.9").status_code, 403)
+
+    def test_metrics_sem_token_fora_do_debug_recusa_ate_a_propria_maquina(self):
+        # atrás de um proxy reverso local, toda requisição vem de 127.0.0.1
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.client.get(reverse('metricas'), REMOTE_ADDR="127.0.0.1").status_code, 403)
+
+
+class BenchmarkTests(TransactionTestCase):
+    def setUp(self):
+        acoes.limpar_cache()
+        self.resumo = semeadura.semear(setores=3, usuarios=4, modelos=3, etapas_max=6, instancias=60, lote=25)
+
+    def test_semeadura_consistente(self):
+        self.assertEqual((self.resumo["instancias"], self.resumo["lotes"]), (60, 3))
+        self.assertEqual(EtapaInstancia.objects.count(), self.resumo["etapas"])
+        self.assertEqual(MovimentacaoFluxo.objects.count(), self.resumo["movimentacoes"])
+        for instancia in FluxoInstancia.objects.select_related("etapa_atual"):
+            self.assertEqual(instancia.versao, instancia.movimentacoes.count())
+            if instancia.finalizado:
+                self.assertEqual((instancia.etapas_concluidas, instancia.etapa_atual), (instancia.total_etapas, None))
+            else:
+                self.assertEqual(instancia.etapa_atual.ordem_etapa, instancia.etapas_concluidas + 1)
+                self.assertEqual(instancia.setor_atual_id, instancia.etapa_atual.setor_id)
+
+        # mesma semente, mesmos usuários e modelos reaproveitados
+        semeadura.semear(setores=3, usuarios=4, modelos=3, etapas_max=6, instancias=5)
+        self.assertEqual((Usuario.objects.count(), FluxoPadrao.objects.count()), (4, 3))
+
+    def test_carga_em_processo(self):
+        saida = StringIO()
+        with tempfile.NamedTemporaryFile(suffix=".json") as arquivo:
+            call_command('benchmark_carga', cenarios='detalhe,transicoes,webhook', drivers='processo',
+                         requisicoes=8, concorrencia=2, rajada=2, saida=arquivo.name, stdout=saida)
+            resultado = json.load(open(arquivo.name, encoding='utf-8'))
+
+        self.assertEqual([r["cenario"] for r in resultado["resultados"]], ["detalhe", "transicoes", "webhook"])
+        for r in resultado["resultados"]:
+            self.assertEqual((r["requisicoes"], r["erros"]), (8, 0))
+        self.assertEqual(resultado["ambiente"]["volumes"]["instancias"], 60)
+        # transições avançam e retornam em pares; os eventos do webhook são apagados
+        self.assertEqual(MovimentacaoFluxo.objects.count(), self.resumo["movimentacoes"] + 8)
+        self.assertFalse(EventoWebhook.objects.filter(event_id__startswith=cenarios.PREFIXO_EVENTO).exists())
+
+
+# ==========================================================
+# CONSULTAS POR ROTA
+# ==========================================================
+# Cada rota nomeada de SISTEMA/urls.py é chamada sobre a mesma massa de dados
+# em dois tamanhos. Uma rota que faz mais consultas com mais linhas carrega
+# algo por linha (N+1, geralmente um atributo lido no template) e falha aqui.
+# Rota nova sem entrada em ROTAS também falha: toda view entra na verificação.
+
+def _webhook_consultas(f):
+    caminho = reverse("abacatepay_webhook")
+    if views.WEBHOOK_SECRET:
+        caminho += f"?secret={views.WEBHOOK_SECRET}"
+    return "POST", caminho, json.dumps({"id": f"consultas-{f['tamanho']}", "event": "billing.paid", "data": {}})
+
+
+def _importacao_consultas(f):
+    # entrada fixa (3 instâncias de um modelo de 3 etapas): só a base cresce
+    linhas = "".join(f"{f['modelo_curto'].id},Importado {i}\n" for i in range(3))
+    arquivo = SimpleUploadedFile("instancias.csv", f"modelo_id,nome\n{linhas}".encode())
+    return "POST", reverse("importar_fluxos"), {"tipo": "instancias", "arquivo": arquivo}
+
+
+# rota -> f(massa) -> (método, caminho, dados). Rotas destrutivas são chamadas
+# com GET (página de confirmação); mover_etapa e as APIs recebem o POST real.
+ROTAS = {
+    "login": lambda f: ("GET", reverse("login"), None),
+    "home": lambda f: ("GET", reverse("home"), None),
+    "logout": lambda f: ("GET", reverse("logout"), None),
+    "criar_usuario": lambda f: ("GET", reverse("criar_usuario"), None),
+    "listar_usuarios": lambda f: ("GET", reverse("listar_usuarios"), None),
+    "editar_usuario": lambda f: ("GET", reverse("editar_usuario", args=[f["outro_usuario"].id]), None),
+    "deletar_usuario": lambda f: ("GET", reverse("deletar_usuario", args=[f["outro_usuario"].id]), None),
+    "listar_setores": lambda f: ("GET", reverse("listar_setores"), None),
+    "criar_setor": lambda f: ("GET", reverse("criar_setor"), None),
+    "editar_setor": lambda f: ("GET", reverse("editar_setor", args=[f["usuario"].setor_id]), None),
+    "deletar_setor": lambda f: ("GET", reverse("deletar_setor", args=[f["usuario"].setor_id]), None),
+    "listar_modelos_fluxo": lambda f: ("GET", reverse("listar_modelos_fluxo"), None),
+    "criar_modelos_fluxo": lambda f: ("GET", reverse("criar_modelos_fluxo"), None),
+    "editar_etapas_modelo": lambda f: ("GET", reverse("editar_etapas_modelo", args=[f["modelo"].id]), None),
+    "excluir_modelos_fluxo": lambda f: ("GET", reverse("excluir_modelos_fluxo", args=[f["modelo"].id]), None),
+    "listar_instancias_fluxo": lambda f: ("GET", reverse("listar_instancias_fluxo"), None),
+    "criar_instancia_fluxo": lambda f: ("GET", reverse("criar_instancia_fluxo"), None),
+    "excluir_instancias_fluxo": lambda f: ("GET", reverse("excluir_instancias_fluxo", args=[f["instancia"].id]), None),
+    "detalhar_instancia_fluxo": lambda f: ("GET", reverse("detalhar_instancia_fluxo", args=[f["instancia"].id]), None),
+    "mover_etapa": lambda f: (
+        "POST", reverse("mover_etapa", args=[f["instancia"].id, f["etapa"].id]), {"acao": "avancar", "comentario": "ok"},
+    ),
+    "exportar_movimentacoes": lambda f: ("GET", reverse("exportar_movimentacoes"), None),
+    "painel_analises": lambda f: ("GET", reverse("painel_analises"), None),
+    "importar_fluxos": _importacao_consultas,
+    "caixa_entrada": lambda f: ("GET", reverse("caixa_entrada"), None),
+    "caixa_entrada_json": lambda f: ("GET", reverse("caixa_entrada_json"), None),
+    "buscar_fluxos": lambda f: ("GET", reverse("buscar_fluxos") + "?q=compra", None),
+    "buscar_fluxos_json": lambda f: ("GET", reverse("buscar_fluxos_json") + "?q=compra&tipo=comentarios", None),
+    "assinatura_view": lambda f: ("GET", reverse("assinatura_view"), None),
+    "metricas": lambda f: ("GET", reverse("metricas"), None),
+    "checkout_prata": lambda f: ("GET", reverse("checkout_prata"), None),
+    "checkout_ouro": lambda f: ("GET", reverse("checkout_ouro"), None),
+    "abacatepay_webhook": _webhook_consultas,
+}
+
+
+# /metrics sem METRICAS_TOKEN só responde com DEBUG (instrumentacao.acesso_permitido)
+@override_settings(DEBUG=True)
+class ConsultasPorRotaTests(TestCase):
+    TAMANHOS = (10, 1000)
+    # etapas do modelo aberto no editor e no detalhe. O editor desenha um <select>
+    # com todos os setores por etapa: 50 etapas x 1000 setores levam ~7s
+    ETAPAS_MAX = 20
+
+    def setUp(self):
+        cliente = mock.Mock()
+        cliente.criar_cobranca.return_value = {"url": "https://pagamento.exemplo/cobranca"}
+        patcher = mock.patch.object(views, "obter_cliente", return_value=cliente)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _popular(self, tamanho):
+        """`tamanho` setores, usuários, modelos e instâncias, e um fluxo com `tamanho` movimentações."""
+        semeadura.semear(setores=tamanho, usuarios=tamanho, tamanhos=[3] * tamanho, instancias=tamanho, lote=tamanho)
+        setores = list(Setor.objects.order_by("id")[:2])
+        modelo = FluxoPadrao.objects.create(nome="Compras")
+        EtapaFluxo.objects.bulk_create([
+            EtapaFluxo(fluxo=modelo, ordem_etapa=i, nome=f"Etapa {i}", setor=setores[i % 2])
+            for i in range(1, min(tamanho, self.ETAPAS_MAX) + 1)
+        ])
+        # quem navega está no setor da primeira etapa: a caixa de entrada nunca fica vazia
+        usuario = Usuario.objects.create_user(username="ana", password="senha-forte-123", setor=setores[1])
+        instancia = criar_instancia(modelo, "Pedido de compra", usuario)
+        etapas = list(instancia.etapas.order_by("ordem_etapa")[:2])
+        # pares avançar/retornar: o fluxo continua na primeira etapa
+        MovimentacaoFluxo.objects.bulk_create([
+            MovimentacaoFluxo(
+                fluxo_instancia=instancia, etapa=etapas[i % 2], usuario=usuario,
+                acao_id=acoes.obter_acao_id(acoes.RETORNAR if i % 2 else acoes.AVANCAR), comentario="compra conferida",
+            )
+            for i in range(tamanho)
+        ])
+        FluxoInstancia.objects.filter(id=instancia.id).update(versao=tamanho)
+        return {
+            "tamanho": tamanho,
+            "usuario": usuario,
+            "outro_usuario": Usuario.objects.exclude(id=usuario.id).first(),
+            "modelo": modelo,
+            "modelo_curto": FluxoPadrao.objects.exclude(id=modelo.id).first(),
+            "instancia": instancia,
+            "etapa": etapas[0],
+        }
+
+    def _consultas(self, rota, massa):
+        metodo, caminho, dados = ROTAS[rota](massa)
+        cache.clear()
+        planos.limpar_memoria()
+        self.client.force_login(massa["usuario"])
+        with CaptureQueriesContext(connection) as ctx:
+            if metodo == "GET":
+                resposta = self.client.get(caminho)
+            elif isinstance(dados, str):
+                resposta = self.client.post(caminho, dados, content_type="application/json")
+            else:
+                resposta = self.client.post(caminho, dados)
+            if resposta.streaming:
+                b"".join(resposta.streaming_content)
+        self.assertLess(resposta.status_code, 400, f"{rota}: {resposta.status_code}")
+        return len(ctx)
+
+    def test_toda_rota_nomeada_esta_coberta(self):
+        self.assertEqual({p.name for p in urls.urlpatterns}, set(ROTAS))
+
+    def test_consultas_nao_crescem_com_os_dados(self):
+        contagens = {}
+        for tamanho in self.TAMANHOS:
+            with transaction.atomic():
+                massa = self._popular(tamanho)
+                contagens[tamanho] = {rota: self._consultas(rota, massa) for rota in ROTAS}
+                transaction.set_rollback(True)
+            acoes.limpar_cache()
+
+        menor, maior = self.TAMANHOS
+        crescem = {
+            rota: (contagens[menor][rota], contagens[maior][rota])
+            for rota in ROTAS
+            if contagens[maior][rota] > contagens[menor][rota]
+        }
+        self.assertEqual(crescem, {}, f"consultas com {menor} e {maior} linhas")
@@ -0,0 +1,137 @@
+# SISTEMA/transicoes.py
+from django.db import transaction, IntegrityError, OperationalError
+from django.db.models import F
+from django.utils import timezone
+from .models import FluxoInstancia, EtapaInstancia, MovimentacaoFluxo
+from .acoes import obter_acao_id, recarregar_se_desatualizado, AVANCAR, RETORNAR, REJEITAR
+
+
+# ==========================================================
+# ERROS
+# ==========================================================
+class TransicaoInvalida(Exception):
+    """A movimentação não é permitida no estado atual do fluxo."""
+
+
+class ConflitoTransicao(Exception):
+    """Outro usuário movimentou o mesmo fluxo ao mesmo tempo; recarregue e tente de novo."""
+
+
+# ==========================================================
+# MOTOR DE TRANSIÇÕES
+# ==========================================================
+# Cada movimentação roda em uma transação que começa "reservando" a instância:
+# um UPDATE condicionado à versão lida (trava otimista). Se outra movimentação
+# já incrementou a versão, nenhuma linha é afetada e a transição é recusada com
+# ConflitoTransicao. Como o primeiro comando da transação é uma escrita, o banco
+# serializa as movimentações da mesma instância (lock de linha no PostgreSQL,
+# lock de escrita no SQLite) e o histórico nunca fica pela metade.
+
+def avancar(instancia_id, etapa_id, usuario=None, comentario='', versao=None):
+    """Conclui a etapa atual. Finaliza o fluxo se ela for a última."""
+    def aplicar(instancia, etapas, etapa):
+        if etapa.concluida:
+            raise TransicaoInvalida('Esta etapa já está concluída.')
+        if etapa.id != instancia.etapa_atual_id:
+            raise TransicaoInvalida('Somente a etapa atual pode ser avançada.')
+
+        EtapaInstancia.objects.filter(id=etapa.id).update(concluida=True)
+        etapa.concluida = True
+        return etapa
+
+    return _executar(instancia_id, etapa_id, AVANCAR, aplicar, usuario, comentario, versao)
+
+
+def retornar(instancia_id, etapa_id, usuario=None, comentario='', versao=None):
+    """Reabre a etapa anterior e todas as seguintes; o fluxo volta para a etapa anterior."""
+    def aplicar(instancia, etapas, etapa):
+        if etapa.ordem_etapa == 1:
+            raise TransicaoInvalida('Não é possível retornar: esta é a primeira etapa.')
+        if not etapa.concluida and etapa.id != instancia.etapa_atual_id:
+            raise TransicaoInvalida('Não é possível retornar de uma etapa que ainda não foi iniciada.')
+
+        anterior = next((e for e in etapas if e.ordem_etapa == etapa.ordem_etapa - 1), None)
+        if anterior is None:
+            raise TransicaoInvalida('Etapa anterior não encontrada.')
+
+        _reabrir_a_partir_de(instancia, etapas, anterior.ordem_etapa)
+        return anterior
+
+    return _executar(instancia_id, etapa_id, RETORNAR, aplicar, usuario, comentario, versao)
+
+
+def rejeitar(instancia_id, etapa_id, usuario=None, comentario='', versao=None):
+    """Reprova a etapa: todas as etapas são reabertas e o fluxo recomeça da primeira."""
+    def aplicar(instancia, etapas, etapa):
+        if etapa.id != instancia.etapa_atual_id:
+            raise TransicaoInvalida('Somente a etapa atual pode ser rejeitada.')
+
+        _reabrir_a_partir_de(instancia, etapas, 1)
+        return etapa
+
+    return _executar(instancia_id, etapa_id, REJEITAR, aplicar, usuario, comentario, versao)
+
+
+def _reabrir_a_partir_de(instancia, etapas, ordem):
+    EtapaInstancia.objects.filter(fluxo_instancia_id=instancia.id, ordem_etapa__gte=ordem).update(concluida=False)
+    for e in etapas:
+        if e.ordem_etapa >= ordem:
+            e.concluida = False
+
+
+def _executar(instancia_id, etapa_id, nome_acao, aplicar, usuario, comentario, versao, repetir=True):
+    """
+    Executa `aplicar(instancia, etapas, etapa)` de forma atômica e registra a movimentação.
+    `versao` é a versão que o usuário tinha em tela; se omitida, usa a versão atual do banco.
+    """
+    if versao is None:
+        versao = FluxoInstancia.objects.filter(id=instancia_id).values_list('versao', flat=True).first()
+        if versao is None:
+            raise FluxoInstancia.DoesNotExist
+
+    try:
+        with transaction.atomic():
+            # reserva a instância: só uma transição por versão
+            reservada = FluxoInstancia.objects.filter(id=instancia_id, versao=versao).update(versao=F('versao') + 1)
+            if not reservada:
+                raise ConflitoTransicao('O fluxo foi alterado por outro usuário. Recarregue a página.')
+
+            instancia = FluxoInstancia.objects.get(id=instancia_id)
+            etapas = list(instancia.etapas.order_by('ordem_etapa'))
+            etapa = next((e for e in etapas if e.id == etapa_id), None)
+            if etapa is None:
+                raise TransicaoInvalida('Etapa não pertence a este fluxo.')
+
+            etapa_movimentada = aplicar(instancia, etapas, etapa)
+
+            MovimentacaoFluxo.objects.create(
+                fluxo_instancia=instancia,
+                etapa=etapa_movimentada,
+                usuario=usuario,
+                acao_id=obter_acao_id(nome_acao),
+                comentario=comentario,
+                data_acao=timezone.now(),
+            )
+
+            pendentes = [e for e in etapas if not e.concluida]
+            instancia.definir_etapa_atual(pendentes[0] if pendentes else None)
+            instancia.etapas_concluidas = len(etapas) - len(pendentes)
+            instancia.total_etapas = len(etapas)
+            instancia.finalizado = not pendentes
+            instancia.save(update_fields=[
+                'etapa_atual', 'setor_atual', 'perfil_atual', 'etapas_concluidas', 'total_etapas',
+                'finalizado', 'atualizado_em',
+            ])
+    except OperationalError as e:
+        # SQLite recusa a escrita concorrente com "database is locked"
+        if 'locked' in str(e):
+            raise ConflitoTransicao('O fluxo está sendo alterado por outro usuário. Tente novamente.') from e
+        raise
+    except IntegrityError:
+        # id da ação vindo de um registro velho (ver SISTEMA/acoes.py); a transação
+        # foi desfeita, então a versão reservada continua valendo
+        if not repetir or not recarregar_se_desatualizado(nome_acao):
+            raise
+        return _executar(instancia_id, etapa_id, nome_acao, aplicar, usuario, comentario, versao, repetir=False)
+
+    return instancia
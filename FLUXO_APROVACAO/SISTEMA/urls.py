@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.urls import path
-from .views import login_view, home_view, logout_view, criar_usuario, listar_usuarios, editar_usuario, deletar_usuario, listar_setores, criar_setor, editar_setor, deletar_setor, listar_modelos_fluxo, criar_modelos_fluxo, excluir_modelos_fluxo, listar_instancias_fluxo, criar_instancia_fluxo, excluir_instancias_fluxo, mover_etapa, detalhar_instancia_fluxo, assinatura_view, checkout_ouro, checkout_prata, abacatepay_webhook
+from .views import login_view, home_view, logout_view, criar_usuario, listar_usuarios, editar_usuario, deletar_usuario, listar_setores, criar_setor, editar_setor, deletar_setor, listar_modelos_fluxo, criar_modelos_fluxo, editar_etapas_modelo, excluir_modelos_fluxo, listar_instancias_fluxo, criar_instancia_fluxo, excluir_instancias_fluxo, mover_etapa, detalhar_instancia_fluxo, exportar_movimentacoes, painel_analises, importar_fluxos, caixa_entrada, caixa_entrada_json, buscar_fluxos, buscar_fluxos_json, metricas, assinatura_view, checkout_ouro, checkout_prata, abacatepay_webhook, checkout_ouro_async, checkout_prata_async, abacatepay_webhook_async
 
 urlpatterns = [
     path('login/', login_view, name='login'),
@@ -15,16 +16,36 @@ urlpatterns = [
     path('setores/deletar/<int:id>/', deletar_setor, name='deletar_setor'),
     path('fluxos/modelos/', listar_modelos_fluxo, name='listar_modelos_fluxo'),
     path('fluxos/modelos/novo/', criar_modelos_fluxo, name='criar_modelos_fluxo'),
+    path('fluxos/modelos/<int:id>/etapas/', editar_etapas_modelo, name='editar_etapas_modelo'),
     path('fluxos/modelos/excluir/<int:id>/', excluir_modelos_fluxo, name='excluir_modelos_fluxo'),
     path('fluxos/instancias/', listar_instancias_fluxo, name='listar_instancias_fluxo'),
     path('fluxos/instancias/novo/', criar_instancia_fluxo, name='criar_instancia_fluxo'),
     path('fluxos/instancias/excluir/<int:id>/', excluir_instancias_fluxo, name='excluir_instancias_fluxo'),
     path('fluxos/instancias/<int:instancia_id>/mover/<int:etapa_id>/', mover_etapa, name='mover_etapa'),
+    path('fluxos/movimentacoes/exportar/', exportar_movimentacoes, name='exportar_movimentacoes'),
+    path('fluxos/analises/', painel_analises, name='painel_analises'),
+    path('api/importar/', importar_fluxos, name='importar_fluxos'),
     path('fluxos/instancias/<int:id>/', detalhar_instancia_fluxo, name='detalhar_instancia_fluxo'),
+    path('fluxos/caixa-entrada/', caixa_entrada, name='caixa_entrada'),
+    path('api/caixa-entrada/', caixa_entrada_json, name='caixa_entrada_json'),
+    path('fluxos/busca/', buscar_fluxos, name='buscar_fluxos'),
+    path('api/busca/', buscar_fluxos_json, name='buscar_fluxos_json'),
     path('assinatura/', assinatura_view, name='assinatura_view'),
-    path('checkout/prata/', checkout_prata, name='checkout_prata'),
-    path('checkout/ouro/', checkout_ouro, name='checkout_ouro'),
-    path("webhook/abacatepay/", abacatepay_webhook, name="abacatepay_webhook"),
+    path('metrics', metricas, name='metricas'),
+]
 
- 
-]
\ No newline at end of file
+# Endpoints de I/O externo: versões async quando servido por ASGI (ver asgi.py).
+# Em WSGI uma view async roda em um event loop novo a cada requisição, então lá
+# as versões síncronas (com o pool de conexões do cliente síncrono) rendem mais.
+if settings.VIEWS_ASSINCRONAS:
+    urlpatterns += [
+        path('checkout/prata/', checkout_prata_async, name='checkout_prata'),
+        path('checkout/ouro/', checkout_ouro_async, name='checkout_ouro'),
+        path("webhook/abacatepay/", abacatepay_webhook_async, name="abacatepay_webhook"),
+    ]
+else:
+    urlpatterns += [
+        path('checkout/prata/', checkout_prata, name='checkout_prata'),
+        path('checkout/ouro/', checkout_ouro, name='checkout_ouro'),
+        path("webhook/abacatepay/", abacatepay_webhook, name="abacatepay_webhook"),
+    ]
\ No newline at end of file
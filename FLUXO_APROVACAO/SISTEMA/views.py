@@ -4,13 +4,30 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from .forms import LoginForm, UsuarioCreateForm, UsuarioEditForm, SetorForm, FluxoPadraoForm, InstanciaFluxoForm
-from .models import Usuario, Setor, FluxoPadrao, EtapaFluxo, FluxoInstancia, EtapaInstancia, MovimentacaoFluxo, AcaoFluxo, Assinatura
+from django.core.paginator import Paginator
+from django.db.models import Count
+from .forms import (
+    LoginForm, UsuarioCreateForm, UsuarioEditForm, SetorForm, FluxoPadraoForm, InstanciaFluxoForm,
+    EtapaFluxoFormSet, dados_formset_etapas, FiltroExportacaoForm, FiltroAnaliseForm,
+)
+from .models import Usuario, Setor, FluxoPadrao, EtapaFluxo, FluxoInstancia, EtapaInstancia, MovimentacaoFluxo, AcaoFluxo, Assinatura, FluxoArquivado
+from .services import criar_instancia, pendencias_do_setor, criar_modelo_fluxo, salvar_etapas_modelo
+from .fila import enfileirar_evento, aenfileirar_evento
+from .cobranca import obter_cliente, obter_cliente_async, ErroCobranca, CircuitoAberto
+from .planos import assinatura_vigente, DURACAO_PLANO
+from .paginacao import paginar_por_cursor, TAMANHO_PAGINA
+from .transicoes import avancar, retornar, rejeitar, TransicaoInvalida, ConflitoTransicao
+from . import fragmentos
+from .exportacao import movimentacoes_para_exportar, FORMATOS
+from .importacao import importar_modelos, importar_instancias, formato_do_arquivo
+from . import analises, busca, instrumentacao
+from .arquivamento import ler_arquivado
 from django.conf import settings
 from abacatepay import AbacatePay, AbacatePayClient
 from abacatepay.products import Product
-import os, requests
-from django.http import HttpResponse
+import io
+import os
+from django.http import HttpResponse, StreamingHttpResponse
 import json
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -120,38 +137,124 @@ def deletar_setor(request, id):
         return redirect('listar_setores')
     return render(request, 'setor_excluir.html', {'setor': setor})
     
+# ?ordem= aceito na listagem de modelos -> order_by (id desempata)
+ORDENACOES_MODELOS = {
+    'nome': ('nome', 'id'),
+    '-nome': ('-nome', '-id'),
+    'etapas': ('num_etapas', 'id'),
+    '-etapas': ('-num_etapas', '-id'),
+    'criado_por': ('criado_por__username', 'id'),
+    '-criado_por': ('-criado_por__username', '-id'),
+    'criado_em': ('criado_em', 'id'),
+    '-criado_em': ('-criado_em', '-id'),
+}
+
+
 @login_required
 def listar_modelos_fluxo(request):
-    fluxos = FluxoPadrao.objects.all().order_by('-criado_em')
-    return render(request, 'modelos_fluxo_listar.html', {'fluxos': fluxos})
+    """
+    Lista os modelos com a contagem de etapas calculada no banco (uma consulta
+    para a página inteira), ordenação escolhida pelo usuário e paginação. As
+    linhas da página ficam em cache (fragmentos.MODELOS_FLUXO): com o
+    fragmento em cache, a consulta das linhas nem é feita.
+    """
+    ordem = request.GET.get('ordem', '-criado_em')
+    if ordem not in ORDENACOES_MODELOS:
+        ordem = '-criado_em'
+
+    fluxos = (
+        FluxoPadrao.objects.select_related('criado_por')
+        .annotate(num_etapas=Count('etapas'))
+        .order_by(*ORDENACOES_MODELOS[ordem])
+    )
+    pagina = Paginator(fluxos, TAMANHO_PAGINA).get_page(request.GET.get('pagina'))
+
+    return render(request, 'modelos_fluxo_listar.html', {
+        'fluxos': pagina.object_list,
+        'pagina': pagina,
+        'ordem': ordem,
+        'versao_modelos': fragmentos.versao(fragmentos.MODELOS_FLUXO),
+    })
+
+def _ler_modelo(request, prefixo='etapas'):
+    """
+    Dados do modelo e das etapas vindos de um formulário HTML (formset) ou de um
+    corpo JSON {"nome", "descricao", "etapas": [...]}. Retorna (dados, é_json).
+    """
+    if request.content_type != 'application/json':
+        return request.POST, False
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        payload = {}
+    dados = {
+        'nome': payload.get('nome') or '',
+        'descricao': payload.get('descricao') or '',
+        **dados_formset_etapas(payload.get('etapas'), prefixo),
+    }
+    return dados, True
+
+
+def _erros_formset(formset):
+    return {
+        'etapas': [form.errors for form in formset.forms],
+        'geral': formset.non_form_errors(),
+    }
+
 
 @login_required
 def criar_modelos_fluxo(request):
+    """Cria o modelo e todas as etapas de uma vez (formset ou JSON), em uma transação."""
     if request.method == 'POST':
-        form = FluxoPadraoForm(request.POST)
-        if form.is_valid():
+        dados, json_ = _ler_modelo(request)
+        form = FluxoPadraoForm(dados)
+        formset = EtapaFluxoFormSet(dados, prefix='etapas')
+        if form.is_valid() and formset.is_valid():
             fluxo = form.save(commit=False)
             fluxo.criado_por = request.user
-            fluxo.save()
-
-            # Cria as etapas dinamicamente conforme os campos enviados
-            etapas_total = int(request.POST.get('num_etapas', 0))
-            for i in range(1, etapas_total + 1):
-                nome = request.POST.get(f'etapa_nome_{i}')
-                setor_id = request.POST.get(f'etapa_setor_{i}')
-                if nome:
-                    EtapaFluxo.objects.create(
-                        fluxo=fluxo,
-                        ordem_etapa=i,
-                        nome=nome,
-                        setor_id=setor_id if setor_id else None,
-                        criado_em=timezone.now()
-                    )
+            criar_modelo_fluxo(fluxo, formset.etapas())
+            if json_:
+                return JsonResponse({'id': fluxo.id, 'etapas': len(formset.etapas())}, status=201)
             messages.success(request, 'Fluxo modelo criado com sucesso!')
             return redirect('listar_modelos_fluxo')
+        if json_:
+            return JsonResponse({'erros': {'modelo': form.errors, **_erros_formset(formset)}}, status=400)
     else:
         form = FluxoPadraoForm()
-    return render(request, 'modelos_fluxo_criar.html', {'form': form, 'setores': Setor.objects.all()})
+        formset = EtapaFluxoFormSet(prefix='etapas')
+    return render(request, 'modelos_fluxo_criar.html', {'form': form, 'formset': formset})
+
+
+@login_required
+def editar_etapas_modelo(request, id):
+    """
+    Edita, reordena, inclui e exclui etapas do modelo. A ordem final vem do campo
+    ORDER do formset (ou da posição na lista JSON) e é regravada em lote.
+    """
+    fluxo = get_object_or_404(FluxoPadrao, id=id)
+    etapas = list(fluxo.etapas.values('id', 'nome', 'setor', 'perfil_aprovador', 'ordem_etapa'))
+    existentes = [e['id'] for e in etapas]
+
+    if request.method == 'POST':
+        dados, json_ = _ler_modelo(request)
+        formset = EtapaFluxoFormSet(dados, prefix='etapas', etapas_existentes=existentes)
+        if formset.is_valid():
+            salvar_etapas_modelo(fluxo, formset.etapas())
+            if json_:
+                return JsonResponse({'id': fluxo.id, 'etapas': len(formset.etapas())})
+            messages.success(request, 'Etapas atualizadas com sucesso!')
+            return redirect('listar_modelos_fluxo')
+        if json_:
+            return JsonResponse({'erros': _erros_formset(formset)}, status=400)
+    else:
+        formset = EtapaFluxoFormSet(
+            prefix='etapas',
+            etapas_existentes=existentes,
+            initial=[{**e, 'ORDER': e['ordem_etapa']} for e in etapas],
+        )
+    return render(request, 'modelos_fluxo_etapas.html', {'fluxo': fluxo, 'formset': formset})
 
 @login_required
 def excluir_modelos_fluxo(request, id):
@@ -170,23 +273,8 @@ def criar_instancia_fluxo(request):
             fluxo_padrao = form.cleaned_data['fluxo_padrao']
             nome_instancia = form.cleaned_data['nome_instancia']
 
-            # Cria a nova instância
-            fluxo_instancia = FluxoInstancia.objects.create(
-                modelo=fluxo_padrao,
-                nome=nome_instancia,
-                criado_por=request.user
-            )
-
-            # Clona as etapas do modelo
-            for i, etapa in enumerate(fluxo_padrao.etapas.all(), start=1):
-                EtapaInstancia.objects.create(
-                    fluxo_instancia=fluxo_instancia,
-                    ordem_etapa=i,
-                    nome=etapa.nome,
-                    setor=etapa.setor,
-                    perfil_aprovador=etapa.perfil_aprovador,
-                    criado_em=timezone.now()
-                )
+            # Cria a instância e clona as etapas do modelo em uma única transação
+            criar_instancia(fluxo_padrao, nome_instancia, request.user)
 
             messages.success(request, f'Instância "{nome_instancia}" criada com sucesso!')
             return redirect('listar_instancias_fluxo')
@@ -197,13 +285,26 @@ def criar_instancia_fluxo(request):
 
 @login_required
 def listar_instancias_fluxo(request):
-    """Lista fluxos em andamento e finalizados."""
-    em_andamento = FluxoInstancia.objects.filter(finalizado=False).order_by('-criado_em')
-    finalizados = FluxoInstancia.objects.filter(finalizado=True).order_by('-criado_em')
+    """Lista fluxos em andamento e finalizados, paginados por cursor em cada aba."""
+    instancias = FluxoInstancia.objects.select_related('modelo', 'criado_por')
+
+    cursor_andamento = request.GET.get('cursor_andamento')
+    cursor_finalizados = request.GET.get('cursor_finalizados')
+    em_andamento, proximo_andamento = paginar_por_cursor(
+        instancias.filter(finalizado=False), cursor_andamento
+    )
+    finalizados, proximo_finalizados = paginar_por_cursor(
+        instancias.filter(finalizado=True), cursor_finalizados
+    )
 
     return render(request, 'instancia_fluxo_listar.html', {
         'em_andamento': em_andamento,
         'finalizados': finalizados,
+        'cursor_andamento': cursor_andamento or '',
+        'cursor_finalizados': cursor_finalizados or '',
+        'proximo_andamento': proximo_andamento,
+        'proximo_finalizados': proximo_finalizados,
+        'aba': request.GET.get('aba', 'andamento'),
     })
 
 
@@ -227,139 +328,270 @@ def detalhar_instancia_fluxo(request, id):
     """
     Mostra detalhes de uma instância de fluxo, timeline (etapas) e histórico.
     """
-    instancia = get_object_or_404(FluxoInstancia, id=id)
-    # carregar etapas da instância em ordem
-    etapas = instancia.etapas.order_by('ordem_etapa')
-
-    # garantir que se todas as etapas estiverem concluídas o fluxo seja marcado finalizado
-    if etapas.exists() and all(e.concluida for e in etapas):
-        if not instancia.finalizado:
-            instancia.finalizado = True
-            instancia.save()
-
-    # encontrar etapa atual: primeira etapa não concluída
-    etapa_atual = None
-    for e in etapas:
-        if not e.concluida:
-            etapa_atual = e
-            break
-
-    # carregar histórico
-    movimentacoes = instancia.movimentacoes.order_by('-data_acao')
+    instancia = FluxoInstancia.objects.select_related('modelo').filter(id=id).first()
+    if instancia is None:
+        # finalizado há muito tempo: lido do arquivo, só para consulta
+        instancia, etapas, movimentacoes = ler_arquivado(get_object_or_404(FluxoArquivado, id=id))
+        return render(request, 'instancia_fluxo_detalhar.html', {
+            'instancia': instancia,
+            'etapas': etapas,
+            'etapa_atual': None,
+            'movimentacoes': movimentacoes,
+            'arquivado': True,
+        })
+
+    # carregar etapas da instância em ordem (uma única consulta, já com o setor)
+    etapas = list(instancia.etapas.select_related('setor').order_by('ordem_etapa'))
+
+    # etapa atual vem do ponteiro mantido pelas movimentações
+    etapa_atual = next((e for e in etapas if e.id == instancia.etapa_atual_id), None)
+
+    # carregar histórico em páginas, com ação, etapa e usuário na mesma consulta
+    cursor = request.GET.get('cursor')
+    movimentacoes, proximo_cursor = paginar_por_cursor(
+        instancia.movimentacoes.select_related('acao', 'etapa', 'usuario'),
+        cursor,
+        campo_data='data_acao',
+    )
 
     return render(request, 'instancia_fluxo_detalhar.html', {
         'instancia': instancia,
         'etapas': etapas,
         'etapa_atual': etapa_atual,
         'movimentacoes': movimentacoes,
+        'proximo_cursor': proximo_cursor,
     })
 
 
+def _caixa_entrada(request):
+    """Página de pendências do setor/perfil do usuário logado."""
+    if request.user.setor_id is None:
+        return [], None
+    return paginar_por_cursor(
+        pendencias_do_setor(request.user.setor_id, request.user.perfil),
+        request.GET.get('cursor'),
+    )
+
+
+@login_required
+def caixa_entrada(request):
+    """Etapas aguardando o setor e o perfil do usuário."""
+    pendencias, proximo_cursor = _caixa_entrada(request)
+    return render(request, 'caixa_entrada.html', {
+        'pendencias': pendencias,
+        'proximo_cursor': proximo_cursor,
+    })
+
+
+@login_required
+def caixa_entrada_json(request):
+    """Mesma consulta da caixa de entrada, em JSON, paginada por cursor."""
+    pendencias, proximo_cursor = _caixa_entrada(request)
+    return JsonResponse({
+        'itens': [
+            {
+                'instancia_id': instancia.id,
+                'instancia': instancia.nome,
+                'modelo': instancia.modelo.nome,
+                'etapa_id': instancia.etapa_atual_id,
+                'etapa': instancia.etapa_atual.nome,
+                'ordem_etapa': instancia.etapa_atual.ordem_etapa,
+                'progresso': f'{instancia.etapas_concluidas}/{instancia.total_etapas}',
+                'criado_em': instancia.criado_em.isoformat(),
+            }
+            for instancia in pendencias
+        ],
+        'proximo_cursor': proximo_cursor,
+    })
+
+
+def _busca(request):
+    """Resultados da busca textual para os parâmetros q, tipo e cursor."""
+    texto = request.GET.get('q', '').strip()
+    tipo = request.GET.get('tipo')
+    if tipo not in busca.TIPOS:
+        tipo = 'instancias'
+    cursor = request.GET.get('cursor')
+    resultados, proximo_cursor = busca.buscar(texto, tipo, cursor)
+    return texto, tipo, cursor, resultados, proximo_cursor
+
+
+@login_required
+def buscar_fluxos(request):
+    """Busca por nome da instância, modelo, etapa atual ou comentário."""
+    texto, tipo, cursor, resultados, proximo_cursor = _busca(request)
+    return render(request, 'busca.html', {
+        'q': texto,
+        'tipo': tipo,
+        'cursor': cursor or '',
+        'resultados': resultados,
+        'proximo_cursor': proximo_cursor,
+    })
+
+
+@login_required
+def buscar_fluxos_json(request):
+    """Mesma busca, em JSON, paginada por cursor."""
+    texto, tipo, cursor, resultados, proximo_cursor = _busca(request)
+    if tipo == 'instancias':
+        itens = [
+            {
+                'instancia_id': instancia.id,
+                'instancia': instancia.nome,
+                'modelo': instancia.modelo.nome,
+                'etapa': instancia.etapa_atual.nome if instancia.etapa_atual else None,
+                'finalizado': instancia.finalizado,
+            }
+            for instancia in resultados
+        ]
+    else:
+        itens = [
+            {
+                'movimentacao_id': movimentacao.id,
+                'instancia_id': movimentacao.fluxo_instancia_id,
+                'instancia': movimentacao.fluxo_instancia.nome if movimentacao.fluxo_instancia else None,
+                'etapa': movimentacao.etapa.nome if movimentacao.etapa else None,
+                'usuario': movimentacao.usuario.username if movimentacao.usuario else None,
+                'data_acao': movimentacao.data_acao.isoformat(),
+                'trecho': movimentacao.trecho,
+            }
+            for movimentacao in resultados
+        ]
+    return JsonResponse({
+        'itens': itens,
+        'proximo_cursor': proximo_cursor,
+    })
+
+
+## Métricas
+def metricas(request):
+    """Contadores do processo no formato do Prometheus (SISTEMA/instrumentacao.py)."""
+    if not instrumentacao.acesso_permitido(request):
+        return HttpResponse(status=403)
+    return HttpResponse(instrumentacao.registro.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @login_required
 def mover_etapa(request, instancia_id, etapa_id):
     """
-    Recebe POST com acao in ('avancar','retornar') e comentario.
-    Realiza a movimentação, atualiza EtapaInstancia e FluxoInstancia e registra MovimentacaoFluxo.
+    Recebe POST com acao in ('avancar','retornar','rejeitar'), comentario e a versão exibida.
+    A movimentação é feita pelo motor de transições (SISTEMA/transicoes.py), de forma atômica.
     """
     if request.method != 'POST':
         return redirect('detalhar_instancia_fluxo', id=instancia_id)
 
     instancia = get_object_or_404(FluxoInstancia, id=instancia_id)
-    etapa = get_object_or_404(EtapaInstancia, id=etapa_id, fluxo_instancia=instancia)
+    get_object_or_404(EtapaInstancia, id=etapa_id, fluxo_instancia=instancia)
 
     acao_nome = request.POST.get('acao')
     comentario = request.POST.get('comentario', '').strip()
+    versao = request.POST.get('versao')
+    versao = int(versao) if versao and versao.isdigit() else None
 
-    # garantir objetos de ação (nome em pt: Avançar / Retornar)
-    acao_avancar, _ = AcaoFluxo.objects.get_or_create(nome='Avançar')
-    acao_retornar, _ = AcaoFluxo.objects.get_or_create(nome='Retornar')
-
-    if acao_nome == 'avancar':
-        # se já foi concluída, não faz nada
-        if etapa.concluida:
-            messages.warning(request, 'Esta etapa já está concluída.')
-            return redirect('detalhar_instancia_fluxo', id=instancia.id)
-
-        # marcar etapa atual como concluída
-        etapa.concluida = True
-        etapa.save()
-
-        # criar movimentação
-        MovimentacaoFluxo.objects.create(
-            fluxo_instancia=instancia,
-            etapa=etapa,
-            usuario=request.user,
-            acao=acao_avancar,
-            comentario=comentario,
-            data_acao=timezone.now()
-        )
-
-        # ver se existe próxima etapa
-        proximas = instancia.etapas.filter(ordem_etapa__gt=etapa.ordem_etapa).order_by('ordem_etapa')
-        if not proximas.exists():
-            # se não há próxima etapa, finalizar o fluxo
-            instancia.finalizado = True
-            instancia.save()
-            messages.success(request, f'Instância "{instancia.nome}" finalizada.')
-        else:
-            # próxima etapa ficará como pendente (já está criada como pendente por padrão)
-            prox = proximas.first()
-            messages.success(request, f'Instância avançada para etapa "{prox.nome}".')
+    transicoes = {
+        'avancar': avancar,
+        'retornar': retornar,
+        'rejeitar': rejeitar,
+    }
+    if acao_nome not in transicoes:
+        messages.error(request, 'Ação inválida.')
+        return redirect('detalhar_instancia_fluxo', id=instancia.id)
 
+    try:
+        instancia = transicoes[acao_nome](instancia.id, etapa_id, request.user, comentario, versao)
+    except TransicaoInvalida as e:
+        messages.warning(request, str(e))
+        return redirect('detalhar_instancia_fluxo', id=instancia.id)
+    except ConflitoTransicao as e:
+        messages.error(request, str(e))
         return redirect('detalhar_instancia_fluxo', id=instancia.id)
 
+    if instancia.finalizado:
+        messages.success(request, f'Instância "{instancia.nome}" finalizada.')
+    elif acao_nome == 'avancar':
+        messages.success(request, f'Instância avançada para etapa "{instancia.etapa_atual.nome}".')
     elif acao_nome == 'retornar':
-        # não é possível retornar da primeira etapa
-        if etapa.ordem_etapa == 1:
-            messages.warning(request, 'Não é possível retornar: esta é a primeira etapa.')
-            return redirect('detalhar_instancia_fluxo', id=instancia.id)
-
-        # encontra etapa anterior
-        anterior = instancia.etapas.filter(ordem_etapa=etapa.ordem_etapa - 1).first()
-        if not anterior:
-            messages.error(request, 'Etapa anterior não encontrada.')
-            return redirect('detalhar_instancia_fluxo', id=instancia.id)
-
-        # marcar etapa atual como não concluída (reabre) e também reabrir anterior
-        etapa.concluida = False
-        etapa.save()
-
-        anterior.concluida = False
-        anterior.save()
-
-        # se estava finalizado, desfaz finalizado
-        if instancia.finalizado:
-            instancia.finalizado = False
-            instancia.save()
-
-        # registrar movimentação
-        MovimentacaoFluxo.objects.create(
-            fluxo_instancia=instancia,
-            etapa=anterior,
-            usuario=request.user,
-            acao=acao_retornar,
-            comentario=comentario,
-            data_acao=timezone.now()
-        )
+        messages.success(request, f'Instância retornada para etapa "{instancia.etapa_atual.nome}".')
+    else:
+        messages.success(request, f'Etapa rejeitada. Instância retornada para etapa "{instancia.etapa_atual.nome}".')
+    return redirect('detalhar_instancia_fluxo', id=instancia.id)
 
-        messages.success(request, f'Instância retornada para etapa "{anterior.nome}".')
-        return redirect('detalhar_instancia_fluxo', id=instancia.id)
+@login_required
+def exportar_movimentacoes(request):
+    """
+    Histórico de movimentações em CSV ou JSON Lines, filtrado por período,
+    modelo e setor. A resposta é gerada enquanto é enviada (memória constante).
+    """
+    filtro = FiltroExportacaoForm(request.GET)
+    if not filtro.is_valid():
+        return JsonResponse({'erros': filtro.errors}, status=400)
+
+    formato = filtro.cleaned_data['formato']
+    gerar_linhas, content_type = FORMATOS[formato]
+    resposta = StreamingHttpResponse(
+        gerar_linhas(movimentacoes_para_exportar(**filtro.filtros())), content_type=content_type
+    )
+    resposta['Content-Disposition'] = f'attachment; filename="movimentacoes.{formato}"'
+    return resposta
 
+@login_required
+def painel_analises(request):
+    """
+    Tempo de permanência por etapa, tempo de ciclo por modelo e pendências por
+    setor. Os agregados são calculados no banco e guardados em cache por dia.
+    """
+    filtro = FiltroAnaliseForm(request.GET)
+    if filtro.is_valid():
+        inicio, fim = filtro.cleaned_data['inicio'], filtro.cleaned_data['fim']
     else:
-        messages.error(request, 'Ação inválida.')
-        return redirect('detalhar_instancia_fluxo', id=instancia.id)
+        fim = timezone.localdate()
+        inicio = fim - timedelta(days=29)
+    return render(request, 'analises.html', {
+        'filtro': filtro,
+        'inicio': inicio,
+        'fim': fim,
+        'permanencia': analises.permanencia_por_etapa(inicio, fim),
+        'ciclo': analises.tempo_de_ciclo(inicio, fim),
+        'pendencias': analises.pendencias_por_setor(),
+    })
 
-ABACATE_URL = "https://api.abacatepay.com/v1/billing/create"
-API_KEY = os.getenv("ABACATEPAY_API_KEY") or getattr(settings, "ABACATEPAY_API_KEY", None)
+@login_required
+def importar_fluxos(request):
+    """
+    API de importação em massa: POST multipart com `arquivo` (CSV, JSON Lines
+    ou JSON), `tipo` ('modelos' ou 'instancias') e, opcionalmente, `formato`.
+    Responde com o relatório (lidas, importadas, rejeitadas, registros/s).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'use POST'}, status=405)
+
+    arquivo = request.FILES.get('arquivo')
+    tipo = request.POST.get('tipo')
+    if arquivo is None or tipo not in ('modelos', 'instancias'):
+        return JsonResponse({'error': "envie 'arquivo' e 'tipo' (modelos ou instancias)"}, status=400)
+    formato = request.POST.get('formato') or formato_do_arquivo(arquivo.name)
+    if formato not in ('csv', 'json', 'jsonl'):
+        return JsonResponse({'error': 'formato não reconhecido'}, status=400)
+
+    importar = importar_modelos if tipo == 'modelos' else importar_instancias
+    # uploads grandes ficam em arquivo temporário; lê como texto, linha a linha.
+    # utf-8-sig descarta o BOM que o Excel grava (senão a 1ª coluna vira '\ufeffmodelo_id')
+    texto = io.TextIOWrapper(arquivo.file, encoding='utf-8-sig', newline='')
+    try:
+        relatorio = importar(texto, formato, request.user)
+    except UnicodeDecodeError as erro:
+        # a decodificação é feita aos poucos: os lotes anteriores ao erro já foram gravados
+        return JsonResponse({'error': f'o arquivo precisa estar em UTF-8 ({erro.reason} no byte {erro.start})'}, status=400)
+    return JsonResponse(relatorio.resumo())
 
 @login_required
 def assinatura_view(request):
-    assinatura = request.user.assinaturas.filter(status="ativo").order_by('-data_inicio').first()
+    assinatura = assinatura_vigente(request.user.id)
 
     dias_restantes = None
     if assinatura:
-        # Cada plano dura 30 dias
-        expiracao = assinatura.data_inicio + timedelta(days=30)
+        # assinaturas antigas não têm data_fim: cada plano dura 30 dias
+        expiracao = assinatura["data_fim"] or assinatura["data_inicio"] + DURACAO_PLANO
         hoje = timezone.localdate()
         dias_restantes = max((expiracao - hoje).days, 0)
 
@@ -368,149 +600,125 @@ def assinatura_view(request):
         "dias_restantes": dias_restantes
     })
 
-@login_required
-def checkout_prata(request):
-    url = ABACATE_URL
-    payload = {
+# externalId -> produto vendido (o webhook usa o mesmo externalId para achar o plano)
+PRODUTOS_CHECKOUT = {
+    "prata": {
+        "externalId": "1",  # prata = 1
+        "name": "Assinatura Prata",
+        "description": "Plano Prata - 30 dias",
+        "quantity": 1,
+        "price": 8990  # centavos = R$89,90
+    },
+    "ouro": {
+        "externalId": "2",  # ouro = 2
+        "name": "Assinatura Ouro",
+        "description": "Plano Ouro - 30 dias",
+        "quantity": 1,
+        "price": 11990  # centavos = R$119,90
+    },
+}
+
+
+def _payload_checkout(usuario, plano):
+    return {
         "frequency": "MULTIPLE_PAYMENTS",
         "methods": ["PIX"],
-        "products": [
-            {
-                "externalId": "1",  # prata = 1
-                "name": "Assinatura Prata",
-                "description": "Plano Prata - 30 dias",
-                "quantity": 1,
-                "price": 8990  # centavos = R$89,90
-            }
-        ],
+        "products": [PRODUTOS_CHECKOUT[plano]],
         "returnUrl": "http://127.0.0.1:8000/assinatura/",
         "completionUrl": "http://127.0.0.1:8000/assinatura/",
         "customer": {
-            "name": request.user.get_full_name() or request.user.username,
+            "name": usuario.get_full_name() or usuario.username,
             "cellphone": "11999999999",
             "email": "cliente@teste.com",
             "taxId": "39053344705"
         },
         "allowCoupons": False,
-        "metadata": {"usuario_id": str(request.user.id)}
-    }
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
+        "metadata": {"usuario_id": str(usuario.id)}
     }
+
+
+def _checkout(request, plano):
+    """Cria a cobrança pelo cliente compartilhado e redireciona para o checkout."""
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        data = response.json()
-        if data.get("data") and "url" in data["data"]:
-            return redirect(data["data"]["url"])
-        else:
-            return HttpResponse(f"Erro ao criar checkout: {data}", status=response.status_code)
-    except Exception as e:
-        return HttpResponse(f"Erro inesperado: {e}", status=500)
+        cobranca = obter_cliente().criar_cobranca(_payload_checkout(request.user, plano))
+    except CircuitoAberto as e:
+        return HttpResponse(str(e), status=503)
+    except ErroCobranca as e:
+        return HttpResponse(str(e), status=502)
+    return redirect(cobranca["url"])
+
+
+async def _acheckout(request, plano):
+    """Mesmo que _checkout, sem bloquear o worker ASGI enquanto o AbacatePay responde."""
+    usuario = await request.auser()
+    try:
+        cobranca = await obter_cliente_async().criar_cobranca(_payload_checkout(usuario, plano))
+    except CircuitoAberto as e:
+        return HttpResponse(str(e), status=503)
+    except ErroCobranca as e:
+        return HttpResponse(str(e), status=502)
+    return redirect(cobranca["url"])
+
+
+@login_required
+def checkout_prata(request):
+    return _checkout(request, "prata")
+
 
 @login_required
 def checkout_ouro(request):
-    url = ABACATE_URL
-    payload = {
-        "frequency": "MULTIPLE_PAYMENTS",
-        "methods": ["PIX"],
-        "products": [
-            {
-                "externalId": "2",  # ouro = 2
-                "name": "Assinatura Ouro",
-                "description": "Plano Ouro - 30 dias",
-                "quantity": 1,
-                "price": 11990  # centavos = R$119,90
-            }
-        ],
-        "returnUrl": "http://127.0.0.1:8000/assinatura/",
-        "completionUrl": "http://127.0.0.1:8000/assinatura/",
-        "customer": {
-            "name": request.user.get_full_name() or request.user.username,
-            "cellphone": "11999999999",
-            "email": "cliente@teste.com",
-            "taxId": "39053344705"
-        },
-        "allowCoupons": False,
-        "metadata": {"usuario_id": str(request.user.id)}
-    }
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
-    try:
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        data = response.json()
-        if data.get("data") and "url" in data["data"]:
-            return redirect(data["data"]["url"])
-        else:
-            return HttpResponse(f"Erro ao criar checkout: {data}", status=response.status_code)
-    except Exception as e:
-        return HttpResponse(f"Erro inesperado: {e}", status=500)
+    return _checkout(request, "ouro")
+
+
+@login_required
+async def checkout_prata_async(request):
+    return await _acheckout(request, "prata")
+
+
+@login_required
+async def checkout_ouro_async(request):
+    return await _acheckout(request, "ouro")
 
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or getattr(settings, "WEBHOOK_SECRET", None)
 
-@csrf_exempt
-def abacatepay_webhook(request):
+def _ler_evento(request):
+    """Valida secret e JSON. Retorna (payload, None) ou (None, resposta de erro)."""
     # Valida o secret
     secret = request.GET.get("secret") or request.GET.get("webhookSecret")
     if secret != WEBHOOK_SECRET:
-        return JsonResponse({"error": "invalid secret"}, status=401)
+        return None, JsonResponse({"error": "invalid secret"}, status=401)
 
     # Lê o JSON enviado pelo AbacatePay
     try:
         payload = json.loads(request.body)
-
-        print("\n===== WEBHOOK RECEBIDO =====")
-        print(json.dumps(payload, indent=4))
-        print("============================\n")
-
     except Exception:
-        return JsonResponse({"error": "invalid json"}, status=400)
+        return None, JsonResponse({"error": "invalid json"}, status=400)
+    if not isinstance(payload, dict):
+        return None, JsonResponse({"error": "invalid json"}, status=400)
+    return payload, None
 
-    # Só processa pagamento confirmado
-    if payload.get("event") != "billing.paid":
-        return JsonResponse({"status": "ignored", "reason": "not billing.paid"}, status=200)
 
-    billing = payload["data"]["billing"]
-    products = billing.get("products", [])
-    metadata = billing.get("metadata", {})
+@csrf_exempt
+def abacatepay_webhook(request):
+    """
+    Guarda o evento e responde na hora. O processamento (assinatura e pagamento)
+    fica com o worker: python manage.py processar_webhooks
+    """
+    payload, erro = _ler_evento(request)
+    if erro:
+        return erro
 
-    # Pega usuário_id do metadata (o mais importante!)
-    usuario_id = metadata.get("usuario_id")
-    if not usuario_id:
-        print("⚠️ metadata.usuario_id não veio no payload!")
-        return JsonResponse({"status": "ignored", "reason": "no usuario_id"}, status=200)
+    # Reenvios do mesmo evento são reconhecidos pelo event_id e não entram de novo na fila
+    evento, criado = enfileirar_evento(payload, request.body)
+    return JsonResponse({"status": "queued" if criado else "duplicate"}, status=200)
 
-    # Acha o usuário
-    try:
-        usuario = Usuario.objects.get(id=usuario_id)
-    except Usuario.DoesNotExist:
-        return JsonResponse({"status": "ignored", "reason": "usuario_not_found"}, status=200)
-
-    # Pega externalId para saber qual plano foi comprado
-    external_id = None
-    if products:
-        external_id = products[0].get("externalId")
-
-    # Mapea externalId → plano
-    plano = None
-    if str(external_id) == "1":
-        plano = "prata"
-    elif str(external_id) == "2":
-        plano = "ouro"
-    else:
-        plano = "freemium"  # fallback
-
-    # Cria ou atualiza assinatura
-    assinatura, created = Assinatura.objects.update_or_create(
-        usuario=usuario,
-        defaults={
-            "plano": plano,
-            "status": "ativo",
-            "data_inicio": timezone.localdate(),
-            "data_fim": None  # ignorando expiração
-        }
-    )
 
-    return JsonResponse({"status": "saved", "plano": plano}, status=200)
\ No newline at end of file
+@csrf_exempt
+async def abacatepay_webhook_async(request):
+    """Versão ASGI do webhook, com o ORM assíncrono."""
+    payload, erro = _ler_evento(request)
+    if erro:
+        return erro
+
+    evento, criado = await aenfileirar_evento(payload, request.body)
+    return JsonResponse({"status": "queued" if criado else "duplicate"}, status=200)